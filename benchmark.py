@@ -0,0 +1,492 @@
+#! /usr/bin/env python3
+# benchmark.py
+
+"""
+Measures runtime and peak memory of the depth and genotype processing steps
+on synthetic cohorts, and writes the results to a JSON file for comparison
+between versions.
+
+Synthetic samtools depth files cover chr9:133255176-133385146 with Poisson
+distributed depths around a per sample mean, a slow wave along the window
+and a copy number gain or loss of an ABO gene segment in some samples.
+Synthetic bcftools query tables hold unphased genotypes (%TGT) of SNPs and
+indels in the window, both as written by bcftools query -H -f
+'%POS[\\t%TGT]\\n' (one line per variant) and transposed to one line per
+sample as read by reverse_complement.py.
+
+A pool of distinct depth files is generated once and linked under a name per
+sample, so cohorts of 10,000 samples read 10,000 files without generating
+10,000 different ones. Each benchmark runs in fresh processes that import
+only the module they measure. Peak memory is measured in one more run with
+tracemalloc, started after that import, so it counts the memory allocated
+by the measured step alone and does not slow the timed runs; resident
+memory cannot be used, as Linux carries the peak of the parent process over
+to its children. The scripts
+take sample names from the text before the first underscore of a depth file
+path, so the path of the data directory must not contain underscores.
+
+benchmarks:
+  parse_depth         load_depth_array of each depth file
+  interval_binning    coverage_per_interval_ABO.process_files_from_list
+  copy_number         copy_number_per_interval.process_files_from_list and
+                      create_copy_number_dict
+  region_copy_number  copy_number_per_region.extract_region_depths_from_files
+  reverse_complement  reverse_complement.py on the per sample query table
+  transpose_table     transpose_table.py on the per variant query table
+
+usage: benchmark.py [-h] [-d DATA_DIR] [-n SIZES] [-b BENCHMARKS] [-p POOL]
+                    [-v VARIANTS] [-o OUTFILE] [-l LABEL] [-c COMPARE]
+                    [-r REPEATS]
+
+Benchmark depth and genotype processing on synthetic cohorts
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -d DATA_DIR, --data-dir DATA_DIR
+                        directory for synthetic input files, reused between
+                        runs, without underscores in its path (default:
+                        /tmp/abo-benchmark)
+  -n SIZES, --sizes SIZES
+                        comma separated cohort sizes
+  -b BENCHMARKS, --benchmarks BENCHMARKS
+                        comma separated benchmarks to run (default: all)
+  -p POOL, --pool POOL  number of distinct synthetic depth files
+  -v VARIANTS, --variants VARIANTS
+                        number of variants in synthetic query tables
+  -o OUTFILE, --outfile OUTFILE
+                        JSON file of benchmark results
+  -l LABEL, --label LABEL
+                        label of this version in the results (default: git
+                        commit)
+  -c COMPARE, --compare COMPARE
+                        JSON results of another version to compare with
+  -r REPEATS, --repeats REPEATS
+                        number of runs per benchmark, the fastest is kept
+
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+CHROM = 'chr9'
+WINDOW_START = 133255176
+WINDOW_END = 133385146
+# ABO gene, the segment of copy number changes in synthetic samples
+GENE_START = 133255176
+GENE_END = 133275215
+BENCHMARK_NAMES = ('parse_depth', 'interval_binning', 'copy_number',
+                   'region_copy_number', 'reverse_complement',
+                   'transpose_table')
+# module measured by each benchmark, imported in its benchmark process only
+BENCHMARK_MODULES = {'parse_depth': 'depth_io',
+                     'interval_binning': 'coverage_per_interval_ABO',
+                     'copy_number': 'copy_number_per_interval',
+                     'region_copy_number': 'copy_number_per_region',
+                     'reverse_complement': 'reverse_complement',
+                     'transpose_table': 'transpose_table'}
+
+
+def main():
+    args = get_cli_args()
+    if args.run:
+        # measure one benchmark in this process and report to the parent
+        name, n_samples, *memory = args.run.split(':')
+        result = run_benchmark(name, args.data_dir, int(n_samples),
+                               bool(memory))
+        print(json.dumps(result))
+        return
+    if '_' in os.path.abspath(args.data_dir):
+        raise ValueError(f'data directory path contains an underscore, '
+                         f'sample names would not be unique: '
+                         f'{os.path.abspath(args.data_dir)}')
+    sizes = [int(size) for size in args.sizes.split(',')]
+    names = args.benchmarks.split(',') if args.benchmarks else \
+        list(BENCHMARK_NAMES)
+    unknown = set(names) - set(BENCHMARK_NAMES)
+    if unknown:
+        raise ValueError(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+    # create synthetic inputs for the largest cohort, smaller cohorts use
+    # the first samples
+    generate_data(args.data_dir, max(sizes), args.pool, args.variants)
+    results = list()
+    for n_samples in sizes:
+        for name in names:
+            result = measure_benchmark(name, args.data_dir, n_samples,
+                                       args.repeats)
+            results.append(result)
+            print(f'{name}\t{n_samples}\t{result["seconds"]:.3f} s\t'
+                  f'{result["peak_memory_mb"]:.1f} MB', flush=True)
+    report = {'label': args.label or git_commit(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'pool': args.pool,
+              'variants': args.variants,
+              'results': results}
+    with open(args.outfile, 'w') as fh:
+        json.dump(report, fh, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as fh:
+            print_comparison(json.load(fh), report)
+
+
+def generate_data(data_dir, n_samples, pool, n_variants, seed=0):
+    """
+    Writes synthetic depth files, per sample links to them, a depth file
+    list and bcftools query tables, unless files for the same parameters
+    already exist
+    :param data_dir: str, directory for synthetic input files
+    :param n_samples: int, number of samples in cohort
+    :param pool: int, number of distinct depth files
+    :param n_variants: int, number of variants in query tables
+    :param seed: int, seed of random number generator
+    :return: None
+    """
+    params = {'n_samples': n_samples, 'pool': pool, 'variants': n_variants,
+              'seed': seed}
+    params_path = os.path.join(data_dir, 'params.json')
+    if os.path.exists(params_path):
+        with open(params_path, 'r') as fh:
+            if json.load(fh) == params:
+                return
+    rng = numpy.random.default_rng(seed)
+    pool_dir = os.path.join(data_dir, 'pool')
+    depth_dir = os.path.join(data_dir, 'depth')
+    os.makedirs(pool_dir, exist_ok=True)
+    os.makedirs(depth_dir, exist_ok=True)
+    pool_paths = list()
+    for i in range(pool):
+        pool_path = os.path.join(pool_dir, f'pool{i}.txt')
+        write_depth_file(pool_path, synthetic_depths(rng))
+        pool_paths.append(pool_path)
+    # link one depth file per sample, named like samtools depth outputs
+    sample_list = [f'HG{i:05d}' for i in range(n_samples)]
+    with open(os.path.join(data_dir, 'depth_files.txt'), 'w') as fh:
+        for i, sample in enumerate(sample_list):
+            depth_path = os.path.join(depth_dir, f'{sample}_ABO_depth.txt')
+            if os.path.lexists(depth_path):
+                os.remove(depth_path)
+            os.symlink(pool_paths[i % pool], depth_path)
+            fh.write(f'{depth_path}\n')
+    # remove query tables of cohort subsets made from earlier data
+    for file in os.listdir(data_dir):
+        if file.endswith(('_query.txt', '_query_samples.txt')):
+            os.remove(os.path.join(data_dir, file))
+    positions, genotypes = synthetic_genotypes(rng, n_samples, n_variants)
+    write_query_tables(data_dir, sample_list, positions, genotypes)
+    with open(params_path, 'w') as fh:
+        json.dump(params, fh)
+
+
+def synthetic_depths(rng):
+    """
+    Draws the depth of each position of the window for one sample
+    :param rng: numpy random Generator
+    :return: numpy array of depth values
+    """
+    positions = numpy.arange(WINDOW_START, WINDOW_END + 1)
+    # coverage varies slowly along the window around a per sample mean
+    expected = rng.uniform(20, 40) * (
+        1 + 0.3 * numpy.sin((positions - WINDOW_START) / 5000 +
+                            rng.uniform(0, 2 * numpy.pi)))
+    # some samples carry a copy number loss or gain of a gene segment
+    copy_number = rng.choice([1, 2, 2, 2, 3])
+    if copy_number != 2:
+        first = rng.integers(GENE_START, GENE_END - 2000)
+        last = first + rng.integers(1000, 2000)
+        expected[(positions >= first) & (positions < last)] *= \
+            copy_number / 2
+    return rng.poisson(expected)
+
+
+def write_depth_file(file_path, depths):
+    """
+    Writes depths in the samtools depth -a layout of chromosome, position
+    and depth columns
+    :param file_path: str, path to depth file
+    :param depths: numpy array of depth values of each window position
+    :return: None
+    """
+    positions = range(WINDOW_START, WINDOW_START + len(depths))
+    with open(file_path, 'w') as fh:
+        fh.write(''.join([f'{CHROM}\t{position}\t{depth}\n' for
+                          position, depth in zip(positions, depths.tolist())]))
+
+
+def synthetic_genotypes(rng, n_samples, n_variants):
+    """
+    Draws unphased genotypes of SNPs and indels for a cohort
+    :param rng: numpy random Generator
+    :param n_samples: int, number of samples
+    :param n_variants: int, number of variants
+    :return: positions, list of variant positions
+    :return: genotypes, list of lists of %TGT genotypes, one list per variant
+    """
+    bases = numpy.array(list('ACGT'))
+    positions = numpy.sort(rng.choice(
+        numpy.arange(WINDOW_START, WINDOW_END + 1), n_variants,
+        replace=False)).tolist()
+    genotypes = list()
+    for _ in positions:
+        ref, alt = rng.choice(bases, 2, replace=False)
+        # one in ten variants is an insertion or deletion
+        if rng.random() < 0.1:
+            inserted = ''.join(rng.choice(bases, rng.integers(1, 6)))
+            ref, alt = (ref, ref + inserted) if rng.random() < 0.5 else \
+                (ref + inserted, ref)
+        alleles = numpy.array([ref, alt, '.'], dtype=object)
+        alt_frequency = rng.uniform(0.01, 0.5)
+        # missing alleles are rare
+        calls = rng.choice(3, (n_samples, 2), p=[
+            0.99 * (1 - alt_frequency), 0.99 * alt_frequency, 0.01])
+        genotypes.append([f'{first}/{second}' for first, second in
+                          alleles[calls].tolist()])
+    return positions, genotypes
+
+
+def write_query_tables(data_dir, sample_list, positions, genotypes):
+    """
+    Writes genotypes as a bcftools query table with one line per variant,
+    and transposed with one line per sample
+    :param data_dir: str, directory for synthetic input files
+    :param sample_list: list of sample names
+    :param positions: list of variant positions
+    :param genotypes: list of lists of genotypes, one list per variant
+    :return: None
+    """
+    columns = [f'[{i}]{sample}:GT' for i, sample in
+               enumerate(sample_list, 2)]
+    with open(os.path.join(data_dir, 'query.txt'), 'w') as fh:
+        fh.write('\t'.join(['#[1]POS'] + columns) + '\n')
+        for position, variant_genotypes in zip(positions, genotypes):
+            fh.write('\t'.join([str(position)] + variant_genotypes) + '\n')
+    with open(os.path.join(data_dir, 'query_samples.txt'), 'w') as fh:
+        fh.write('\t'.join(['#[1]POS'] + [str(position) for position in
+                                          positions]) + '\n')
+        for column, sample_genotypes in zip(columns, zip(*genotypes)):
+            fh.write('\t'.join((column,) + sample_genotypes) + '\n')
+
+
+def measure_benchmark(name, data_dir, n_samples, repeats=1):
+    """
+    Runs one benchmark in fresh processes, keeps the fastest run and adds
+    the peak memory of a run with memory tracing
+    :param name: str, benchmark name
+    :param data_dir: str, directory of synthetic input files
+    :param n_samples: int, number of samples in cohort
+    :param repeats: int, number of timed runs
+    :return: dictionary of benchmark, samples, seconds and peak_memory_mb
+    """
+    best = None
+    for _ in range(repeats):
+        result = _run_benchmark_process(name, data_dir, n_samples)
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    best['peak_memory_mb'] = _run_benchmark_process(
+        name, data_dir, n_samples, trace_memory=True)['peak_memory_mb']
+    return best
+
+
+def _run_benchmark_process(name, data_dir, n_samples, trace_memory=False):
+    """
+    Runs one benchmark in a fresh process
+    :param name: str, benchmark name
+    :param data_dir: str, directory of synthetic input files
+    :param n_samples: int, number of samples in cohort
+    :param trace_memory: bool, measure peak memory instead of runtime
+    :return: dictionary of benchmark result
+    """
+    run = f'{name}:{n_samples}' + (':memory' if trace_memory else '')
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--data-dir', data_dir,
+         '--run', run],
+        check=True, stdout=subprocess.PIPE, text=True).stdout
+    # the result is the last line, after anything the benchmark printed
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmark(name, data_dir, n_samples, trace_memory=False):
+    """
+    Runs one benchmark on the first n_samples samples of the synthetic data
+    and measures its runtime, or with trace_memory the peak memory it
+    allocates, which tracing slows down
+    :param name: str, benchmark name
+    :param data_dir: str, directory of synthetic input files
+    :param n_samples: int, number of samples in cohort
+    :param trace_memory: bool, trace memory allocations of the benchmark
+    :return: dictionary of benchmark, samples, seconds and, with
+    trace_memory, peak_memory_mb
+    """
+    # import the measured module first, so its import is not measured
+    module = importlib.import_module(BENCHMARK_MODULES[name])
+    with open(os.path.join(data_dir, 'depth_files.txt'), 'r') as fh:
+        file_list = [line.strip() for _, line in zip(range(n_samples), fh)]
+    out_dir = os.path.join(data_dir, 'out')
+    os.makedirs(out_dir, exist_ok=True)
+    # query tables limited to the first n_samples samples
+    query_file = subset_query_table(data_dir, n_samples, 'query.txt')
+    sample_query_file = subset_query_table(data_dir, n_samples,
+                                           'query_samples.txt')
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if name == 'parse_depth':
+        for file_path in file_list:
+            with module.open_depth_file(file_path) as file_handle:
+                module.load_depth_array(file_handle)
+    elif name == 'interval_binning':
+        module.process_files_from_list(file_list)
+    elif name == 'copy_number':
+        # default baseline of copy_number_per_interval.py
+        start_index = abs(WINDOW_START - 133279500)
+        sample_list, depth_1000_dict, depth_dict = \
+            module.process_files_from_list(file_list, start_index, 5000)
+        module.create_copy_number_dict(sample_list, depth_1000_dict,
+                                       depth_dict)
+    elif name == 'region_copy_number':
+        region_index = module.load_regions(module.DEFAULT_REGIONS)
+        module.extract_region_depths_from_files(file_list, region_index)
+    elif name == 'reverse_complement':
+        run_script(module, ['-i', sample_query_file, '-o',
+                            os.path.join(out_dir, 'rc.txt')])
+    elif name == 'transpose_table':
+        run_script(module, ['-i', query_file, '-o',
+                            os.path.join(out_dir, 'transposed.txt')])
+    seconds = time.perf_counter() - start
+    result = {'benchmark': name, 'samples': n_samples, 'seconds': seconds}
+    if trace_memory:
+        result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def subset_query_table(data_dir, n_samples, file_name):
+    """
+    Writes the query table of the first n_samples samples, unless it exists
+    :param data_dir: str, directory of synthetic input files
+    :param n_samples: int, number of samples
+    :param file_name: str, name of full query table in data_dir
+    :return: str, path to query table of n_samples samples
+    """
+    subset_path = os.path.join(data_dir, f'{n_samples}_{file_name}')
+    if os.path.exists(subset_path):
+        return subset_path
+    with open(os.path.join(data_dir, file_name), 'r') as fh, \
+            open(subset_path, 'w') as out:
+        if file_name == 'query.txt':
+            # samples are columns, keep the position column and n_samples
+            for line in fh:
+                out.write('\t'.join(line.rstrip('\n').split('\t')
+                                    [:n_samples + 1]) + '\n')
+        else:
+            # samples are lines, keep the header line and n_samples
+            for _, line in zip(range(n_samples + 1), fh):
+                out.write(line)
+    return subset_path
+
+
+def run_script(module, argv):
+    """
+    Runs the main function of a script module with command line arguments
+    :param module: imported script module
+    :param argv: list of command line arguments
+    :return: None
+    """
+    sys_argv = sys.argv
+    sys.argv = [module.__file__] + argv
+    try:
+        module.main()
+    finally:
+        sys.argv = sys_argv
+
+
+def git_commit():
+    """
+    :return: str, short hash of the checked out git commit, or unknown
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_comparison(baseline, report):
+    """
+    Prints runtime and peak memory of each benchmark next to those of
+    another version
+    :param baseline: dictionary of benchmark results of other version
+    :param report: dictionary of benchmark results of this version
+    :return: None
+    """
+    previous = {(result['benchmark'], result['samples']): result
+                for result in baseline['results']}
+    print(f'\nbenchmark\tsamples\t{baseline["label"]} s\t{report["label"]} '
+          f's\tspeedup\t{baseline["label"]} MB\t{report["label"]} MB')
+    for result in report['results']:
+        old = previous.get((result['benchmark'], result['samples']))
+        if old is None:
+            continue
+        print(f'{result["benchmark"]}\t{result["samples"]}\t'
+              f'{old["seconds"]:.3f}\t{result["seconds"]:.3f}\t'
+              f'{old["seconds"] / result["seconds"]:.2f}x\t'
+              f'{old["peak_memory_mb"]:.1f}\t'
+              f'{result["peak_memory_mb"]:.1f}')
+
+
+def get_cli_args():
+    """
+    Get command line options with argparse
+    :return: instance of argparse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark depth and genotype processing on synthetic '
+                    'cohorts')
+    parser.add_argument('-d', '--data-dir', dest='data_dir', type=str,
+                        default='/tmp/abo-benchmark',
+                        help='directory for synthetic input files, reused '
+                             'between runs, without underscores in its path')
+    parser.add_argument('-n', '--sizes', dest='sizes', type=str,
+                        default='10,100,1000,10000',
+                        help='comma separated cohort sizes')
+    parser.add_argument('-b', '--benchmarks', dest='benchmarks', type=str,
+                        default=None,
+                        help='comma separated benchmarks to run')
+    parser.add_argument('-p', '--pool', dest='pool', type=int, default=20,
+                        help='number of distinct synthetic depth files')
+    parser.add_argument('-v', '--variants', dest='variants', type=int,
+                        default=300,
+                        help='number of variants in synthetic query tables')
+    parser.add_argument('-o', '--outfile', dest='outfile', type=str,
+                        default='benchmark_results.json',
+                        help='JSON file of benchmark results')
+    parser.add_argument('-l', '--label', dest='label', type=str,
+                        default=None,
+                        help='label of this version in the results')
+    parser.add_argument('-c', '--compare', dest='compare', type=str,
+                        default=None,
+                        help='JSON results of another version to compare '
+                             'with')
+    parser.add_argument('-r', '--repeats', dest='repeats', type=int,
+                        default=1,
+                        help='number of runs per benchmark, the fastest is '
+                             'kept')
+    # internal option of the benchmark processes
+    parser.add_argument('--run', dest='run', type=str, default=None,
+                        help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,10 @@ coverage data, calculates gene copy number per 100 base interval, and writes
 copy number information for each sample per line in a text file.
 
 usage: copy_number_per_interval.py [-h] [-s START] [-i INTERVAL] [-o OUTFILE]
+                                   [-c CACHE_DIR] [-m MATRIX] [-j JOBS]
+                                   [-b BIN_SIZE] [-B BASELINES] [-g GRID]
+                                   [-O BASELINE_OUT] [-M MANIFEST]
+                                   [--metrics METRICS] [--profile PROFILE]
 
 Give base interval for copy number average
 
@@ -17,12 +21,67 @@ optional arguments:
   -i INTERVAL, --interval INTERVAL
                         length of interval
   -o OUTFILE, --outfile OUTFILE
-                        name of outfile
+                        name of outfile, gzip compressed if it ends in .gz,
+                        or a float32 binary table if it ends in .npz,
+                        .parquet or .feather
+  -c CACHE_DIR, --cache-dir CACHE_DIR
+                        directory for binary depth cache, reused while depth
+                        files are unchanged
+  -m MATRIX, --matrix MATRIX
+                        read depths from a depth_matrix.py store instead of
+                        the depth files
+  -j JOBS, --jobs JOBS  number of processes for reading depth files
+  -b BIN_SIZE, --bin-size BIN_SIZE
+                        number of bases per copy number interval
+  -B BASELINES, --baselines BASELINES
+                        text file of candidate baseline windows, one start
+                        position and length per line, compared in one pass
+  -g GRID, --grid GRID  grid of candidate baseline windows of length INTERVAL
+                        as FIRST:LAST:STEP start positions
+  -O BASELINE_OUT, --baseline-out BASELINE_OUT
+                        name of baseline comparison outfile
+  -M MANIFEST, --manifest MANIFEST
+                        JSON manifest of per-sample results; only new or
+                        changed depth files are read
+  --metrics METRICS     JSON report of wall time, bytes and lines read,
+                        samples per second and memory growth per stage
+  --profile PROFILE     cProfile output, hottest functions are added to the
+                        metrics report
+
+Depth files may be gzip or bgzip compressed.
+
+With --manifest the baseline and interval depths of each sample are recorded
+with the size and modification time of its depth file and the baseline and
+bin size options. When the cohort grows or a depth file is regenerated, only
+those files are read and the outfile is rewritten for all samples in the file
+list.
+
+-B and -g compare candidate baseline windows and write only the baseline
+comparison outfile, so -o and -M are rejected with them. Windows must lie
+within chr9:133255176-133385146; a window reaching past the end of a depth
+file is reported as NA for that sample.
+
+--metrics reports a read_bin stage (reading depth files, or their cached
+prefix sums, and averaging the baseline and intervals), a copy_number stage
+and a write stage; baseline comparisons report read_baselines, stability and
+write stages.
 
 """
 
 import argparse
 import os
+from functools import partial
+
+import numpy
+
+from depth_io import (DEPTH_DIR, DEPTH_FILE_LIST, PrefixSumIndex,
+                      aggregate_depth_file, create_list_of_depth_files,
+                      lines_parsed, load_cached_prefix_index,
+                      load_depth_array, map_samples,
+                      map_samples_with_manifest, is_columnar,
+                      open_depth_file, open_output_file, write_columnar)
+from depth_matrix import WINDOW_END, WINDOW_START, open_depth_matrix
+from run_metrics import RunMetrics
 
 
 def main():
@@ -31,55 +90,105 @@ def main():
     start = abs(133255176 - args.start)
     interval = args.interval
     outfile = args.outfile
+    cache_dir = args.cache_dir
+    bin_size = args.bin_size
+    metrics = RunMetrics('copy_number_per_interval.py', args.metrics,
+                         args.profile, line_counter=lines_parsed)
+
+    if args.baselines or args.grid:
+        # compare candidate baselines instead of writing copy numbers
+        windows = create_baseline_windows(args.baselines, args.grid,
+                                          interval)
+        with metrics.stage('read_baselines') as stage:
+            if args.matrix:
+                sample_list, baseline_dict, depth_dict = \
+                    evaluate_baselines_from_matrix(
+                        open_depth_matrix(args.matrix), windows, bin_size)
+            else:
+                file_list = create_list_of_depth_files(DEPTH_FILE_LIST)
+                sample_list, baseline_dict, depth_dict = \
+                    evaluate_baselines_from_files(file_list, windows,
+                                                  cache_dir, args.jobs,
+                                                  bin_size)
+                if not cache_dir:
+                    stage['files'] = [os.path.join(DEPTH_DIR, file)
+                                      for file in file_list]
+            stage['samples'] = len(sample_list)
+        with metrics.stage('stability') as stage:
+            stability_dict = create_baseline_stability_dict(
+                sample_list, baseline_dict, depth_dict)
+            stage['samples'] = len(sample_list)
+        with metrics.stage('write') as stage:
+            print_baseline_stability(args.baseline_out, windows, sample_list,
+                                     stability_dict)
+            stage['outfile'] = args.baseline_out
+        metrics.finish()
+        return
 
     print(start)
     print(interval)
     print(outfile)
 
-    # path to text file containing sample file names
-    path_2_file_list = "/Users/jonathan_stevens/ABO/depth_out.txt"
-    # create list of sample file names
-    file_list = create_list_of_depth_files(path_2_file_list)
-    # create list of sample names
-    # create dictionary of sample keys with depth per 100 base list values
-    sample_list, depth_1000_dict, depth_dict = process_files_from_list(
-        file_list, start, interval)
-    # create copy number dictionary
-    copy_number_dict = create_copy_number_dict(
-        sample_list, depth_1000_dict, depth_dict)
+    with metrics.stage('read_bin') as stage:
+        if args.matrix:
+            # create dictionary of sample keys with depth per 100 base list
+            # values from the cohort depth matrix
+            sample_list, depth_1000_dict, depth_dict = process_depth_matrix(
+                open_depth_matrix(args.matrix), start, interval, bin_size)
+        else:
+            # path to text file containing sample file names
+            path_2_file_list = DEPTH_FILE_LIST
+            # create list of sample file names
+            file_list = create_list_of_depth_files(path_2_file_list)
+            # create list of sample names
+            # create dictionary of sample keys with depth per 100 base list
+            # values
+            sample_list, depth_1000_dict, depth_dict = \
+                process_files_from_list(file_list, start, interval,
+                                        cache_dir, args.jobs, bin_size,
+                                        args.manifest)
+            if not (cache_dir or args.manifest):
+                stage['files'] = [os.path.join(DEPTH_DIR, file)
+                                  for file in file_list]
+        stage['samples'] = len(sample_list)
+    with metrics.stage('copy_number') as stage:
+        # create copy number dictionary
+        copy_number_dict = create_copy_number_dict(
+            sample_list, depth_1000_dict, depth_dict)
+        stage['samples'] = len(sample_list)
 
     # generate header for output text file
-    header_line = create_file_headers()
-    print_data_2_file(outfile, header_line, sample_list, copy_number_dict)
-
-
-def create_list_of_depth_files(text_file):
-    """
-    creates a list of file names from a text file
-    :param text_file: str, name of text file containing file list
-    :return: file_list, list of file names
-    """
-    file_list = list()
-    with open(text_file, 'r') as tf:
-        for line in tf:
-            line = line.strip()
-            file_list.append(line)
-    return file_list
+    header_line = create_file_headers(bin_size)
+    with metrics.stage('write') as stage:
+        print_data_2_file(outfile, header_line, sample_list,
+                          copy_number_dict)
+        stage['samples'] = len(sample_list)
+        stage['outfile'] = outfile
+    metrics.finish()
 
 
-def process_files_from_list(file_list, start, interval):
+def process_files_from_list(file_list, start, interval, cache_dir=None,
+                            jobs=1, bin_size=100, manifest=None):
     """
     Opens each file in file_list, extracts sample name and depth data, creates
     100 base intervals, and calculates their average values.
     :param file_list: list, list of file names
     :param start: int, starting index of baseline interval
     :param interval: int, length of interval
+    :param cache_dir: str, optional directory for binary depth cache
+    :param jobs: int, number of processes used to read depth files
+    :param bin_size: int, number of bases per interval
+    :param manifest: str, optional path to JSON manifest of per-sample
+    results, only depth files that are new or changed since are read
     :return: sample_list, list of sample names
+    :return: depth_1000_dict, dictionary of sample keys with baseline depths
     :return: depth_dict, dictionary of sample keys with list of depth per 100
     base interval values
     """
     # list of sample names
     sample_list = list()
+    # list of paths to individual depth files
+    file_paths = list()
     # dictionary containing average baseline interval depths
     depth_1000_dict = dict()
     # dictionary containing average depths per 100 base intervals
@@ -89,69 +198,110 @@ def process_files_from_list(file_list, start, interval):
         sample_name = file.split('_')[0]
         sample_list.append(sample_name)
         # specify path to individual depth file
-        basepath = '/Users/jonathan_stevens/ABO/1000G_data/depth/'
-        file_path = os.path.join(basepath, file)
-        # create file handle for depth file
-        file_handle = open(file_path, 'r')
-        # extract depth data from file
-        sample_depth_list = _get_depth_list(file_handle)
-        file_handle.close()
-
-        # calculate average depth over baseline range
-        depth_1000_interval = sample_depth_list[start:start+interval]
-        depth_1000 = round(sum(depth_1000_interval) /
-                           len(depth_1000_interval), 2)
-        depth_1000_dict[sample_name] = depth_1000
-
-        # split depth data into 100 base interval lists
-        depth_intervals_list = _create_depth_intervals_list(sample_depth_list)
-        # calculate average value for each interval
-        avg_depth_per_interval = \
-            _calculate_avg_depth_per_interval(depth_intervals_list)
-        # add average depth per interval to dictionary
-        depth_dict[sample_name] = avg_depth_per_interval
+        basepath = DEPTH_DIR
+        file_paths.append(os.path.join(basepath, file))
+    # calculate baseline and 100 base interval average depths per file
+    process_file = partial(_process_depth_file, start=start,
+                           interval=interval, cache_dir=cache_dir,
+                           bin_size=bin_size)
+    if manifest:
+        # results depend on the baseline range and interval size
+        key = f'copy_number:{start}:{interval}:{bin_size}'
+        results, _ = map_samples_with_manifest(process_file, file_paths,
+                                               manifest, key, jobs)
+    else:
+        results = map_samples(process_file, file_paths, jobs)
+    for sample_name, sample_depths in zip(sample_list, results):
+        # check for empty depth files
+        if sample_depths is None:
+            print(f'{sample_name}: division by zero. Review samtools depth '
+                  f'file')
+            continue
+        depth_1000_dict[sample_name], depth_dict[sample_name] = sample_depths
     return sample_list, depth_1000_dict, depth_dict
 
 
-def _get_depth_list(file_handle):
+def _process_depth_file(file_path, start, interval, cache_dir=None,
+                        bin_size=100):
     """
-    Extracts sample depth of coverage data from column 3 of the text file and
-    returns a list of the values
-    :param file_handle: file object in read mode containing depth data
-    :return: sample_depth_list, a list of depth values from file
+    Reads one depth file and calculates its baseline and 100 base interval
+    average depths
+    :param file_path: str, path to depth file
+    :param start: int, starting index of baseline interval
+    :param interval: int, length of interval
+    :param cache_dir: str, optional directory for binary depth cache
+    :param bin_size: int, number of bases per interval
+    :return: tuple of depth_1000, float, average depth over baseline range,
+    and avg_depth_per_interval, list of average depths per 100 bases, or None
+    if the baseline range of the depth file is empty
     """
-    sample_depth_list = list()
-    for line in file_handle:
-        line = line.split()
-        # create list of depth values from column 3 of file
-        sample_depth_list.append(int(line[2]))
-    return sample_depth_list
-
-
-def _create_depth_intervals_list(sample_depth_list):
+    try:
+        if cache_dir:
+            # extract prefix sums from cache, parsing file only if changed
+            prefix_index = load_cached_prefix_index(file_path, cache_dir)
+            return _average_prefix_index(prefix_index, start, interval,
+                                         bin_size)
+        # create file handle for depth file
+        with open_depth_file(file_path) as file_handle:
+            # stream depth data from file into running sums per 100 base
+            # interval and over the baseline range
+            aggregator = aggregate_depth_file(
+                file_handle, size=bin_size,
+                windows=[(start, start + interval)])
+        depth_1000 = round(aggregator.window_average(0), 2)
+        return depth_1000, aggregator.interval_averages()
+    except ZeroDivisionError:
+        return None
+
+
+def process_depth_matrix(depth_matrix, start, interval, bin_size=100):
     """
-    Splits the depth list into 100 element lists
-    :param sample_depth_list: list of depth values
-    :return: depth_intervals_list, list of 100 element lists
+    Reads each sample row of a cohort depth matrix and calculates baseline
+    and 100 base interval average depths.
+    :param depth_matrix: DepthMatrix, cohort depth matrix store
+    :param start: int, starting index of baseline interval
+    :param interval: int, length of interval
+    :param bin_size: int, number of bases per interval
+    :return: sample_list, list of sample names
+    :return: depth_1000_dict, dictionary of sample keys with baseline depths
+    :return: depth_dict, dictionary of sample keys with list of depth per 100
+    base interval values
     """
-    depth_intervals_list = list()
-    # divide list into 100 element lists
-    for i in range(0, len(sample_depth_list), 100):
-        depth_intervals_list.append(sample_depth_list[i:i + 100])
-    return depth_intervals_list
+    sample_list = list(depth_matrix.sample_list)
+    depth_1000_dict = dict()
+    depth_dict = dict()
+    for sample_name in sample_list:
+        # read one sample row of the memory-mapped matrix
+        sample_depth_list = depth_matrix.sample_depths(sample_name)
+        prefix_index = PrefixSumIndex.from_depths(sample_depth_list)
+        try:
+            depth_1000_dict[sample_name], depth_dict[sample_name] = \
+                _average_prefix_index(prefix_index, start, interval,
+                                      bin_size)
+        # check for empty depth files
+        except ZeroDivisionError:
+            print(f'{sample_name}: division by zero. Review samtools depth '
+                  f'file')
+    return sample_list, depth_1000_dict, depth_dict
 
 
-def _calculate_avg_depth_per_interval(depth_intervals_list):
+def _average_prefix_index(prefix_index, start, interval, bin_size=100):
     """
-    Calculates the average depth per interval
-    :param depth_intervals_list: list of depths per 100 bases
-    :return: avg_depth_per_interval, list of average depths per 100 bases
+    Calculates the baseline average depth and the average depth of each
+    interval of one sample from its prefix sums, without rescanning depths
+    :param prefix_index: PrefixSumIndex of depth values
+    :param start: int, starting index of baseline interval
+    :param interval: int, length of interval
+    :param bin_size: int, number of bases per interval
+    :return: depth_1000, float, average depth over baseline range
+    :return: avg_depth_per_interval, list of average depths per interval
     """
-    avg_depth_per_interval = list()
-    # calculate average of each interval
-    for interval in depth_intervals_list:
-        avg_depth_per_interval.append(round(sum(interval) / len(interval)))
-    return avg_depth_per_interval
+    # calculate average depth over baseline range
+    depth_1000 = round(prefix_index.window_average(start, start + interval),
+                       2)
+    # calculate average value for each interval
+    avg_depth_per_interval = prefix_index.interval_averages(bin_size)
+    return depth_1000, avg_depth_per_interval
 
 
 def create_copy_number_dict(sample_list, depth_1000_dict, depth_dict):
@@ -166,6 +316,9 @@ def create_copy_number_dict(sample_list, depth_1000_dict, depth_dict):
     """
     copy_number_dict = dict()
     for sample in sample_list:
+        # samples with empty depth files were reported while reading them
+        if sample not in depth_1000_dict:
+            continue
         try:
             copy_number_dict[sample] = [
                 round(x / (depth_1000_dict[sample] / 2), 2)
@@ -175,15 +328,200 @@ def create_copy_number_dict(sample_list, depth_1000_dict, depth_dict):
     return copy_number_dict
 
 
-def create_file_headers():
+def create_baseline_windows(baselines_file=None, grid=None, interval=5000):
+    """
+    Creates the list of candidate baseline windows from a text file of
+    start positions and lengths and from a grid of start positions
+    :param baselines_file: str, optional text file, one window per line
+    :param grid: str, optional FIRST:LAST:STEP grid of start positions
+    :param interval: int, length of grid windows
+    :return: windows, list of (start position, length) tuples
+    :raises ValueError: if a window does not lie within the ABO gene window
+    """
+    windows = list()
+    if baselines_file:
+        with open(baselines_file, 'r') as fh:
+            for line in fh:
+                fields = line.split()
+                # skip blank and comment lines
+                if not fields or fields[0].startswith('#'):
+                    continue
+                length = int(fields[1]) if len(fields) > 1 else interval
+                windows.append((int(fields[0]), length))
+    if grid:
+        first, last, step = (int(i) for i in grid.split(':'))
+        for position in range(first, last + 1, step):
+            windows.append((position, interval))
+    for position, length in windows:
+        if length < 1 or position < WINDOW_START or \
+                position + length - 1 > WINDOW_END:
+            raise ValueError(
+                f'baseline window chr9:{position}-{position + length - 1} '
+                f'outside of chr9:{WINDOW_START}-{WINDOW_END}')
+    return windows
+
+
+def evaluate_baselines_from_files(file_list, windows, cache_dir=None, jobs=1,
+                                  bin_size=100):
+    """
+    Reads each depth file once and calculates the average depth of every
+    candidate baseline window and of each interval.
+    :param file_list: list, list of file names
+    :param windows: list of (start position, length) baseline windows
+    :param cache_dir: str, optional directory for binary depth cache
+    :param jobs: int, number of processes used to read depth files
+    :param bin_size: int, number of bases per interval
+    :return: sample_list, list of sample names
+    :return: baseline_dict, dictionary of sample keys with lists of baseline
+    depths per window, None for empty windows
+    :return: depth_dict, dictionary of sample keys with list of depth per
+    interval values
+    """
+    sample_list = [file.split('_')[0] for file in file_list]
+    basepath = DEPTH_DIR
+    file_paths = [os.path.join(basepath, file) for file in file_list]
+    results = map_samples(
+        partial(_process_baseline_file, windows=windows, cache_dir=cache_dir,
+                bin_size=bin_size), file_paths, jobs)
+    baseline_dict = dict()
+    depth_dict = dict()
+    for sample_name, (baseline_depths, avg_depth_per_interval) in zip(
+            sample_list, results):
+        baseline_dict[sample_name] = baseline_depths
+        depth_dict[sample_name] = avg_depth_per_interval
+    return sample_list, baseline_dict, depth_dict
+
+
+def _process_baseline_file(file_path, windows, cache_dir=None, bin_size=100):
+    """
+    Reads one depth file into a prefix sum index and evaluates every
+    baseline window against it
+    :param file_path: str, path to depth file
+    :param windows: list of (start position, length) baseline windows
+    :param cache_dir: str, optional directory for binary depth cache
+    :param bin_size: int, number of bases per interval
+    :return: baseline_depths, list of baseline depths, None if empty
+    :return: avg_depth_per_interval, list of average depths per interval
+    """
+    if cache_dir:
+        prefix_index = load_cached_prefix_index(file_path, cache_dir)
+    else:
+        prefix_index = PrefixSumIndex.from_depths(load_depth_array(file_path))
+    return (_baseline_depths(prefix_index, windows),
+            prefix_index.interval_averages(bin_size))
+
+
+def evaluate_baselines_from_matrix(depth_matrix, windows, bin_size=100):
+    """
+    Evaluates every candidate baseline window for each sample row of a
+    cohort depth matrix.
+    :param depth_matrix: DepthMatrix, cohort depth matrix store
+    :param windows: list of (start position, length) baseline windows
+    :param bin_size: int, number of bases per interval
+    :return: sample_list, list of sample names
+    :return: baseline_dict, dictionary of sample keys with lists of baseline
+    depths per window, None for empty windows
+    :return: depth_dict, dictionary of sample keys with list of depth per
+    interval values
+    """
+    sample_list = list(depth_matrix.sample_list)
+    baseline_dict = dict()
+    depth_dict = dict()
+    for sample_name in sample_list:
+        prefix_index = PrefixSumIndex.from_depths(
+            depth_matrix.sample_depths(sample_name))
+        baseline_dict[sample_name] = _baseline_depths(prefix_index, windows)
+        depth_dict[sample_name] = prefix_index.interval_averages(bin_size)
+    return sample_list, baseline_dict, depth_dict
+
+
+def _baseline_depths(prefix_index, windows):
+    """
+    Calculates the average depth of each baseline window of one sample.
+    Windows that extend past the end of the sample's depths are not
+    averaged over the bases they hold, but reported as empty.
+    :param prefix_index: PrefixSumIndex of depth values
+    :param windows: list of (start position, length) baseline windows
+    :return: baseline_depths, list of baseline depths per window, None for
+    windows not covered by the depth file
+    """
+    # convert start positions to list indexes, as for --start
+    starts = numpy.array([position - WINDOW_START
+                          for position, length in windows], dtype=numpy.int64)
+    ends = starts + numpy.array([length for position, length in windows],
+                                dtype=numpy.int64)
+    depths = prefix_index.window_averages(starts, ends)
+    return [None if end > len(prefix_index) else round(depth, 2)
+            for depth, end in zip(depths.tolist(), ends.tolist())]
+
+
+def create_baseline_stability_dict(sample_list, baseline_dict, depth_dict):
+    """
+    Summarises how much the baseline depth, and the median copy number of
+    all intervals, change between candidate baselines of each sample
+    :param sample_list: list of sample names
+    :param baseline_dict: dictionary of baseline depths per window per sample
+    :param depth_dict: dictionary of depths per interval per sample
+    :return: stability_dict, dictionary of sample keys with lists of baseline
+    depths, their mean, standard deviation and coefficient of variation, and
+    the lowest and highest median copy number
+    """
+    stability_dict = dict()
+    for sample in sample_list:
+        baseline_depths = baseline_dict[sample]
+        depths = numpy.array([depth for depth in baseline_depths
+                              if depth], dtype=numpy.float64)
+        if not len(depths):
+            print(f'{sample}: division by zero. Review samtools depth file')
+            continue
+        mean = depths.mean()
+        sd = depths.std()
+        # copy number scales with 1 / baseline, so the median interval
+        # copy number moves by the same factor as the baseline depth
+        median_depth = numpy.median(depth_dict[sample]) \
+            if depth_dict[sample] else 0.0
+        median_cns = median_depth / (depths / 2)
+        stability_dict[sample] = baseline_depths + [
+            round(mean, 2), round(sd, 2), round(sd / mean, 4),
+            round(median_cns.min(), 2), round(median_cns.max(), 2)]
+    return stability_dict
+
+
+def print_baseline_stability(out_file, windows, sample_list, stability_dict):
+    """
+    Prints the baseline comparison of all samples to a text file
+    :param out_file: string, name of out put file
+    :param windows: list of (start position, length) baseline windows
+    :param sample_list: list, list of sample names
+    :param stability_dict: dictionary of baseline depths and summary values
+    per sample
+    :return: None
+    """
+    header_line = ['Sample']
+    for position, length in windows:
+        header_line.append(f'chr9:{position}-{position + length - 1}')
+    header_line += ['Mean_depth', 'SD_depth', 'CV_depth', 'Min_median_CN',
+                    'Max_median_CN']
+    with open_output_file(out_file) as fh:
+        fh.write('\t'.join(header_line) + '\n')
+        for sample in sample_list:
+            if sample not in stability_dict:
+                continue
+            values = ['NA' if value is None else str(value)
+                      for value in stability_dict[sample]]
+            fh.write('\t'.join([sample] + values) + '\n')
+
+
+def create_file_headers(bin_size=100):
     """
     Creates header line for output text file
+    :param bin_size: int, number of bases per interval
     :return: header_line, list of strings
     """
     header_line = list()
     header_line.append("Sample")
-    # generate 100 base interval column headers
-    for i in range(133255176, 133385146, 100):
+    # generate interval column headers
+    for i in range(133255176, 133385146, bin_size):
         header_line.append(f'chr9:{i}')
     return header_line
 
@@ -199,7 +537,10 @@ def print_data_2_file(out_file, header_line, sample_list, copy_number_dict):
     per sample
     :return: None
     """
-    with open(out_file, 'w') as fh:
+    if is_columnar(out_file):
+        write_columnar(out_file, header_line, sample_list, copy_number_dict)
+        return
+    with open_output_file(out_file) as fh:
         # write tab delimited header line to file
         header_line_joined = "\t".join(header_line)
         fh.write(f'{header_line_joined}\n')
@@ -226,9 +567,55 @@ def get_cli_args():
     parser.add_argument('-i', '--interval', dest='interval', type=int,
                         default=5000, help='length of interval')
     parser.add_argument('-o', '--outfile', dest='outfile', type=str,
-                        default='1000G_100bp_avg_copy_number.txt',
-                        help='name of outfile')
-    return parser.parse_args()
+                        default=None,
+                        help='name of outfile, gzip compressed if it ends in '
+                             '.gz, or a float32 binary table if it ends in '
+                             '.npz, .parquet or .feather')
+    parser.add_argument('-c', '--cache-dir', dest='cache_dir', type=str,
+                        default=None,
+                        help='directory for binary depth cache, reused while '
+                             'depth files are unchanged')
+    parser.add_argument('-m', '--matrix', dest='matrix', type=str,
+                        default=None,
+                        help='read depths from a depth_matrix.py store '
+                             'instead of the depth files')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help='number of processes for reading depth files')
+    parser.add_argument('-b', '--bin-size', dest='bin_size', type=int,
+                        default=100,
+                        help='number of bases per copy number interval')
+    parser.add_argument('-B', '--baselines', dest='baselines', type=str,
+                        default=None,
+                        help='text file of candidate baseline windows, one '
+                             'start position and length per line, compared '
+                             'in one pass')
+    parser.add_argument('-g', '--grid', dest='grid', type=str, default=None,
+                        help='grid of candidate baseline windows of length '
+                             'INTERVAL as FIRST:LAST:STEP start positions')
+    parser.add_argument('-O', '--baseline-out', dest='baseline_out',
+                        type=str, default='baseline_stability.txt',
+                        help='name of baseline comparison outfile')
+    parser.add_argument('-M', '--manifest', dest='manifest', type=str,
+                        default=None,
+                        help='JSON manifest of per-sample results; only new '
+                             'or changed depth files are read')
+    parser.add_argument('--metrics', dest='metrics', type=str,
+                        default=None,
+                        help='JSON report of wall time, bytes and lines read, '
+                             'samples per second and memory growth per stage')
+    parser.add_argument('--profile', dest='profile', type=str, default=None,
+                        help='cProfile output, hottest functions are added to '
+                             'the metrics report')
+    args = parser.parse_args()
+    if args.baselines or args.grid:
+        # baseline comparisons write only the comparison table
+        if args.outfile or args.manifest:
+            parser.error('-o/--outfile and -M/--manifest are not used with '
+                         '-B/--baselines or -g/--grid, name the comparison '
+                         'outfile with -O/--baseline-out')
+    elif args.outfile is None:
+        args.outfile = '1000G_100bp_avg_copy_number.txt'
+    return args
 
 
 if __name__ == "__main__":
@@ -9,156 +9,337 @@ information for each sample per line to a tab delimited text file.
 To run:
 python3 copy_number_per_region.py
 
+usage: copy_number_per_region.py [-h] [-m MATRIX] [-j JOBS] [-r REGIONS]
+                                 [-o OUTFILE] [-M MANIFEST]
+                                 [--metrics METRICS] [--profile PROFILE]
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -m MATRIX, --matrix MATRIX
+                        read depths from a depth_matrix.py store instead of
+                        the depth files
+  -j JOBS, --jobs JOBS  number of processes for reading depth files
+  -r REGIONS, --regions REGIONS
+                        BED file of gene regions, including a Baseline
+                        region (default: abo_regions.bed)
+  -o OUTFILE, --outfile OUTFILE
+                        name of outfile, gzip compressed if it ends in .gz,
+                        or a float32 binary table if it ends in .npz,
+                        .parquet or .feather
+  -M MANIFEST, --manifest MANIFEST
+                        JSON manifest of per-sample results; only new or
+                        changed depth files are read
+  --metrics METRICS     JSON report of wall time, bytes and lines read,
+                        samples per second and memory growth per stage
+  --profile PROFILE     cProfile output, hottest functions are added to the
+                        metrics report
+
+Depth files may be gzip or bgzip compressed.
+
+With --manifest the copy numbers of each sample are recorded with the size
+and modification time of its depth file and the gene regions. When the
+cohort grows or a depth file is regenerated, only those files are read and
+the outfile is rewritten for all samples in the file list.
+
+The --metrics report has a read_regions stage, reading depth files and
+calculating region copy numbers, and a write stage.
+
 """
 
+import argparse
 import os
+from functools import partial
+
+import numpy
+
+from depth_io import (DEPTH_DIR, DEPTH_FILE_LIST,
+                      create_list_of_depth_files, is_columnar,
+                      lines_parsed, load_depth_arrays, map_samples,
+                      map_samples_with_manifest, open_depth_file,
+                      open_output_file, write_columnar)
+from depth_matrix import open_depth_matrix
+from run_metrics import RunMetrics
+
+# BED file of ABO gene regions distributed with this script
+DEFAULT_REGIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'abo_regions.bed')
+# name of the region used as copy number baseline
+BASELINE_REGION = 'Baseline'
 
 
 def main():
-    # path to text file containing sample file names
-    path_2_file_list = "/Users/jonathan_stevens/ABO/depth_out.txt"
-    # create list of sample file names
-    file_list = create_list_of_depth_files(path_2_file_list)
-    #
-    sample_list, sample_cn_dict = extract_region_depths_from_files(file_list)
-    out_file = "copy_number_per_region.txt"
-    print_data_2_file(out_file, sample_list, sample_cn_dict)
+    args = get_cli_args()
+    # create interval index of gene regions
+    region_index = load_regions(args.regions)
+    metrics = RunMetrics('copy_number_per_region.py', args.metrics,
+                         args.profile, line_counter=lines_parsed)
+    with metrics.stage('read_regions') as stage:
+        if args.matrix:
+            sample_list, sample_cn_dict = extract_region_depths_from_matrix(
+                open_depth_matrix(args.matrix), region_index)
+        else:
+            # path to text file containing sample file names
+            path_2_file_list = DEPTH_FILE_LIST
+            # create list of sample file names
+            file_list = create_list_of_depth_files(path_2_file_list)
+            #
+            sample_list, sample_cn_dict = extract_region_depths_from_files(
+                file_list, region_index, args.jobs, args.manifest)
+            if not args.manifest:
+                stage['files'] = [os.path.join(DEPTH_DIR, file)
+                                  for file in file_list]
+        stage['samples'] = len(sample_list)
+    out_file = args.outfile
+    with metrics.stage('write') as stage:
+        print_data_2_file(out_file, sample_list, sample_cn_dict,
+                          region_index.region_names)
+        stage['samples'] = len(sample_list)
+        stage['outfile'] = out_file
+    metrics.finish()
 
 
-def create_list_of_depth_files(text_file):
+def load_regions(bed_file):
     """
-    creates a list of file names from a text file
-    :param text_file: str, name of text file containing file list
-    :return: file_list, list of file names
+    Reads gene regions from a BED file of chromosome, start, end and name
+    columns. Start positions are 0-based and end positions are exclusive.
+    :param bed_file: str, path to BED file
+    :return: RegionIndex of regions in file order
     """
-    file_list = list()
-    with open(text_file, 'r') as tf:
-        for line in tf:
-            line = line.strip()
-            file_list.append(line)
-    return file_list
+    names = list()
+    starts = list()
+    ends = list()
+    with open(bed_file, 'r') as fh:
+        for line in fh:
+            # skip comment, track and blank lines
+            if line.startswith(('#', 'track', 'browser')) or not line.strip():
+                continue
+            line = line.rstrip('\n').split('\t')
+            # convert to 1-based half open positions used in depth files
+            starts.append(int(line[1]) + 1)
+            ends.append(int(line[2]) + 1)
+            names.append(line[3])
+    return RegionIndex(names, starts, ends)
+
 
+class RegionIndex:
+    """
+    Sorted interval index assigning depth file positions to gene regions
+    with a binary search per position
+    """
 
-def extract_region_depths_from_files(file_list):
+    def __init__(self, names, starts, ends):
+        """
+        :param names: list of region names
+        :param starts: list of first positions of regions
+        :param ends: list of positions after the last position of regions
+        """
+        if BASELINE_REGION not in names:
+            raise ValueError(f'regions must include a {BASELINE_REGION} '
+                             f'region')
+        self.names = list(names)
+        self.baseline = self.names.index(BASELINE_REGION)
+        # output region columns in file order, baseline excluded
+        self.regions = [i for i in range(len(names)) if i != self.baseline]
+        starts = numpy.asarray(starts, dtype=numpy.int64)
+        ends = numpy.asarray(ends, dtype=numpy.int64)
+        self.order = numpy.argsort(starts, kind='stable')
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+        # positions may belong to one region only
+        if (self.starts[1:] < self.ends[:-1]).any():
+            raise ValueError('regions must not overlap')
+
+    @property
+    def key(self):
+        """
+        :return: str, name and positions of all regions, identifying the
+        regions results were calculated for
+        """
+        return ';'.join(f'{self.names[i]}:{start}-{end}' for i, start, end
+                        in zip(self.order, self.starts, self.ends))
+
+    @property
+    def region_names(self):
+        """
+        :return: list of output region names, baseline excluded
+        """
+        return [self.names[i] for i in self.regions]
+
+    def assign(self, positions):
+        """
+        Finds the region of each position
+        :param positions: numpy array of positions
+        :return: numpy array of region indexes in file order, -1 for
+        positions outside of all regions
+        """
+        # last region starting at or before each position
+        found = numpy.searchsorted(self.starts, positions, side='right') - 1
+        inside = (found >= 0) & (positions < self.ends[numpy.maximum(found,
+                                                                      0)])
+        return numpy.where(inside, self.order[numpy.maximum(found, 0)], -1)
+
+    def region_sums(self, region_ids, depths):
+        """
+        Sums depths and counts positions per region
+        :param region_ids: numpy array of region indexes from assign
+        :param depths: numpy array of depth values, one row per position
+        and optionally one column per sample
+        :return: sums, numpy array of depth sums per region (and sample)
+        :return: counts, numpy array of positions per region
+        """
+        sums = numpy.zeros((len(self.names),) + depths.shape[1:],
+                           dtype=numpy.int64)
+        counts = numpy.zeros(len(self.names), dtype=numpy.int64)
+        if len(region_ids) == 0:
+            return sums, counts
+        # sorted positions fall into runs of the same region, so depths are
+        # reduced once per run and runs are added to their regions
+        run_starts = numpy.append(
+            0, numpy.flatnonzero(numpy.diff(region_ids)) + 1)
+        run_ids = region_ids[run_starts]
+        run_sums = numpy.add.reduceat(depths.astype(numpy.int64), run_starts,
+                                      axis=0)
+        run_counts = numpy.diff(numpy.append(run_starts, len(region_ids)))
+        inside = run_ids >= 0
+        numpy.add.at(sums, run_ids[inside], run_sums[inside])
+        numpy.add.at(counts, run_ids[inside], run_counts[inside])
+        return sums, counts
+
+
+def extract_region_depths_from_files(file_list, region_index, jobs=1,
+                                     manifest=None):
     sample_list = list()
     sample_cn_dict = dict()
+    file_paths = list()
 
     for file in file_list:
         # capture sample name from file name
         sample_name = file.split('_')[0]
         sample_list.append(sample_name)
         # path to depth files
-        basepath = '/Users/jonathan_stevens/ABO/1000G_data/depth/'
+        basepath = DEPTH_DIR
         # individual path to file
-        file_path = os.path.join(basepath, file)
-        # create file handle for depth file
-        file_handle = open(file_path, 'r')
-
-        # initialize gene region lists
-        exon7_utr3_depths = list()
-        intron6_depths = list()
-        exon6_depths = list()
-        intron5_depths = list()
-        exon5_depths = list()
-        intron4_depths = list()
-        exon4_depths = list()
-        intron3_depths = list()
-        exon3_depths = list()
-        intron2_depths = list()
-        exon2_depths = list()
-        intron1_depths = list()
-        exon1_utr5_depths = list()
-        baseline_depths = list()
-
-        for line in file_handle:
-            line = line.strip().split()
-            # extract depth data per gene region
-            if int(line[1]) in range(133255176, 133256357):
-                exon7_utr3_depths.append(int(line[2]))
-            elif int(line[1]) in range(133256357, 133257409):
-                intron6_depths.append(int(line[2]))
-            elif int(line[1]) in range(133257409, 133257543):
-                exon6_depths.append(int(line[2]))
-            elif int(line[1]) in range(133257543, 133258097):
-                intron5_depths.append(int(line[2]))
-            elif int(line[1]) in range(133258097, 133258133):
-                exon5_depths.append(int(line[2]))
-            elif int(line[1]) in range(133258133, 133259819):
-                intron4_depths.append(int(line[2]))
-            elif int(line[1]) in range(133259819, 133259867):
-                exon4_depths.append(int(line[2]))
-            elif int(line[1]) in range(133259867, 133261318):
-                intron3_depths.append(int(line[2]))
-            elif int(line[1]) in range(133261318, 133261375):
-                exon3_depths.append(int(line[2]))
-            elif int(line[1]) in range(133261375, 133262099):
-                intron2_depths.append(int(line[2]))
-            elif int(line[1]) in range(133262099, 133262169):
-                exon2_depths.append(int(line[2]))
-            elif int(line[1]) in range(133262169, 133275162):
-                intron1_depths.append(int(line[2]))
-            elif int(line[1]) in range(133275162, 133275215):
-                exon1_utr5_depths.append(int(line[2]))
-            # 5000 base region used for copy number calculations
-            elif int(line[1]) in range(133279500, 133284501):
-                baseline_depths.append(int(line[2]))
-            else:
-                pass
-        # calculate baseline average to be used in calculations
-        baseline_depth_avg = _average(baseline_depths)
-        baseline_depth = round(baseline_depth_avg, 2)
-
-        # copy number calculations per regions
+        file_paths.append(os.path.join(basepath, file))
+
+    # copy number calculations per regions for each file
+    process_file = partial(_process_region_file, region_index=region_index)
+    if manifest:
+        # only read depth files that are new or changed since last run
+        results, _ = map_samples_with_manifest(
+            process_file, file_paths, manifest,
+            f'regions:{region_index.key}', jobs)
+    else:
+        results = map_samples(process_file, file_paths, jobs)
+    for sample_name, copy_numbers in zip(sample_list, results):
+        # check for empty depth files (zero for all values)
+        if copy_numbers is None:
+            print(f'{sample_name}: ZeroDivisionError, check depth file')
+        else:
+            sample_cn_dict[sample_name] = copy_numbers
+    return sample_list, sample_cn_dict
+
+
+def _process_region_file(file_path, region_index):
+    """
+    Reads one depth file and calculates its copy number per gene region
+    :param file_path: str, path to depth file
+    :param region_index: RegionIndex of gene regions
+    :return: list of baseline depth followed by copy number per region, or
+    None if the depth file is empty (zero for all values)
+    """
+    # create file handle for depth file
+    with open_depth_file(file_path) as file_handle:
+        # extract position and depth data from file
+        positions, depths = load_depth_arrays(file_handle)
+    try:
+        return region_copy_numbers(region_index.assign(positions), depths,
+                                   region_index)
+    except ZeroDivisionError:
+        return None
+
+
+def extract_region_depths_from_matrix(depth_matrix, region_index):
+    """
+    Reads each sample row of a cohort depth matrix and calculates copy number
+    per gene region
+    :param depth_matrix: DepthMatrix, cohort depth matrix store
+    :param region_index: RegionIndex of gene regions
+    :return: sample_list, list of sample names
+    :return: sample_cn_dict, dictionary of sample keys with baseline depth
+    and copy number per region values
+    """
+    sample_list = list(depth_matrix.sample_list)
+    sample_cn_dict = dict()
+    # matrix columns share positions, so regions are assigned once
+    region_ids = region_index.assign(depth_matrix.positions)
+    for sample_name in sample_list:
+        # read one sample row of the memory-mapped matrix
+        depths = depth_matrix.sample_depths(sample_name)
         try:
-            exon1_utr5 = round(_average(exon1_utr5_depths) /
-                               (baseline_depth_avg / 2), 2)
-            intron1 = round(_average(intron1_depths) /
-                            (baseline_depth_avg / 2), 2)
-            exon2 = round(_average(exon2_depths) /
-                          (baseline_depth_avg / 2), 2)
-            intron2 = round(_average(intron2_depths) /
-                            (baseline_depth_avg / 2), 2)
-            exon3 = round(_average(exon3_depths) /
-                          (baseline_depth_avg / 2), 2)
-            intron3 = round(_average(intron3_depths) /
-                            (baseline_depth_avg / 2), 2)
-            exon4 = round(_average(exon4_depths) /
-                          (baseline_depth_avg / 2), 2)
-            intron4 = round(_average(intron4_depths) /
-                            (baseline_depth_avg / 2), 2)
-            exon5 = round(_average(exon5_depths) /
-                          (baseline_depth_avg / 2), 2)
-            intron5 = round(_average(intron5_depths) /
-                            (baseline_depth_avg / 2), 2)
-            exon6 = round(_average(exon6_depths) /
-                          (baseline_depth_avg / 2), 2)
-            intron6 = round(_average(intron6_depths) /
-                            (baseline_depth_avg / 2), 2)
-            exon7_utr3 = round(_average(exon7_utr3_depths) /
-                               (baseline_depth_avg / 2), 2)
-            # add sample copy number per region to dictionary
-            sample_cn_dict[sample_name] = [baseline_depth, exon1_utr5, intron1,
-                                           exon2, intron2, exon3, intron3,
-                                           exon4, intron4, exon5, intron5,
-                                           exon6, intron6, exon7_utr3]
+            # depths end at the last position of the sample's depth file
+            sample_cn_dict[sample_name] = region_copy_numbers(
+                region_ids[:len(depths)], depths, region_index)
         # check for empty depth files (zero for all values)
         except ZeroDivisionError:
             print(f'{sample_name}: ZeroDivisionError, check depth file')
-        file_handle.close()
     return sample_list, sample_cn_dict
 
 
-def _average(depth_list):
-    return sum(depth_list) / len(depth_list)
+def region_copy_numbers(region_ids, depths, region_index):
+    """
+    Calculates baseline depth and copy number per gene region of one sample
+    :param region_ids: numpy array of region indexes of each position
+    :param depths: numpy array of depth values
+    :param region_index: RegionIndex of gene regions
+    :return: list of baseline depth followed by copy number per region
+    :raises ZeroDivisionError: if baseline or a region has no depth
+    """
+    sums, counts = region_index.region_sums(region_ids, depths)
+    return copy_numbers_from_sums(sums, counts, region_index)
 
 
-def print_data_2_file(out_file, sample_list, sample_cn_dict):
-    with open(out_file, 'w') as fh:
+def copy_numbers_from_sums(sums, counts, region_index):
+    """
+    Calculates baseline depth and copy number per gene region from depth
+    sums and position counts per region
+    :param sums: numpy array of depth sums per region of one sample
+    :param counts: numpy array of positions per region
+    :param region_index: RegionIndex of gene regions
+    :return: list of baseline depth followed by copy number per region
+    :raises ZeroDivisionError: if baseline or a region has no depth
+    """
+    if not counts.all():
+        raise ZeroDivisionError('gene region without depth data')
+    # calculate baseline average to be used in calculations
+    baseline_depth_avg = sums[region_index.baseline] / \
+        counts[region_index.baseline]
+    baseline_depth = round(float(baseline_depth_avg), 2)
+    if baseline_depth_avg == 0:
+        raise ZeroDivisionError('baseline depth is zero')
+    # copy number calculations per regions
+    copy_numbers = sums / counts / (baseline_depth_avg / 2)
+    return [baseline_depth] + [round(float(copy_numbers[i]), 2)
+                               for i in region_index.regions]
+
+
+def print_data_2_file(out_file, sample_list, sample_cn_dict, region_names):
+    """
+    Prints baseline depth and copy number per gene region for all samples
+    to a text file
+    :param out_file: string, name of out put file
+    :param sample_list: list, list of sample names
+    :param sample_cn_dict: dictionary of baseline depth and copy number per
+    region values per sample
+    :param region_names: list, names of gene regions in output order
+    :return: None
+    """
+    header_line = ["Sample", "Baseline_depth"] + region_names
+    if is_columnar(out_file):
+        write_columnar(out_file, header_line, sample_list, sample_cn_dict)
+        return
+    with open_output_file(out_file) as fh:
         # write tab delimited header line to file
-        header_line = "\t".join(["Sample", "Baseline_depth", "5'UTR_Exon1",
-                                 "Intron1", "Exon2", "Intron2", "Exon3",
-                                 "Intron3", "Exon4", "Intron4", "Exon5",
-                                 "Intron5", "Exon6", "Intron6", "Exon7_3'UTR"])
+        header_line = "\t".join(header_line)
         fh.write(f'{header_line}\n')
         # write sample data per line to file
         for sample in sample_list:
@@ -171,5 +352,41 @@ def print_data_2_file(out_file, sample_list, sample_cn_dict):
                 print(f'{sample}: KeyError, could not write to file')
 
 
+def get_cli_args():
+    """
+    Get command line options with argparse
+    :return: instance of argparse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Calculate copy number per ABO gene region')
+    parser.add_argument('-m', '--matrix', dest='matrix', type=str,
+                        default=None,
+                        help='read depths from a depth_matrix.py store '
+                             'instead of the depth files')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help='number of processes for reading depth files')
+    parser.add_argument('-r', '--regions', dest='regions', type=str,
+                        default=DEFAULT_REGIONS,
+                        help='BED file of gene regions, including a Baseline '
+                             'region')
+    parser.add_argument('-o', '--outfile', dest='outfile', type=str,
+                        default='copy_number_per_region.txt',
+                        help='name of outfile, gzip compressed if it ends in '
+                             '.gz, or a float32 binary table if it ends in '
+                             '.npz, .parquet or .feather')
+    parser.add_argument('-M', '--manifest', dest='manifest', type=str,
+                        default=None,
+                        help='JSON manifest of per-sample results; only new '
+                             'or changed depth files are read')
+    parser.add_argument('--metrics', dest='metrics', type=str,
+                        default=None,
+                        help='JSON report of wall time, bytes and lines read, '
+                             'samples per second and memory growth per stage')
+    parser.add_argument('--profile', dest='profile', type=str, default=None,
+                        help='cProfile output, hottest functions are added to '
+                             'the metrics report')
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     main()
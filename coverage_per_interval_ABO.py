@@ -10,117 +10,156 @@ line in a text file.
 To run:
 python3 coverage_per_interval_ABO.py
 
+usage: coverage_per_interval_ABO.py [-h] [-m MATRIX] [-j JOBS] [-o OUTFILE]
+                                    [-M MANIFEST] [--metrics METRICS]
+                                    [--profile PROFILE]
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -m MATRIX, --matrix MATRIX
+                        read depths from a depth_matrix.py store instead of
+                        the depth files
+  -j JOBS, --jobs JOBS  number of processes for reading depth files
+  -o OUTFILE, --outfile OUTFILE
+                        name of outfile, gzip compressed if it ends in .gz,
+                        or a float32 binary table if it ends in .npz,
+                        .parquet or .feather
+  -M MANIFEST, --manifest MANIFEST
+                        JSON manifest of per-sample results; only new or
+                        changed depth files are read
+  --metrics METRICS     JSON report of wall time, bytes and lines read,
+                        samples per second and memory growth per stage
+  --profile PROFILE     cProfile output, hottest functions are added to the
+                        metrics report
+
+Depth files may be gzip or bgzip compressed.
+
+With --manifest the average depths of each sample are recorded with the size
+and modification time of its depth file. When the cohort grows or a depth
+file is regenerated, only those files are read and the outfile is rewritten
+for all samples in the file list.
+
+With --metrics the run is split into a read_bin stage, reading depth files
+and averaging their intervals in one streaming pass, and a write stage.
+
 """
 
+import argparse
 import os
 
+from depth_io import (DEPTH_DIR, DEPTH_FILE_LIST, aggregate_depth_file,
+                      average_per_interval, create_list_of_depth_files,
+                      lines_parsed, map_samples, map_samples_with_manifest,
+                      is_columnar, open_depth_file, open_output_file,
+                      write_columnar)
+from depth_matrix import open_depth_matrix
+from run_metrics import RunMetrics
+
 
 def main():
     """
     Iterates through files to extract depth of coverage data and writes
     average depth per 100 bases to a text file.
     """
-    # path to text file containing sample file names
-    path_2_file_list = "/Users/jonathan_stevens/ABO/depth_out.txt"
-    # create list of sample file names
-    file_list = create_list_of_depth_files(path_2_file_list)
-    # create list of sample names
-    # create dictionary of sample keys with depth per 100 base list values
-    sample_list, depth_dict = process_files_from_list(file_list)
+    args = get_cli_args()
+    metrics = RunMetrics('coverage_per_interval_ABO.py', args.metrics,
+                         args.profile, line_counter=lines_parsed)
+    with metrics.stage('read_bin') as stage:
+        if args.matrix:
+            # create dictionary of sample keys with depth per 100 base list
+            # values from the cohort depth matrix
+            sample_list, depth_dict = process_depth_matrix(
+                open_depth_matrix(args.matrix))
+        else:
+            # path to text file containing sample file names
+            path_2_file_list = DEPTH_FILE_LIST
+            # create list of sample file names
+            file_list = create_list_of_depth_files(path_2_file_list)
+            # create list of sample names
+            # create dictionary of sample keys with depth per 100 base list
+            # values
+            sample_list, depth_dict = process_files_from_list(file_list,
+                                                              args.jobs,
+                                                              args.manifest)
+            if not args.manifest:
+                stage['files'] = [os.path.join(DEPTH_DIR, file)
+                                  for file in file_list]
+        stage['samples'] = len(sample_list)
     # generate header for output text file
     header_line = create_file_headers()
     # path to outfile
-    out_file = '1000G_100bp_avg_read_depth_of_coverage.txt'
-    # print data to file
-    print_data_2_file(out_file, header_line, sample_list, depth_dict)
-
-
-def create_list_of_depth_files(text_file):
-    """
-    creates a list of file names from a text file
-    :param text_file: str, name of text file containing file list
-    :return: file_list, list of file names
-    """
-    file_list = list()
-    with open(text_file, 'r') as tf:
-        for line in tf:
-            line = line.strip()
-            file_list.append(line)
-    return file_list
+    out_file = args.outfile
+    with metrics.stage('write') as stage:
+        # print data to file
+        print_data_2_file(out_file, header_line, sample_list, depth_dict)
+        stage['samples'] = len(sample_list)
+        stage['outfile'] = out_file
+    metrics.finish()
 
 
-def process_files_from_list(file_list):
+def process_files_from_list(file_list, jobs=1, manifest=None):
     """
     Opens each file in file_list, extracts sample name and depth data, creates
     100 base intervals, and calculates their average values.
     :param file_list: list, list of file names
+    :param jobs: int, number of processes used to read depth files
+    :param manifest: str, optional path to JSON manifest of per-sample
+    results, only depth files that are new or changed since are read
     :return: sample_list, list of sample names
     :return: depth_dict, dictionary of sample keys with list of depth per 100
     base interval values
     """
     sample_list = list()
-    depth_dict = dict()
+    file_paths = list()
     for file in file_list:
         # append sample name to sample_list
         sample_name = file.split('_')[0]
         sample_list.append(sample_name)
         # specify path to individual depth file
-        basepath = '/Users/jonathan_stevens/ABO/1000G_data/depth/'
-        file_path = os.path.join(basepath, file)
-        # create file handle for depth file
-        file_handle = open(file_path, 'r')
-        # extract depth data from file
-        sample_depth_list = _get_depth_list(file_handle)
-        file_handle.close()
-        # split depth data into 100 base interval lists
-        depth_intervals_list = _create_depth_intervals_list(sample_depth_list)
-        # calculate average value for each interval
-        avg_depth_per_interval = \
-            _calculate_avg_depth_per_interval(depth_intervals_list)
-        # add average depth per interval to dictionary
-        depth_dict[sample_name] = avg_depth_per_interval
+        basepath = DEPTH_DIR
+        file_paths.append(os.path.join(basepath, file))
+    # calculate average values per 100 base interval for each file
+    if manifest:
+        results, _ = map_samples_with_manifest(
+            _process_depth_file, file_paths, manifest, 'coverage', jobs)
+    else:
+        results = map_samples(_process_depth_file, file_paths, jobs)
+    # add average depth per interval to dictionary
+    depth_dict = dict(zip(sample_list, results))
     return sample_list, depth_dict
 
 
-def _get_depth_list(file_handle):
-    """
-    Extracts sample depth of coverage data from column 3 of the text file and
-    returns a list of the values
-    :param file_handle: file object in read mode containing depth data
-    :return: sample_depth_list, a list of depth values from file
-    """
-    sample_depth_list = list()
-    for line in file_handle:
-        line = line.split()
-        # create list of depth values from column 3 of file
-        sample_depth_list.append(int(line[2]))
-    return sample_depth_list
-
-
-def _create_depth_intervals_list(sample_depth_list):
+def _process_depth_file(file_path):
     """
-    Splits the depth list into 100 element lists
-    :param sample_depth_list: list of depth values
-    :return: depth_intervals_list, list of 100 element lists
+    Reads one depth file and calculates the average value of each of its 100
+    base intervals
+    :param file_path: str, path to depth file
+    :return: avg_depth_per_interval, list of average depths per 100 bases
     """
-    depth_intervals_list = list()
-    # divide list into 100 element lists
-    for i in range(0, len(sample_depth_list), 100):
-        depth_intervals_list.append(sample_depth_list[i:i + 100])
-    return depth_intervals_list
+    # create file handle for depth file
+    with open_depth_file(file_path) as file_handle:
+        # stream depth data from file into running 100 base interval sums
+        aggregator = aggregate_depth_file(file_handle)
+    # calculate average value for each 100 base interval
+    return aggregator.interval_averages()
 
 
-def _calculate_avg_depth_per_interval(depth_intervals_list):
+def process_depth_matrix(depth_matrix):
     """
-    Calculates the average depth per interval
-    :param depth_intervals_list: list of depths per 100 bases
-    :return: avg_depth_per_interval, list of average depths per 100 bases
+    Reads each sample row of a cohort depth matrix and calculates average
+    values of its 100 base intervals.
+    :param depth_matrix: DepthMatrix, cohort depth matrix store
+    :return: sample_list, list of sample names
+    :return: depth_dict, dictionary of sample keys with list of depth per 100
+    base interval values
     """
-    avg_depth_per_interval = list()
-    # calculate average of each interval
-    for interval in depth_intervals_list:
-        avg_depth_per_interval.append(round(sum(interval) / len(interval)))
-    return avg_depth_per_interval
+    sample_list = list(depth_matrix.sample_list)
+    depth_dict = dict()
+    for sample_name in sample_list:
+        # read one sample row of the memory-mapped matrix
+        sample_depth_list = depth_matrix.sample_depths(sample_name)
+        depth_dict[sample_name] = average_per_interval(sample_depth_list)
+    return sample_list, depth_dict
 
 
 def create_file_headers():
@@ -146,7 +185,10 @@ def print_data_2_file(out_file, header_line, sample_list, depth_dict):
     :param depth_dict: dictionary, sample keys with list of depth values
     :return: None
     """
-    with open(out_file, 'w') as fh:
+    if is_columnar(out_file):
+        write_columnar(out_file, header_line, sample_list, depth_dict)
+        return
+    with open_output_file(out_file) as fh:
         # write tab delimited header line to file
         header_line_joined = "\t".join(header_line)
         fh.write(f'{header_line_joined}\n')
@@ -157,5 +199,37 @@ def print_data_2_file(out_file, header_line, sample_list, depth_dict):
             fh.write(f'{sample_line}\n')
 
 
+def get_cli_args():
+    """
+    Get command line options with argparse
+    :return: instance of argparse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Calculate average depth of coverage per 100 bases')
+    parser.add_argument('-m', '--matrix', dest='matrix', type=str,
+                        default=None,
+                        help='read depths from a depth_matrix.py store '
+                             'instead of the depth files')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help='number of processes for reading depth files')
+    parser.add_argument('-o', '--outfile', dest='outfile', type=str,
+                        default='1000G_100bp_avg_read_depth_of_coverage.txt',
+                        help='name of outfile, gzip compressed if it ends in '
+                             '.gz, or a float32 binary table if it ends in '
+                             '.npz, .parquet or .feather')
+    parser.add_argument('-M', '--manifest', dest='manifest', type=str,
+                        default=None,
+                        help='JSON manifest of per-sample results; only new '
+                             'or changed depth files are read')
+    parser.add_argument('--metrics', dest='metrics', type=str,
+                        default=None,
+                        help='JSON report of wall time, bytes and lines read, '
+                             'samples per second and memory growth per stage')
+    parser.add_argument('--profile', dest='profile', type=str, default=None,
+                        help='cProfile output, hottest functions are added to '
+                             'the metrics report')
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,356 @@
+#! /usr/bin/env python3
+# coverage_pyramid.py
+
+"""
+Builds a multi-resolution coverage pyramid from a depth_matrix.py store, with
+mean, minimum and maximum depth per bin at several bin sizes for every sample
+and for the whole cohort, and reads zoomed views of the ABO window from it.
+A query only reads the arrays of the requested level.
+
+A pyramid store is a directory containing:
+  pyramid.json           chromosome, window and bin sizes of the levels
+  samples.txt            sample names, one per line, in array row order
+  {stat}_{size}.npy      samples x bins array of one statistic and level
+  cohort_{size}.npy      3 x bins array of cohort mean, minimum and maximum
+At the 1 base level mean, minimum and maximum are the depths themselves and
+are stored once as depth_1.npy.
+
+Positions past the end of a sample's depth file, such as all positions of
+an empty file, are not covered: their depths are NaN, sample statistics use
+only covered positions and are NaN for bins without any, and the cohort
+statistics of a bin leave out samples not covering it. NaN values are
+written as NA by queries.
+
+To build a pyramid:
+python3 coverage_pyramid.py -m [MATRIX] -o [PYRAMID]
+
+To write mean depth per 1 kb bin of part of the window for all samples:
+python3 coverage_pyramid.py -o [PYRAMID] -r chr9:133255176-133300000 -z 1000
+
+usage: coverage_pyramid.py [-h] [-m MATRIX] [-o PYRAMID] [-L LEVELS]
+                           [-r REGION] [-z LEVEL] [-t {mean,min,max}]
+                           [-f OUTFILE]
+
+Build or query a multi-resolution ABO coverage pyramid
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -m MATRIX, --matrix MATRIX
+                        depth_matrix.py store to build the pyramid from
+  -o PYRAMID, --pyramid PYRAMID
+                        directory of the pyramid store
+  -L LEVELS, --levels LEVELS
+                        comma separated bin sizes of the pyramid levels
+  -r REGION, --region REGION
+                        region to query, chrom:start-end
+  -z LEVEL, --level LEVEL
+                        bin size to query, defaults to the finest level with
+                        at most 2000 bins in the region
+  -t {mean,min,max}, --stat {mean,min,max}
+                        statistic to query
+  -f OUTFILE, --outfile OUTFILE
+                        name of query outfile
+
+"""
+
+import argparse
+import json
+import os
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from depth_io import open_output_file
+from depth_matrix import open_depth_matrix
+
+DEFAULT_LEVELS = (1, 10, 100, 1000, 10000)
+STATS = ('mean', 'min', 'max')
+# number of sample rows summarised at once while building
+ROW_CHUNK = 64
+
+
+class CoveragePyramid:
+    """
+    Read only view of a pyramid store, opening level arrays memory-mapped on
+    first use
+    """
+
+    def __init__(self, store_dir):
+        """
+        :param store_dir: str, directory of pyramid store
+        """
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'pyramid.json'), 'r') as fh:
+            meta = json.load(fh)
+        self.chrom = meta['chrom']
+        self.start = meta['start']
+        self.end = meta['end']
+        self.levels = meta['levels']
+        with open(os.path.join(store_dir, 'samples.txt'), 'r') as fh:
+            self.sample_list = [line.strip() for line in fh]
+        self.sample_index = {
+            sample: row for row, sample in enumerate(self.sample_list)}
+        self._arrays = dict()
+
+    def level(self, size, stat='mean', cohort=False):
+        """
+        Opens the array of one statistic at one level
+        :param size: int, bin size of level
+        :param stat: str, one of mean, min or max
+        :param cohort: bool, open the cohort summary instead of the samples
+        :return: memmap, samples x bins array, or bins array if cohort
+        """
+        if size not in self.levels:
+            raise ValueError(f'no {size} base level in pyramid, levels are '
+                             f'{self.levels}')
+        if stat not in STATS:
+            raise ValueError(f'unknown statistic {stat}, use one of {STATS}')
+        name = _level_name(size, 'cohort' if cohort else stat)
+        if name not in self._arrays:
+            self._arrays[name] = numpy.load(
+                os.path.join(self.store_dir, f'{name}.npy'), mmap_mode='r')
+        if cohort:
+            return self._arrays[name][STATS.index(stat)]
+        return self._arrays[name]
+
+    def choose_level(self, start, end, max_bins=2000):
+        """
+        Finds the finest level showing a region in at most max_bins bins
+        :param start: int, first position of region
+        :param end: int, last position of region
+        :param max_bins: int, maximum number of bins to return
+        :return: int, bin size of level
+        """
+        for size in sorted(self.levels):
+            if (end - start) // size + 1 <= max_bins:
+                return size
+        return max(self.levels)
+
+    def query(self, start, end, size, stat='mean', samples=None):
+        """
+        Reads the bins of one level overlapping a region
+        :param start: int, first position of region
+        :param end: int, last position of region (inclusive)
+        :param size: int, bin size of level
+        :param stat: str, one of mean, min or max
+        :param samples: list of sample names, defaults to all samples
+        :return: bin_starts, numpy array of first position of each bin
+        :return: values, numpy array of samples x bins values
+        :return: cohort_values, numpy array of cohort values per bin
+        """
+        first, last = self._bins(start, end, size)
+        values = self.level(size, stat)
+        if samples is None:
+            values = values[:, first:last]
+        else:
+            rows = [self.sample_index[sample] for sample in samples]
+            values = values[rows, first:last]
+        cohort_values = self.level(size, stat, cohort=True)[first:last]
+        bin_starts = self.start + size * numpy.arange(first, last)
+        return bin_starts, values, cohort_values
+
+    def _bins(self, start, end, size):
+        start = max(start, self.start)
+        end = min(end, self.end)
+        if end < start:
+            raise IndexError(f'{self.chrom}:{start}-{end} outside of pyramid '
+                             f'window {self.chrom}:{self.start}-{self.end}')
+        return (start - self.start) // size, (end - self.start) // size + 1
+
+
+def main():
+    args = get_cli_args()
+    if args.matrix:
+        levels = [int(size) for size in args.levels.split(',')]
+        pyramid = build_pyramid(open_depth_matrix(args.matrix), args.pyramid,
+                                levels)
+        print(f'{len(pyramid.sample_list)} samples written to '
+              f'{args.pyramid} at levels {pyramid.levels}')
+    if args.region:
+        pyramid = CoveragePyramid(args.pyramid)
+        chrom, start, end = parse_region(args.region)
+        if chrom != pyramid.chrom:
+            raise ValueError(f'pyramid covers {pyramid.chrom}, not {chrom}')
+        size = args.level or pyramid.choose_level(start, end)
+        bin_starts, values, cohort_values = pyramid.query(
+            start, end, size, args.stat)
+        # sample depths, minima and maxima are whole numbers
+        print_query_2_file(args.outfile, pyramid, bin_starts, values,
+                           cohort_values, args.stat,
+                           integral=size == 1 or args.stat != 'mean')
+
+
+def parse_region(region):
+    """
+    Splits a samtools style region string
+    :param region: str, chrom:start-end
+    :return: chrom, str
+    :return: start, int
+    :return: end, int
+    """
+    chrom, coordinates = region.rsplit(':', 1)
+    start, end = coordinates.replace(',', '').split('-')
+    return chrom, int(start), int(end)
+
+
+def build_pyramid(depth_matrix, store_dir, levels=DEFAULT_LEVELS):
+    """
+    Summarises every level of the pyramid from the depth matrix, reading a
+    block of sample rows at a time. Positions a sample's depth file does not
+    cover are left out of its statistics and of the cohort statistics.
+    :param depth_matrix: DepthMatrix, cohort depth matrix store
+    :param store_dir: str, directory to write the pyramid store to
+    :param levels: list of int bin sizes
+    :return: CoveragePyramid opened on the written store
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    levels = sorted(set(levels))
+    n_samples, n_positions = depth_matrix.depths.shape
+    boundaries = dict()
+    arrays = dict()
+    cohort_sums = dict()
+    cohort_counts = dict()
+    cohort = dict()
+    for size in levels:
+        # bins start at the window start, the last bin may be shorter
+        boundaries[size] = numpy.arange(0, n_positions, size)
+        n_bins = len(boundaries[size])
+        # float32 holds every depth of a bin exactly, and NaN if uncovered
+        for stat in (('depth',) if size == 1 else STATS):
+            arrays[size, stat] = open_memmap(
+                os.path.join(store_dir, f'{_level_name(size, stat)}.npy'),
+                mode='w+', dtype=numpy.float32, shape=(n_samples, n_bins))
+        cohort_sums[size] = numpy.zeros(n_bins, dtype=numpy.float64)
+        cohort_counts[size] = numpy.zeros(n_bins, dtype=numpy.int64)
+        cohort[size] = open_memmap(
+            os.path.join(store_dir, f'{_level_name(size, "cohort")}.npy'),
+            mode='w+', dtype=numpy.float32, shape=(len(STATS), n_bins))
+        cohort[size][:] = numpy.nan
+
+    for first in range(0, n_samples, ROW_CHUNK):
+        rows = slice(first, min(first + ROW_CHUNK, n_samples))
+        # positions past the end of a sample's depth file are not covered
+        covered = numpy.arange(n_positions) < \
+            depth_matrix.lengths[rows, numpy.newaxis]
+        depths = numpy.where(covered, depth_matrix.depths[rows],
+                             numpy.nan).astype(numpy.float32)
+        for size in levels:
+            if size == 1:
+                arrays[size, 'depth'][rows] = depths
+                means = mins = maxs = depths
+            else:
+                # average only covered positions, NaN for bins without any
+                sums = numpy.add.reduceat(numpy.nan_to_num(depths),
+                                          boundaries[size], axis=1,
+                                          dtype=numpy.float64)
+                counts = numpy.add.reduceat(covered, boundaries[size],
+                                            axis=1, dtype=numpy.int64)
+                with numpy.errstate(invalid='ignore', divide='ignore'):
+                    means = sums / counts
+                # fmin and fmax ignore NaN unless all values are NaN
+                mins = numpy.fmin.reduceat(depths, boundaries[size], axis=1)
+                maxs = numpy.fmax.reduceat(depths, boundaries[size], axis=1)
+                arrays[size, 'mean'][rows] = means
+                arrays[size, 'min'][rows] = mins
+                arrays[size, 'max'][rows] = maxs
+            # cohort mean is the mean of the sample means of covered bins
+            cohort_sums[size] += numpy.nansum(means, axis=0)
+            cohort_counts[size] += numpy.count_nonzero(~numpy.isnan(means),
+                                                       axis=0)
+            cohort[size][1] = numpy.fmin(cohort[size][1],
+                                         numpy.fmin.reduce(mins, axis=0))
+            cohort[size][2] = numpy.fmax(cohort[size][2],
+                                         numpy.fmax.reduce(maxs, axis=0))
+
+    for size in levels:
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            cohort[size][0] = cohort_sums[size] / cohort_counts[size]
+        cohort[size].flush()
+    for array in arrays.values():
+        array.flush()
+    del arrays, cohort
+
+    with open(os.path.join(store_dir, 'samples.txt'), 'w') as fh:
+        for sample in depth_matrix.sample_list:
+            fh.write(f'{sample}\n')
+    with open(os.path.join(store_dir, 'pyramid.json'), 'w') as fh:
+        json.dump({'chrom': depth_matrix.chrom, 'start': depth_matrix.start,
+                   'end': depth_matrix.end, 'levels': levels}, fh)
+    return CoveragePyramid(store_dir)
+
+
+def _level_name(size, stat):
+    # the 1 base level stores depths once for all statistics
+    if size == 1 and stat in STATS:
+        stat = 'depth'
+    return f'{stat}_{size}'
+
+
+def print_query_2_file(out_file, pyramid, bin_starts, values, cohort_values,
+                       stat, integral=False):
+    """
+    Prints queried bin values for all samples and the cohort to a text file
+    :param out_file: string, name of out put file
+    :param pyramid: CoveragePyramid, queried pyramid
+    :param bin_starts: numpy array of first position of each bin
+    :param values: numpy array of samples x bins values
+    :param cohort_values: numpy array of cohort values per bin
+    :param stat: str, queried statistic
+    :param integral: bool, write sample values as integers
+    :return: None
+    """
+    with open_output_file(out_file) as fh:
+        # write tab delimited header line to file
+        header_line = ['Sample'] + [f'{pyramid.chrom}:{i}' for i in
+                                    bin_starts]
+        fh.write('\t'.join(header_line) + '\n')
+        # write sample data per line to file
+        for sample, row in zip(pyramid.sample_list, values):
+            fh.write('\t'.join([sample] + _format_values(row, integral)) +
+                     '\n')
+        fh.write('\t'.join([f'Cohort_{stat}'] +
+                           _format_values(cohort_values)) + '\n')
+
+
+def _format_values(values, integral=False):
+    # bins not covered by a sample, or by any sample, hold NaN
+    return ['NA' if value != value else
+            str(int(value)) if integral else str(round(value, 2))
+            for value in values.tolist()]
+
+
+def get_cli_args():
+    """
+    Get command line options with argparse
+    :return: instance of argparse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Build or query a multi-resolution ABO coverage pyramid')
+    parser.add_argument('-m', '--matrix', dest='matrix', type=str,
+                        default=None,
+                        help='depth_matrix.py store to build the pyramid '
+                             'from')
+    parser.add_argument('-o', '--pyramid', dest='pyramid', type=str,
+                        default='1000G_coverage_pyramid',
+                        help='directory of the pyramid store')
+    parser.add_argument('-L', '--levels', dest='levels', type=str,
+                        default=','.join(str(i) for i in DEFAULT_LEVELS),
+                        help='comma separated bin sizes of the pyramid '
+                             'levels')
+    parser.add_argument('-r', '--region', dest='region', type=str,
+                        default=None,
+                        help='region to query, chrom:start-end')
+    parser.add_argument('-z', '--level', dest='level', type=int,
+                        default=None,
+                        help='bin size to query, defaults to the finest level '
+                             'with at most 2000 bins in the region')
+    parser.add_argument('-t', '--stat', dest='stat', choices=STATS,
+                        default='mean', help='statistic to query')
+    parser.add_argument('-f', '--outfile', dest='outfile', type=str,
+                        default='coverage_pyramid_query.txt',
+                        help='name of query outfile')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
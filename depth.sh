@@ -1,7 +1,7 @@
 #! /usr/bin/env bash
 # depth.sh
 
-# Process all cram files in a directory
+# Process all cram files in a directory with depth_driver.py
 # Determine ABO gene sequence depth with samtools depth command
 # samtools depth -a -r chr9:133255176-133385146 [*.cram] -o [*.txt]
 
@@ -15,24 +15,14 @@ depthOutPath="/Users/jonathan_stevens/ABO/1000G_data/depth/"
 # output file extension
 outSuffix="_ABO_pos_read_depth_of_coverage.txt"
 
-# create output directory
-mkdir -p $depthOutPath
-
-# loop through all cram files in $cramPath
+# run samtools depth for all cram files with a bounded pool of jobs,
+# skipping outputs that are newer than their cram file and retrying failures
+# (see depth_driver.py -h for concurrency and thread options)
 function depth {
-    for cram in $cramPath*$cramSuffix
-    do
-        # Remove path from filename
-        pathRemoved="${cram/$cramPath/}"
-        # Remove suffix to get file name
-        sampleName="${pathRemoved/$cramSuffix/}"
-        samtools depth -a -r chr9:133255176-133385146 \
-        $cramPath$sampleName$cramSuffix \
-        -o $depthOutPath$sampleName$outSuffix
-        echo $sampleName$outSuffix
-    done
+    python3 "$(dirname "$0")/depth_driver.py" \
+        --cram-dir "$cramPath" --cram-suffix "$cramSuffix" \
+        --depth-dir "$depthOutPath" --out-suffix "$outSuffix" \
+        --log depth_log.jsonl --file-list depth_out.txt "$@"
 }
 
-depth 1>depth.out 2>depth.err &
-
-
+depth "$@" 1>depth.out 2>depth.err &
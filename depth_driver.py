@@ -0,0 +1,297 @@
+#! /usr/bin/env python3
+# depth_driver.py
+
+"""
+Runs samtools depth on every CRAM file in a directory to determine ABO gene
+sequence depth with a bounded pool of concurrent jobs. Outputs that are
+already newer than their CRAM file are skipped, failed jobs are retried, and
+the runtime of each sample is written to a JSON lines log, so re-running
+after a partial failure only redoes the missing samples. Log entries of
+failed samples hold the exit status and error output of the last attempt,
+and failed attempts before a success or final failure are listed under
+failed_attempts. With --compress samtools output is gzip compressed on the
+fly and depth files are written as *.gz, which every depth reader opens
+transparently.
+
+samtools depth -a -r chr9:133255176-133385146 -@ THREADS [*.cram] -o [*.txt]
+
+usage: depth_driver.py [-h] [-c CRAM_DIR] [-x CRAM_SUFFIX] [-d DEPTH_DIR]
+                       [-s OUT_SUFFIX] [-r REGION] [-T REFERENCE] [-j JOBS]
+                       [-t THREADS] [-n RETRIES] [-l LOG] [-f FILE_LIST]
+                       [-z]
+
+Run samtools depth on CRAM files with a bounded pool of jobs
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -c CRAM_DIR, --cram-dir CRAM_DIR
+                        directory containing CRAM files
+  -x CRAM_SUFFIX, --cram-suffix CRAM_SUFFIX
+                        CRAM file name suffix following the sample name
+  -d DEPTH_DIR, --depth-dir DEPTH_DIR
+                        output directory for depth files
+  -s OUT_SUFFIX, --out-suffix OUT_SUFFIX
+                        depth file name suffix following the sample name
+  -r REGION, --region REGION
+                        region passed to samtools depth -r
+  -T REFERENCE, --reference REFERENCE
+                        reference FASTA for CRAM decoding
+  -j JOBS, --jobs JOBS  number of concurrent samtools jobs
+  -t THREADS, --threads THREADS
+                        extra decompression threads per samtools job
+  -n RETRIES, --retries RETRIES
+                        number of retries of failed jobs
+  -l LOG, --log LOG     JSON lines log of per sample runtime
+  -f FILE_LIST, --file-list FILE_LIST
+                        text file to write completed depth file names to
+  -z, --compress        gzip compress depth files
+
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from depth_io import COMPRESS_LEVEL, GzipFile
+
+
+def main():
+    args = get_cli_args()
+    os.makedirs(args.depth_dir, exist_ok=True)
+    # create list of (sample name, cram path, depth file path) jobs
+    out_suffix = args.out_suffix
+    if args.compress and not out_suffix.endswith('.gz'):
+        out_suffix += '.gz'
+    jobs = create_depth_jobs(args.cram_dir, args.cram_suffix, args.depth_dir,
+                             out_suffix)
+    results = run_depth_jobs(jobs, args.region, args.reference, args.jobs,
+                             args.threads, args.retries, args.log,
+                             args.compress)
+    failed = [result['sample'] for result in results
+              if result['status'] == 'failed']
+    if args.file_list:
+        write_file_list(args.file_list, results)
+    print(f'{len(results) - len(failed)} of {len(results)} samples done')
+    for sample in failed:
+        print(f'{sample}: samtools depth failed, see {args.log}')
+
+
+def create_depth_jobs(cram_dir, cram_suffix, depth_dir, out_suffix):
+    """
+    Creates one depth job per CRAM file in a directory
+    :param cram_dir: str, directory containing CRAM files
+    :param cram_suffix: str, CRAM file name suffix following the sample name
+    :param depth_dir: str, output directory for depth files
+    :param out_suffix: str, depth file name suffix following the sample name
+    :return: jobs, list of (sample name, cram path, depth path) tuples
+    """
+    jobs = list()
+    for file in sorted(os.listdir(cram_dir)):
+        if not file.endswith(cram_suffix):
+            continue
+        # remove suffix to get sample name
+        sample_name = file[:-len(cram_suffix)]
+        jobs.append((sample_name, os.path.join(cram_dir, file),
+                     os.path.join(depth_dir, f'{sample_name}{out_suffix}')))
+    return jobs
+
+
+def is_up_to_date(cram_path, depth_path):
+    """
+    Checks whether a depth file exists and is newer than its CRAM file
+    :param cram_path: str, path to CRAM file
+    :param depth_path: str, path to depth file
+    :return: bool
+    """
+    try:
+        return os.path.getmtime(depth_path) >= os.path.getmtime(cram_path)
+    except OSError:
+        return False
+
+
+def run_depth_jobs(jobs, region, reference=None, max_jobs=1, threads=0,
+                   retries=1, log_file=None, compress=False):
+    """
+    Runs samtools depth jobs on a bounded thread pool, each thread waiting
+    on one samtools process
+    :param jobs: list of (sample name, cram path, depth path) tuples
+    :param region: str, region passed to samtools depth -r
+    :param reference: str, optional reference FASTA for CRAM decoding
+    :param max_jobs: int, number of concurrent samtools jobs
+    :param threads: int, extra decompression threads per samtools job
+    :param retries: int, number of retries of failed jobs
+    :param log_file: str, optional JSON lines log of per sample runtime
+    :param compress: bool, gzip compress depth files
+    :return: results, list of per sample result dictionaries in job order
+    """
+    log_handle = open(log_file, 'a') if log_file else None
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_jobs)) as executor:
+            futures = [executor.submit(_run_depth_job, job, region,
+                                       reference, threads, retries, compress)
+                       for job in jobs]
+            # log each job as soon as it finishes
+            for future in as_completed(futures):
+                if log_handle:
+                    log_handle.write(f'{json.dumps(future.result())}\n')
+                    log_handle.flush()
+            results = [future.result() for future in futures]
+    finally:
+        if log_handle:
+            log_handle.close()
+    return results
+
+
+def _run_depth_job(job, region, reference, threads, retries,
+                   compress=False):
+    """
+    Runs samtools depth for one sample unless its output is up to date
+    :param job: tuple of sample name, cram path and depth path
+    :param region: str, region passed to samtools depth -r
+    :param reference: str, optional reference FASTA for CRAM decoding
+    :param threads: int, extra decompression threads
+    :param retries: int, number of retries if samtools fails
+    :param compress: bool, gzip compress samtools output
+    :return: result, dictionary describing the job outcome, with the
+    returncode and stderr of the last attempt if all attempts failed
+    """
+    sample_name, cram_path, depth_path = job
+    result = {'sample': sample_name, 'cram': cram_path, 'output': depth_path,
+              'status': 'skipped', 'attempts': 0, 'seconds': 0.0}
+    if is_up_to_date(cram_path, depth_path):
+        return result
+    command = ['samtools', 'depth', '-a', '-r', region]
+    if threads:
+        command += ['-@', str(threads)]
+    if reference:
+        command += ['--reference', reference]
+    # write to a temporary file so interrupted jobs never look complete
+    tmp_path = f'{depth_path}.tmp'
+    command.append(cram_path)
+    if not compress:
+        command += ['-o', tmp_path]
+    start_time = time.time()
+    for attempt in range(1, retries + 2):
+        result['attempts'] = attempt
+        try:
+            if compress:
+                returncode, stderr = _run_compressed(command, tmp_path)
+            else:
+                process = subprocess.run(command, stderr=subprocess.PIPE,
+                                         universal_newlines=True)
+                returncode = process.returncode
+                stderr = process.stderr.strip()
+        except OSError as error:
+            returncode = None
+            stderr = str(error)
+        if returncode == 0:
+            os.replace(tmp_path, depth_path)
+            result['status'] = 'done'
+            break
+        # keep failed attempts apart so a later success is not logged as
+        # failed
+        result.setdefault('failed_attempts', list()).append(
+            {'attempt': attempt, 'returncode': returncode, 'stderr': stderr})
+    else:
+        result['status'] = 'failed'
+        result['returncode'] = returncode
+        result['stderr'] = stderr
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    result['seconds'] = round(time.time() - start_time, 3)
+    return result
+
+
+def _run_compressed(command, out_path):
+    """
+    Runs a command and gzip compresses its standard output into a file
+    :param command: list of command arguments
+    :param out_path: str, path of compressed output file
+    :return: returncode, int, exit status of command
+    :return: stderr, str, standard error of command
+    """
+    # collect stderr in a file so a full pipe cannot block samtools
+    with tempfile.TemporaryFile() as err, open(out_path, 'wb') as raw, \
+            GzipFile(fileobj=raw, mode='wb',
+                     compresslevel=COMPRESS_LEVEL) as out, \
+            subprocess.Popen(command, stdout=subprocess.PIPE,
+                             stderr=err) as process:
+        shutil.copyfileobj(process.stdout, out)
+        process.wait()
+        err.seek(0)
+        stderr = err.read().decode(errors='replace').strip()
+    return process.returncode, stderr
+
+
+def write_file_list(out_file, results):
+    """
+    Writes names of completed and up to date depth files to a text file
+    :param out_file: str, name of file list
+    :param results: list of per sample result dictionaries
+    :return: None
+    """
+    with open(out_file, 'w') as fh:
+        for result in results:
+            if result['status'] != 'failed':
+                fh.write(f'{os.path.basename(result["output"])}\n')
+
+
+def get_cli_args():
+    """
+    Get command line options with argparse
+    :return: instance of argparse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Run samtools depth on CRAM files with a bounded pool of '
+                    'jobs')
+    parser.add_argument('-c', '--cram-dir', dest='cram_dir', type=str,
+                        default='/Users/jonathan_stevens/ABO/1000G_data/'
+                                'cram/',
+                        help='directory containing CRAM files')
+    parser.add_argument('-x', '--cram-suffix', dest='cram_suffix', type=str,
+                        default='.extract_for_bloodantigens-full_gene_master'
+                                '.cram',
+                        help='CRAM file name suffix following the sample '
+                             'name')
+    parser.add_argument('-d', '--depth-dir', dest='depth_dir', type=str,
+                        default='/Users/jonathan_stevens/ABO/1000G_data/'
+                                'depth/',
+                        help='output directory for depth files')
+    parser.add_argument('-s', '--out-suffix', dest='out_suffix', type=str,
+                        default='_ABO_pos_read_depth_of_coverage.txt',
+                        help='depth file name suffix following the sample '
+                             'name')
+    parser.add_argument('-r', '--region', dest='region', type=str,
+                        default='chr9:133255176-133385146',
+                        help='region passed to samtools depth -r')
+    parser.add_argument('-T', '--reference', dest='reference', type=str,
+                        default=None,
+                        help='reference FASTA for CRAM decoding')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        default=os.cpu_count() or 1,
+                        help='number of concurrent samtools jobs')
+    parser.add_argument('-t', '--threads', dest='threads', type=int,
+                        default=0,
+                        help='extra decompression threads per samtools job')
+    parser.add_argument('-n', '--retries', dest='retries', type=int,
+                        default=1, help='number of retries of failed jobs')
+    parser.add_argument('-l', '--log', dest='log', type=str,
+                        default='depth_log.jsonl',
+                        help='JSON lines log of per sample runtime')
+    parser.add_argument('-f', '--file-list', dest='file_list', type=str,
+                        default=None,
+                        help='text file to write completed depth file names '
+                             'to')
+    parser.add_argument('-z', '--compress', dest='compress',
+                        action='store_true',
+                        help='gzip compress depth files')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
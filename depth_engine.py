@@ -0,0 +1,247 @@
+#! /usr/bin/env python3
+# depth_engine.py
+
+"""
+Computes per base ABO gene depth of coverage directly from indexed BAM or
+CRAM files with pysam, and writes average depth per 100 bases, copy number
+per 100 base interval and copy number per gene region without writing and
+re-reading samtools depth text files.
+
+Depth matches samtools depth -a -r chr9:133255176-133385146: reads that are
+unmapped, secondary, QC failed or duplicates are skipped, and deletions and
+reference skips are not counted. Outfiles named *.gz are written gzip
+compressed, and outfiles named *.npz, *.parquet or *.feather as float32
+binary tables.
+
+usage: depth_engine.py [-h] [-l ALIGNMENT_LIST] [-T REFERENCE] [-s START]
+                       [-i INTERVAL] [-q MIN_MAPQ] [-r REGIONS]
+                       [-c COVERAGE_OUT] [-n COPY_NUMBER_OUT]
+                       [-g REGION_OUT] [-j JOBS]
+
+Calculate ABO depth of coverage and copy number from BAM/CRAM files
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -l ALIGNMENT_LIST, --alignment-list ALIGNMENT_LIST
+                        text file listing indexed BAM/CRAM file paths
+  -T REFERENCE, --reference REFERENCE
+                        reference FASTA for CRAM decoding
+  -s START, --start START
+                        start position for copy number baseline interval
+  -i INTERVAL, --interval INTERVAL
+                        length of copy number baseline interval
+  -q MIN_MAPQ, --min-mapq MIN_MAPQ
+                        minimum mapping quality of counted reads
+  -r REGIONS, --regions REGIONS
+                        BED file of gene regions, including a Baseline region
+  -c COVERAGE_OUT, --coverage-out COVERAGE_OUT
+                        name of average depth per 100 bases outfile
+  -n COPY_NUMBER_OUT, --copy-number-out COPY_NUMBER_OUT
+                        name of copy number per 100 bases outfile
+  -g REGION_OUT, --region-out REGION_OUT
+                        name of copy number per gene region outfile
+  -j JOBS, --jobs JOBS  number of processes for reading alignment files
+
+"""
+
+import argparse
+import os
+from functools import partial
+
+import numpy
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+import copy_number_per_region
+from depth_io import DEPTH_DTYPE, POSITION_DTYPE, map_samples
+from depth_matrix import CHROM, WINDOW_END, WINDOW_START
+from depth_pipeline import DepthAggregator, create_result_dicts, write_outputs
+
+# samtools depth default filter: UNMAP, SECONDARY, QCFAIL and DUP flags
+EXCLUDED_FLAGS = 0x4 | 0x100 | 0x200 | 0x400
+
+
+def main():
+    args = get_cli_args()
+    # convert start position to list index
+    start = abs(WINDOW_START - args.start)
+    region_index = copy_number_per_region.load_regions(args.regions)
+    # create list of alignment file paths
+    alignment_list = create_list_of_alignment_files(args.alignment_list)
+    sample_list, depth_dict, depth_1000_dict, cn_depth_dict, \
+        sample_cn_dict = process_alignments(
+            alignment_list, start, args.interval, region_index,
+            args.reference, args.min_mapq, args.jobs)
+    write_outputs(args.coverage_out, args.copy_number_out, args.region_out,
+                  sample_list, depth_dict, depth_1000_dict, cn_depth_dict,
+                  sample_cn_dict, region_index)
+
+
+def create_list_of_alignment_files(text_file):
+    """
+    creates a list of alignment file paths from a text file
+    :param text_file: str, name of text file containing file list
+    :return: alignment_list, list of file paths
+    """
+    alignment_list = list()
+    with open(text_file, 'r') as tf:
+        for line in tf:
+            line = line.strip()
+            if line:
+                alignment_list.append(line)
+    return alignment_list
+
+
+def process_alignments(alignment_list, start, interval, region_index,
+                       reference=None, min_mapq=0, jobs=1):
+    """
+    Computes depth for each alignment file and aggregates it into 100 base
+    interval averages, baseline depths and copy number per gene region.
+    :param alignment_list: list of BAM/CRAM file paths
+    :param start: int, starting index of baseline interval
+    :param interval: int, length of interval
+    :param region_index: RegionIndex of gene regions
+    :param reference: str, optional reference FASTA for CRAM decoding
+    :param min_mapq: int, minimum mapping quality of counted reads
+    :param jobs: int, number of processes used to read alignment files
+    :return: sample_list, list of sample names
+    :return: depth_dict, dictionary of sample keys with list of depth per 100
+    base interval values
+    :return: depth_1000_dict, dictionary of sample keys with baseline depths
+    :return: cn_depth_dict, dictionary of sample keys with list of depth per
+    100 base interval values of samples with a baseline depth
+    :return: sample_cn_dict, dictionary of sample keys with baseline depth
+    and copy number per region values
+    """
+    # sample names are the file name prefix before the first dot
+    sample_list = [os.path.basename(path).split('.')[0]
+                   for path in alignment_list]
+    results = map_samples(
+        partial(_process_alignment, start=start, interval=interval,
+                region_index=region_index, reference=reference,
+                min_mapq=min_mapq), alignment_list, jobs)
+    return (sample_list,) + create_result_dicts(sample_list, results,
+                                                'alignment file')
+
+
+def _process_alignment(alignment_path, start, interval, region_index,
+                       reference=None, min_mapq=0):
+    """
+    Computes depth of one alignment file and aggregates it for all three
+    outputs
+    :param alignment_path: str, path to indexed BAM/CRAM file
+    :param start: int, starting index of baseline interval
+    :param interval: int, length of interval
+    :param region_index: RegionIndex of gene regions
+    :param reference: str, optional reference FASTA for CRAM decoding
+    :param min_mapq: int, minimum mapping quality of counted reads
+    :return: tuple of avg_depth_per_interval, depth_1000,
+    cn_depth_per_interval and copy_numbers of DepthAggregator.sample_results
+    """
+    with open_alignment_file(alignment_path, reference) as alignment_file:
+        positions, depths = compute_depth(alignment_file,
+                                          min_mapq=min_mapq)
+    aggregator = DepthAggregator(start, interval, region_index)
+    aggregator.update(positions, depths)
+    return aggregator.sample_results()[0]
+
+
+def open_alignment_file(alignment_path, reference=None):
+    """
+    Opens an indexed BAM or CRAM file with pysam
+    :param alignment_path: str, path to BAM/CRAM file
+    :param reference: str, optional reference FASTA for CRAM decoding
+    :return: pysam.AlignmentFile
+    """
+    if pysam is None:
+        raise ImportError('pysam is required to read BAM/CRAM files: '
+                          'pip install pysam')
+    mode = 'rc' if alignment_path.endswith('.cram') else 'rb'
+    return pysam.AlignmentFile(alignment_path, mode,
+                               reference_filename=reference)
+
+
+def compute_depth(alignment_file, chrom=CHROM, start=WINDOW_START,
+                  end=WINDOW_END, min_mapq=0):
+    """
+    Computes depth at every position of a region, including zero depth
+    positions, from the aligned blocks of reads overlapping it
+    :param alignment_file: pysam.AlignmentFile opened with an index
+    :param chrom: str, chromosome name
+    :param start: int, first position of region (1-based)
+    :param end: int, last position of region (1-based, inclusive)
+    :param min_mapq: int, minimum mapping quality of counted reads
+    :return: positions, numpy array of positions start to end
+    :return: depths, numpy array of depth values per position
+    """
+    length = end - start + 1
+    offset = start - 1
+    block_starts = list()
+    block_ends = list()
+    for read in alignment_file.fetch(chrom, offset, end):
+        if read.flag & EXCLUDED_FLAGS or read.mapping_quality < min_mapq:
+            continue
+        # aligned blocks exclude insertions, deletions and reference skips
+        for block_start, block_end in read.get_blocks():
+            block_starts.append(block_start - offset)
+            block_ends.append(block_end - offset)
+    # count block starts and ends per position, then accumulate
+    block_starts = numpy.clip(block_starts, 0, length).astype(numpy.int64)
+    block_ends = numpy.clip(block_ends, 0, length).astype(numpy.int64)
+    changes = numpy.bincount(block_starts, minlength=length + 1) - \
+        numpy.bincount(block_ends, minlength=length + 1)
+    depths = numpy.cumsum(changes[:length]).astype(DEPTH_DTYPE)
+    positions = numpy.arange(start, end + 1, dtype=POSITION_DTYPE)
+    return positions, depths
+
+
+def get_cli_args():
+    """
+    Get command line options with argparse
+    :return: instance of argparse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Calculate ABO depth of coverage and copy number from '
+                    'BAM/CRAM files')
+    parser.add_argument('-l', '--alignment-list', dest='alignment_list',
+                        type=str,
+                        default='/Users/jonathan_stevens/ABO/cram_list.txt',
+                        help='text file listing indexed BAM/CRAM file paths')
+    parser.add_argument('-T', '--reference', dest='reference', type=str,
+                        default=None,
+                        help='reference FASTA for CRAM decoding')
+    parser.add_argument('-s', '--start', dest='start', type=int,
+                        default=133279500,
+                        help='start position for copy number baseline '
+                             'interval')
+    parser.add_argument('-i', '--interval', dest='interval', type=int,
+                        default=5000,
+                        help='length of copy number baseline interval')
+    parser.add_argument('-q', '--min-mapq', dest='min_mapq', type=int,
+                        default=0,
+                        help='minimum mapping quality of counted reads')
+    parser.add_argument('-r', '--regions', dest='regions', type=str,
+                        default=copy_number_per_region.DEFAULT_REGIONS,
+                        help='BED file of gene regions, including a Baseline '
+                             'region')
+    parser.add_argument('-c', '--coverage-out', dest='coverage_out',
+                        type=str,
+                        default='1000G_100bp_avg_read_depth_of_coverage.txt',
+                        help='name of average depth per 100 bases outfile')
+    parser.add_argument('-n', '--copy-number-out', dest='copy_number_out',
+                        type=str, default='1000G_100bp_avg_copy_number.txt',
+                        help='name of copy number per 100 bases outfile')
+    parser.add_argument('-g', '--region-out', dest='region_out', type=str,
+                        default='copy_number_per_region.txt',
+                        help='name of copy number per gene region outfile')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help='number of processes for reading alignment '
+                             'files')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
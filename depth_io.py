@@ -0,0 +1,998 @@
+# depth_io.py
+
+"""
+Shared readers for samtools depth output used by the ABO depth of coverage
+and copy number scripts.
+
+Depth files are parsed in a single vectorized pass over the raw bytes of the
+file into typed NumPy arrays, instead of splitting every line and building a
+Python int per base. This keeps parsing time and memory per sample low when
+processing whole cohorts. Parsed arrays can also be kept in a binary cache
+directory so repeat runs over the same files skip text parsing entirely, or
+depth files can be streamed in fixed size blocks into running interval sums
+so memory per sample does not depend on the size of the region.
+
+Depth files may be gzip or bgzip compressed. Compressed files are detected
+from their first bytes and decompressed while streaming in a background
+thread, overlapping decompression with parsing. Output files named *.gz are
+written gzip compressed, and result tables named *.npz, *.parquet or
+*.feather are written as float32 binary columnar tables.
+
+Per-sample results can be recorded in a JSON manifest together with the
+fingerprint of their depth file, so a growing cohort is updated by reading
+only new or changed depth files.
+
+The parsers count the lines they read, including lines parsed in worker
+processes, so run metrics can report lines read without reading depth files
+a second time.
+"""
+
+import io
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy
+
+try:
+    # faster zlib backend from python-isal, if installed
+    from isal.igzip import IGzipFile as GzipFile
+    from isal.isal_zlib import ISAL_DEFAULT_COMPRESSION as COMPRESS_LEVEL
+except ImportError:
+    from gzip import GzipFile
+    # gzip compression level of *.gz output files, isal accepts only 0-3
+    COMPRESS_LEVEL = 6
+
+# dtype for chromosome positions (chr9 coordinates exceed uint16)
+POSITION_DTYPE = numpy.uint32
+# dtype for per base depth of coverage values
+DEPTH_DTYPE = numpy.uint32
+
+# byte values used when scanning depth files
+_NEWLINE = ord('\n')
+_CARRIAGE_RETURN = ord('\r')
+_SEPARATORS = (ord('\t'), ord(' '))
+# uint32 values have at most 10 digits
+_MAX_DIGITS = 10
+# bytes read per block when streaming depth files
+_BLOCK_SIZE = 1 << 20
+# leading bytes of gzip and bgzip files
+_GZIP_MAGIC = b'\x1f\x8b'
+# decompressed blocks buffered ahead of the parser
+_READ_AHEAD = 4
+# file name extensions of binary columnar result tables
+COLUMNAR_FORMATS = ('.npz', '.parquet', '.feather')
+# text file listing the samtools depth file names of the cohort
+# number of depth file lines parsed by this process, see lines_parsed
+_lines_parsed = 0
+
+DEPTH_FILE_LIST = '/Users/jonathan_stevens/ABO/depth_out.txt'
+# directory of samtools depth files listed in the file list
+DEPTH_DIR = '/Users/jonathan_stevens/ABO/1000G_data/depth/'
+
+
+def create_list_of_depth_files(text_file):
+    """
+    creates a list of file names from a text file
+    :param text_file: str, name of text file containing file list
+    :return: file_list, list of file names
+    """
+    file_list = list()
+    with open(text_file, 'r') as tf:
+        for line in tf:
+            line = line.strip()
+            file_list.append(line)
+    return file_list
+
+
+def open_depth_file(file_path):
+    """
+    Opens a depth file for binary reading. Gzip and bgzip compressed files
+    are decompressed in a background thread while the caller parses.
+    :param file_path: str, path to plain or compressed depth file
+    :return: file object in binary mode
+    """
+    fh = open(file_path, 'rb')
+    if fh.peek(len(_GZIP_MAGIC))[:len(_GZIP_MAGIC)] != _GZIP_MAGIC:
+        return fh
+    # GzipFile reads the concatenated members of bgzip files in sequence
+    return io.BufferedReader(_BackgroundReader(GzipFile(fileobj=fh), fh),
+                             buffer_size=_BLOCK_SIZE)
+
+
+def open_output_file(file_path):
+    """
+    Opens an output text file for writing, gzip compressed if its name ends
+    in .gz
+    :param file_path: str, path to output file
+    :return: file object in text mode
+    """
+    if file_path.endswith('.gz'):
+        return io.TextIOWrapper(
+            GzipFile(file_path, 'wb', compresslevel=COMPRESS_LEVEL),
+            encoding='ascii')
+    return open(file_path, 'w')
+
+
+def is_columnar(file_path):
+    """
+    Checks whether a result table should be written in a binary columnar
+    format rather than as tab delimited text
+    :param file_path: str, path to output file
+    :return: bool
+    """
+    return file_path.endswith(COLUMNAR_FORMATS)
+
+
+def write_columnar(out_file, header_line, sample_list, value_dict):
+    """
+    Writes a table of samples x columns as float32 values to a binary
+    columnar file. NumPy archives hold the arrays values, samples and
+    columns, plus chrom and positions when columns are chrom:position
+    coordinates. Parquet and Feather tables (requiring pyarrow) hold one
+    float32 column per header value after the sample name column.
+    :param out_file: str, path ending in .npz, .parquet or .feather
+    :param header_line: list, sample column name followed by column names
+    :param sample_list: list, list of sample names
+    :param value_dict: dictionary, sample keys with lists of values, rows
+    shorter than the header are padded with NaN
+    :return: None
+    """
+    # samples without results are left out, as in the text outfiles
+    sample_list = [sample for sample in sample_list if sample in value_dict]
+    column_names = list(header_line[1:])
+    values = numpy.full((len(sample_list), len(column_names)), numpy.nan,
+                        dtype=numpy.float32)
+    for row, sample in enumerate(sample_list):
+        sample_values = value_dict[sample]
+        values[row, :len(sample_values)] = sample_values
+    if out_file.endswith('.npz'):
+        arrays = {'values': values, 'samples': numpy.array(sample_list),
+                  'columns': numpy.array(column_names)}
+        coordinates = _column_coordinates(column_names)
+        if coordinates is not None:
+            arrays['chrom'], arrays['positions'] = coordinates
+        numpy.savez_compressed(out_file, **arrays)
+        return
+    try:
+        import pandas
+    except ImportError:
+        raise ImportError(f'pandas and pyarrow are required to write '
+                          f'{out_file}: pip install pandas pyarrow')
+    table = pandas.DataFrame(values, columns=column_names)
+    table.insert(0, header_line[0], sample_list)
+    if out_file.endswith('.parquet'):
+        table.to_parquet(out_file, index=False)
+    else:
+        table.to_feather(out_file)
+
+
+def load_columnar(file_path):
+    """
+    Loads a binary columnar result table written by write_columnar
+    :param file_path: str, path ending in .npz, .parquet or .feather
+    :return: sample_list, list of sample names
+    :return: column_names, list of column names
+    :return: values, numpy float32 array of samples x columns values
+    """
+    if file_path.endswith('.npz'):
+        with numpy.load(file_path) as archive:
+            return (archive['samples'].tolist(), archive['columns'].tolist(),
+                    archive['values'])
+    import pandas
+    if file_path.endswith('.parquet'):
+        table = pandas.read_parquet(file_path)
+    else:
+        table = pandas.read_feather(file_path)
+    return (table.iloc[:, 0].tolist(), table.columns[1:].tolist(),
+            table.iloc[:, 1:].to_numpy(dtype=numpy.float32))
+
+
+def _column_coordinates(column_names):
+    """
+    Splits chrom:position column names into a chromosome and positions
+    :param column_names: list of column names
+    :return: chrom, str, and positions, numpy int64 array, or None if the
+    columns are not coordinates of one chromosome
+    """
+    chroms = set()
+    positions = list()
+    for name in column_names:
+        chrom, _, position = name.rpartition(':')
+        if not chrom or not position.isdigit():
+            return None
+        chroms.add(chrom)
+        positions.append(int(position))
+    if len(chroms) != 1:
+        return None
+    return chroms.pop(), numpy.array(positions, dtype=numpy.int64)
+
+
+class _BackgroundReader(io.RawIOBase):
+    """
+    Raw stream reading blocks of another stream in a background thread into
+    a bounded queue. zlib releases the GIL, so decompression runs alongside
+    parsing in the main thread.
+    """
+
+    def __init__(self, stream, source=None):
+        """
+        :param stream: file object to read blocks from
+        :param source: optional underlying file object closed with stream
+        """
+        super().__init__()
+        self._stream = stream
+        self._source = source
+        self._blocks = queue.Queue(maxsize=_READ_AHEAD)
+        self._block = memoryview(b'')
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._block:
+            block = self._blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if block is None:
+                # keep signalling end of file to later reads
+                self._blocks.put(None)
+                return 0
+            self._block = memoryview(block)
+        size = min(len(buffer), len(self._block))
+        buffer[:size] = self._block[:size]
+        self._block = self._block[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            # unblock the reading thread if the queue is full
+            while self._thread.is_alive():
+                try:
+                    self._blocks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self._stream.close()
+            if self._source is not None:
+                self._source.close()
+        super().close()
+
+    def _read_ahead(self):
+        try:
+            while not self._stopped.is_set():
+                block = self._stream.read(_BLOCK_SIZE)
+                if not block:
+                    break
+                self._blocks.put(block)
+            self._blocks.put(None)
+        except Exception as error:
+            self._blocks.put(error)
+
+
+def load_depth_arrays(file_handle):
+    """
+    Parses samtools depth output into position and depth arrays
+    :param file_handle: file object, or path, containing depth data
+    (chromosome, position, depth columns)
+    :return: positions, numpy array of positions from column 2
+    :return: depths, numpy array of depth values from column 3
+    """
+    return _parse_depth_arrays(_read_bytes(file_handle))
+
+
+def load_depth_array(file_handle):
+    """
+    Extracts sample depth of coverage data from column 3 of a samtools depth
+    file as a typed array
+    :param file_handle: file object, or path, containing depth data
+    :return: depths, numpy array of depth values from file
+    """
+    return _parse_depths(_read_bytes(file_handle))
+
+
+def iter_depth_blocks(file_handle, block_size=_BLOCK_SIZE):
+    """
+    Streams depth values of a samtools depth file in blocks of complete
+    lines, so only one block is held in memory at a time
+    :param file_handle: file object in text or binary mode
+    :param block_size: int, approximate number of bytes per block
+    :return: generator of numpy arrays of depth values from column 3
+    """
+    for buf in _iter_line_blocks(file_handle, block_size):
+        yield _parse_depths(buf)
+
+
+def iter_depth_array_blocks(file_handle, block_size=_BLOCK_SIZE):
+    """
+    Streams positions and depth values of a samtools depth file in blocks
+    of complete lines, so only one block is held in memory at a time
+    :param file_handle: file object in text or binary mode
+    :param block_size: int, approximate number of bytes per block
+    :return: generator of (positions, depths) tuples of numpy arrays from
+    columns 2 and 3
+    """
+    for buf in _iter_line_blocks(file_handle, block_size):
+        yield _parse_depth_arrays(buf)
+
+
+def _iter_line_blocks(file_handle, block_size=_BLOCK_SIZE):
+    """
+    Reads a file in blocks of complete lines, the last line of the file
+    completed with a newline if missing
+    :param file_handle: file object in text or binary mode
+    :param block_size: int, approximate number of bytes per block
+    :return: generator of numpy uint8 arrays of complete lines
+    """
+    remainder = b''
+    while True:
+        data = file_handle.read(block_size)
+        if not data:
+            break
+        if isinstance(data, str):
+            data = data.encode('ascii')
+        # carry the trailing partial line over to the next block
+        data = remainder + data
+        cut = data.rfind(b'\n') + 1
+        remainder = data[cut:]
+        if cut:
+            yield numpy.frombuffer(data[:cut], dtype=numpy.uint8)
+    if remainder:
+        yield numpy.frombuffer(remainder + b'\n', dtype=numpy.uint8)
+
+
+def read_wide_depth_header(file_path):
+    """
+    Reads the column names of a multi-sample samtools depth file written
+    with -H, e.g. #CHROM, POS, then one column per input file
+    :param file_path: str, path to wide depth file
+    :return: list of sample column names, or None if the file has no header
+    """
+    with open_depth_file(file_path) as fh:
+        line = fh.readline().decode('ascii').rstrip('\r\n')
+    if not line.startswith('#'):
+        return None
+    return line.split('\t')[2:]
+
+
+def iter_wide_depth_blocks(file_handle, block_size=_BLOCK_SIZE):
+    """
+    Streams a multi-sample samtools depth file, one row per position and one
+    depth column per sample, in blocks of complete lines. Header lines
+    starting with # are skipped.
+    :param file_handle: file object in text or binary mode
+    :param block_size: int, approximate number of bytes per block
+    :return: generator of (positions, depths) tuples, positions a numpy
+    array per row and depths a numpy array of rows x sample columns
+    """
+    remainder = b''
+    n_columns = None
+    while True:
+        data = file_handle.read(block_size)
+        if isinstance(data, str):
+            data = data.encode('ascii')
+        at_end = not data
+        data = remainder + data
+        if at_end and data and not data.endswith(b'\n'):
+            data += b'\n'
+        # carry the trailing partial line over to the next block
+        cut = data.rfind(b'\n') + 1
+        remainder = data[cut:]
+        lines = data[:cut].replace(b'\r', b'')
+        # drop header lines
+        while lines.startswith(b'#'):
+            lines = lines[lines.find(b'\n') + 1:]
+            _count_parsed_lines(1)
+        if lines:
+            if n_columns is None:
+                n_columns = lines[:lines.find(b'\n')].count(b'\t') + 1
+            yield _parse_wide_depths(lines, n_columns)
+        if at_end:
+            break
+
+
+class IntervalAggregator:
+    """
+    Accumulates running depth sums and base counts per fixed size interval
+    and per window of line indexes, matching the results of averaging
+    slices of the full depth list without holding it in memory. Blocks may
+    hold one sample (1-D) or one column per sample (2-D).
+    """
+
+    def __init__(self, size=100, windows=()):
+        """
+        :param size: int, number of bases per interval
+        :param windows: list of (start, end) half open line index ranges,
+        such as copy number baseline ranges
+        """
+        self.size = size
+        self.windows = list(windows)
+        self.window_sums = [0] * len(self.windows)
+        self.window_counts = [0] * len(self.windows)
+        self.bases = 0
+        # interval sums with spare capacity, grown geometrically
+        self._sums = None
+        self._n_intervals = 0
+
+    @property
+    def interval_sums(self):
+        """
+        :return: numpy int64 array of depth sums per interval seen so far,
+        or None before the first block
+        """
+        if self._sums is None:
+            return None
+        return self._sums[:self._n_intervals]
+
+    def update(self, depths):
+        """
+        Adds the next consecutive block of depth values
+        :param depths: numpy array of depth values, one row per base
+        :return: None
+        """
+        first = self.bases
+        last = first + len(depths)
+        if self._sums is None:
+            self._sums = numpy.zeros((0,) + depths.shape[1:],
+                                     dtype=numpy.int64)
+        if last == first:
+            return
+        # grow interval sums to cover the intervals touched by this block,
+        # at least doubling capacity so repeated blocks copy linear bytes
+        n_intervals = -(-last // self.size)
+        if n_intervals > len(self._sums):
+            sums = numpy.zeros((max(n_intervals, 2 * len(self._sums)),) +
+                               depths.shape[1:], dtype=numpy.int64)
+            sums[:self._n_intervals] = self._sums[:self._n_intervals]
+            self._sums = sums
+        self._n_intervals = n_intervals
+        # sum block depths per interval, aligned to the block's first base
+        first_interval = first // self.size
+        boundaries = numpy.arange((first_interval + 1) * self.size, last,
+                                  self.size) - first
+        self._sums[first_interval:n_intervals] += numpy.add.reduceat(
+            depths.astype(numpy.int64), numpy.append(0, boundaries), axis=0)
+        # add the overlap of this block with each window
+        for i, (start, end) in enumerate(self.windows):
+            lo = max(start, first)
+            hi = min(end, last)
+            if lo < hi:
+                self.window_sums[i] = self.window_sums[i] + \
+                    depths[lo - first:hi - first].sum(axis=0,
+                                                      dtype=numpy.int64)
+                self.window_counts[i] += hi - lo
+        self.bases = last
+
+    def interval_averages(self):
+        """
+        Calculates the rounded average depth of each interval seen so far
+        :return: avg_depth_per_interval, list of average depths per interval,
+        or for 2-D blocks a list of such lists per sample column
+        """
+        if self.interval_sums is None:
+            return list()
+        counts = numpy.full(len(self.interval_sums), self.size)
+        if len(counts) and self.bases % self.size:
+            # the last interval holds the remaining bases
+            counts[-1] = self.bases % self.size
+        counts = counts.reshape((-1,) + (1,) * (self.interval_sums.ndim - 1))
+        return numpy.rint(self.interval_sums / counts).astype(
+            numpy.int64).T.tolist()
+
+    def window_average(self, index=0):
+        """
+        Calculates the average depth of one window
+        :param index: int, index of window in windows
+        :return: float, average depth, or for 2-D blocks a list of average
+        depths per sample column
+        :raises ZeroDivisionError: if no bases fall within the window
+        """
+        if not self.window_counts[index]:
+            raise ZeroDivisionError('no bases within window')
+        return (numpy.asarray(self.window_sums[index]) /
+                self.window_counts[index]).tolist()
+
+
+def aggregate_depth_file(file_handle, size=100, windows=()):
+    """
+    Streams a samtools depth file through an IntervalAggregator
+    :param file_handle: file object in text or binary mode
+    :param size: int, number of bases per interval
+    :param windows: list of (start, end) half open line index ranges
+    :return: IntervalAggregator holding the file's interval and window sums
+    """
+    aggregator = IntervalAggregator(size, windows)
+    for depths in iter_depth_blocks(file_handle):
+        aggregator.update(depths)
+    return aggregator
+
+
+def load_cached_depth_arrays(file_path, cache_dir):
+    """
+    Loads position and depth arrays from a binary cache, parsing the depth
+    file and rebuilding its cache entry only when the source file changed
+    :param file_path: str, path to samtools depth file
+    :param cache_dir: str, directory holding cached .npy depth arrays
+    :return: positions, numpy array of positions from column 2
+    :return: depths, numpy array of depth values from column 3
+    """
+    data = _load_cache_entry(
+        file_path, cache_dir, '',
+        lambda: numpy.vstack(load_depth_arrays(file_path)))
+    return data[0], data[1]
+
+
+def load_cached_depth_array(file_path, cache_dir):
+    """
+    Loads the depth values of a samtools depth file through the binary cache
+    :param file_path: str, path to samtools depth file
+    :param cache_dir: str, directory holding cached .npy depth arrays
+    :return: depths, numpy array of depth values from file
+    """
+    positions, depths = load_cached_depth_arrays(file_path, cache_dir)
+    return depths
+
+
+def load_cached_prefix_index(file_path, cache_dir):
+    """
+    Loads the prefix sum index of a samtools depth file from the binary
+    cache, building it only when the source file changed
+    :param file_path: str, path to samtools depth file
+    :param cache_dir: str, directory holding cached .npy depth arrays
+    :return: PrefixSumIndex of depth values from file
+    """
+    return PrefixSumIndex(_load_cache_entry(
+        file_path, cache_dir, 'prefix',
+        lambda: PrefixSumIndex.from_depths(
+            load_cached_depth_array(file_path, cache_dir)).prefix_sums))
+
+
+class PrefixSumIndex:
+    """
+    Cumulative depth sums of one sample, so the sum or mean over any window
+    of line indexes is a constant time lookup
+    """
+
+    def __init__(self, prefix_sums):
+        """
+        :param prefix_sums: numpy int64 array, prefix_sums[i] is the sum of
+        the first i depth values
+        """
+        self.prefix_sums = prefix_sums
+
+    @classmethod
+    def from_depths(cls, depths):
+        """
+        Builds the index of a depth array
+        :param depths: numpy array of depth values
+        :return: PrefixSumIndex
+        """
+        prefix_sums = numpy.zeros(len(depths) + 1, dtype=numpy.int64)
+        numpy.cumsum(depths, dtype=numpy.int64, out=prefix_sums[1:])
+        return cls(prefix_sums)
+
+    def __len__(self):
+        return len(self.prefix_sums) - 1
+
+    def window_sum(self, start, end):
+        """
+        Sums depths of a half open window, clipped like a list slice
+        :param start: int, first line index of window
+        :param end: int, line index after the last index of window
+        :return: int, depth sum
+        """
+        start, end, step = slice(start, end).indices(len(self))
+        return int(self.prefix_sums[max(start, end)] -
+                   self.prefix_sums[start])
+
+    def window_average(self, start, end):
+        """
+        Calculates the mean depth of a half open window, equal to averaging
+        the slice depths[start:end]
+        :param start: int, first line index of window
+        :param end: int, line index after the last index of window
+        :return: float, average depth
+        :raises ZeroDivisionError: if the window holds no bases
+        """
+        start, end, step = slice(start, end).indices(len(self))
+        if end <= start:
+            raise ZeroDivisionError('average of empty depth window')
+        return self.window_sum(start, end) / (end - start)
+
+    def window_averages(self, starts, ends):
+        """
+        Calculates the mean depth of many half open windows at once
+        :param starts: numpy array of first line indexes, within the index
+        :param ends: numpy array of line indexes after the last indexes
+        :return: numpy float array of average depths, nan for empty windows
+        """
+        starts = numpy.clip(starts, 0, len(self))
+        ends = numpy.clip(ends, starts, len(self))
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return (self.prefix_sums[ends] - self.prefix_sums[starts]) / \
+                (ends - starts)
+
+    def interval_averages(self, size=100, step=None):
+        """
+        Calculates rounded average depths of fixed size intervals, matching
+        average_per_interval, or of sliding windows when step is smaller
+        than size
+        :param size: int, number of bases per interval
+        :param step: int, bases between interval starts, defaults to size
+        :return: avg_depth_per_interval, list of average depths per interval
+        """
+        starts = numpy.arange(0, len(self), step or size)
+        averages = self.window_averages(starts, starts + size)
+        return numpy.rint(averages).astype(numpy.int64).tolist()
+
+
+def average_per_interval(depths, size=100):
+    """
+    Calculates the rounded average depth per fixed size interval, matching
+    the results of splitting the depth list into size element lists
+    :param depths: numpy array of depth values
+    :param size: int, number of bases per interval
+    :return: avg_depth_per_interval, list of average depths per interval
+    """
+    if len(depths) == 0:
+        return list()
+    # sum each interval and divide by the number of bases it contains
+    starts = numpy.arange(0, len(depths), size)
+    sums = numpy.add.reduceat(depths.astype(numpy.int64), starts)
+    counts = numpy.diff(numpy.append(starts, len(depths)))
+    return numpy.rint(sums / counts).astype(numpy.int64).tolist()
+
+
+def average(depths):
+    """
+    Calculates the mean of a depth array
+    :param depths: numpy array of depth values
+    :return: float, average depth
+    :raises ZeroDivisionError: if depths is empty
+    """
+    if len(depths) == 0:
+        raise ZeroDivisionError('average of empty depth array')
+    return int(depths.sum(dtype=numpy.int64)) / len(depths)
+
+
+def map_samples(func, items, jobs=1):
+    """
+    Applies a per-sample function to each item, spreading the calls over a
+    process pool when more than one job is requested. Results keep the order
+    of items.
+    :param func: picklable function of one argument
+    :param items: list of per-sample arguments, e.g. depth file paths
+    :param jobs: int, number of worker processes
+    :return: list of results in the order of items
+    """
+    if jobs is None or jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    # a few chunks per worker balances uneven files with low IPC overhead
+    chunksize = max(1, len(items) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(partial(_call_counting_lines, func),
+                                    items, chunksize=chunksize))
+    # add the lines parsed in worker processes to the count of this process
+    _count_parsed_lines(sum(lines for _, lines in results))
+    return [result for result, _ in results]
+
+
+def _call_counting_lines(func, item):
+    """
+    Calls a per-sample function in a worker process of map_samples
+    :param func: function of one argument
+    :param item: per-sample argument
+    :return: result of func and number of depth file lines it parsed
+    """
+    start = _lines_parsed
+    result = func(item)
+    return result, _lines_parsed - start
+
+
+def lines_parsed():
+    """
+    Counts the depth file lines parsed so far, including the lines parsed
+    in worker processes of map_samples, e.g. for RunMetrics line_counter
+    :return: int, number of lines
+    """
+    return _lines_parsed
+
+
+def _count_parsed_lines(n_lines):
+    """
+    Adds lines to the count of depth file lines parsed by this process
+    :param n_lines: int, number of lines parsed
+    :return: None
+    """
+    global _lines_parsed
+    _lines_parsed += n_lines
+
+
+def map_samples_with_manifest(func, file_paths, manifest_path, key, jobs=1):
+    """
+    Applies a per-sample function to each depth file like map_samples, but
+    reuses the results recorded in a manifest for files whose fingerprint
+    (size and modification time) is unchanged. Only new or changed files
+    are read, and their results are merged into the manifest.
+    :param func: picklable function of one depth file path
+    :param file_paths: list of depth file paths
+    :param manifest_path: str, path to JSON manifest, created if missing
+    :param key: str, name of the results in the manifest, including any
+    parameters the results depend on
+    :param jobs: int, number of worker processes
+    :return: results, list of JSON compatible results in the order of
+    file_paths (tuples are returned as lists when read from the manifest)
+    :return: n_read, int, number of depth files read
+    """
+    try:
+        with open(manifest_path, 'r') as fh:
+            manifest = json.load(fh)
+    except FileNotFoundError:
+        manifest = dict()
+    entries = manifest.setdefault(key, dict())
+    sources = [os.path.abspath(path) for path in file_paths]
+    identities = [_file_identity(path) for path in file_paths]
+    stale = [i for i, (source, identity) in enumerate(zip(sources,
+                                                          identities))
+             if entries.get(source, {}).get('identity') != identity]
+    results = map_samples(func, [file_paths[i] for i in stale], jobs)
+    for i, result in zip(stale, results):
+        entries[sources[i]] = {'identity': identities[i], 'result': result}
+    if stale or not os.path.exists(manifest_path):
+        # write to a temporary file first so the manifest is never partial
+        tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(manifest, fh)
+        os.replace(tmp_path, manifest_path)
+    return [entries[source]['result'] for source in sources], len(stale)
+
+
+def _load_cache_entry(file_path, cache_dir, kind, build):
+    """
+    Loads a cached array derived from a source file, rebuilding and storing
+    it when the source file changed since the entry was written
+    :param file_path: str, path to source file
+    :param cache_dir: str, directory holding cached .npy arrays
+    :param kind: str, name of the derived array, '' for parsed depths
+    :param build: function without arguments returning the array to cache
+    :return: numpy array or read only memmap of the cached array
+    """
+    cache_path, meta_path = _cache_paths(file_path, cache_dir, kind)
+    identity = _file_identity(file_path)
+    try:
+        with open(meta_path, 'r') as fh:
+            cached_identity = json.load(fh)
+        if cached_identity == identity:
+            # memory map cached array instead of reading it into RAM
+            return numpy.load(cache_path, mmap_mode='r')
+    except (OSError, ValueError):
+        # missing or unreadable cache entries are rebuilt below
+        pass
+    data = build()
+    _write_cache_entry(cache_path, meta_path, identity, data)
+    return data
+
+
+def _cache_paths(file_path, cache_dir, kind=''):
+    """
+    Builds the cache array and metadata paths for a depth file
+    :param file_path: str, path to samtools depth file
+    :param cache_dir: str, directory holding cached .npy depth arrays
+    :param kind: str, name of the derived array, '' for parsed depths
+    :return: cache_path, str, path of cached array
+    :return: meta_path, str, path of cached source file identity
+    """
+    name = os.path.basename(file_path)
+    if kind:
+        name = f'{name}.{kind}'
+    return (os.path.join(cache_dir, f'{name}.npy'),
+            os.path.join(cache_dir, f'{name}.json'))
+
+
+def _file_identity(file_path):
+    """
+    Describes the state of a source file for cache validation
+    :param file_path: str, path to file
+    :return: dict of absolute path, size and modification time
+    """
+    stat = os.stat(file_path)
+    return {'source': os.path.abspath(file_path), 'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns}
+
+
+def _write_cache_entry(cache_path, meta_path, identity, data):
+    """
+    Writes a cached array and its metadata, replacing any previous entry
+    :param cache_path: str, path of cached array
+    :param meta_path: str, path of cached source file identity
+    :param identity: dict, source file identity
+    :param data: numpy array to cache
+    :return: None
+    """
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    # write to temporary files first so readers never see partial entries
+    tmp_cache_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_cache_path, 'wb') as fh:
+        numpy.save(fh, data)
+    os.replace(tmp_cache_path, cache_path)
+    tmp_meta_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_meta_path, 'w') as fh:
+        json.dump(identity, fh)
+    os.replace(tmp_meta_path, meta_path)
+
+
+def _read_bytes(file_handle):
+    """
+    Reads the whole content of a depth file as a uint8 array
+    :param file_handle: file object in text or binary mode, or path
+    :return: buf, numpy uint8 array of file content
+    """
+    if hasattr(file_handle, 'read'):
+        data = file_handle.read()
+    else:
+        with open_depth_file(file_handle) as fh:
+            data = fh.read()
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    # terminate the last line so every line ends with a newline
+    if data and not data.endswith(b'\n'):
+        data += b'\n'
+    return numpy.frombuffer(data, dtype=numpy.uint8)
+
+
+def _parse_depth_arrays(buf):
+    """
+    Parses the position and depth columns of complete depth file lines
+    :param buf: numpy uint8 array of complete lines
+    :return: positions, numpy array of positions from column 2
+    :return: depths, numpy array of depth values from column 3
+    """
+    line_ends = _line_ends(buf)
+    # parse depth column, then position column ending at its separator
+    depths, separators = _parse_field_before(buf, line_ends)
+    if separators is not None:
+        positions, separators = _parse_field_before(buf, separators)
+        if separators is not None:
+            return positions.astype(POSITION_DTYPE), depths
+    # fall back to the general text parser for irregular files
+    return _load_depth_arrays_text(buf)
+
+
+def _parse_depths(buf):
+    """
+    Parses the depth column of complete depth file lines
+    :param buf: numpy uint8 array of complete lines
+    :return: depths, numpy array of depth values from column 3
+    """
+    depths, separators = _parse_field_before(buf, _line_ends(buf))
+    if separators is None:
+        # fall back to the general text parser for irregular files
+        positions, depths = _load_depth_arrays_text(buf)
+    return depths
+
+
+def _parse_wide_depths(data, n_columns):
+    """
+    Parses complete lines of a multi-sample depth file
+    :param data: bytes, complete tab delimited lines
+    :param n_columns: int, number of columns per line
+    :return: positions, numpy array of positions from column 2
+    :return: depths, numpy array of rows x sample depth columns
+    :raises ValueError: if a line has a different number of columns or a
+    field is not an unsigned integer
+    """
+    buf = numpy.frombuffer(data, dtype=numpy.uint8)
+    field_ends = numpy.flatnonzero((buf == ord('\t')) | (buf == _NEWLINE))
+    if len(field_ends) % n_columns or \
+            (buf[field_ends[n_columns - 1::n_columns]] != _NEWLINE).any():
+        raise ValueError(f'expected {n_columns} columns on every line of '
+                         f'wide depth file')
+    _count_parsed_lines(len(field_ends) // n_columns)
+    field_starts = numpy.append(0, field_ends[:-1] + 1)
+    field_starts = field_starts.reshape(-1, n_columns)
+    field_ends = field_ends.reshape(-1, n_columns)
+    # parse position and sample depth columns, skipping the chromosome
+    values = _parse_fields(buf, field_starts[:, 1:], field_ends[:, 1:])
+    positions = values[:, 0].astype(POSITION_DTYPE)
+    depths = values[:, 1:].astype(DEPTH_DTYPE)
+    return positions, depths
+
+
+def _parse_fields(buf, starts, ends):
+    """
+    Parses unsigned integer fields given their start and end indexes
+    :param buf: numpy uint8 array of file content
+    :param starts: numpy array of first indexes of fields
+    :param ends: numpy array of indexes following fields
+    :return: values, numpy uint64 array of parsed integers
+    :raises ValueError: if a field is empty or holds non digit characters
+    """
+    lengths = ends - starts
+    values = numpy.zeros(starts.shape, dtype=numpy.uint64)
+    if not lengths.size:
+        return values
+    if (lengths <= 0).any() or (lengths > _MAX_DIGITS).any():
+        raise ValueError('depth file field is not an unsigned integer')
+    scale = 1
+    # add digits right to left, one digit position per pass
+    for k in range(1, int(lengths.max()) + 1):
+        has_digit = lengths >= k
+        digits = buf[numpy.where(has_digit, ends - k, 0)].astype(
+            numpy.int64) - 48
+        if ((digits < 0) | (digits > 9))[has_digit].any():
+            raise ValueError('depth file field is not an unsigned integer')
+        values += numpy.where(has_digit, digits, 0).astype(numpy.uint64) * \
+            numpy.uint64(scale)
+        scale *= 10
+    return values
+
+
+def _line_ends(buf):
+    """
+    Finds the index of the last character after each line's final field
+    :param buf: numpy uint8 array of file content
+    :return: numpy array of newline (or carriage return) indices
+    """
+    line_ends = numpy.flatnonzero(buf == _NEWLINE)
+    _count_parsed_lines(len(line_ends))
+    # exclude carriage returns of windows line endings from the last field,
+    # files mixing line endings are left to the text parser
+    if len(line_ends) and line_ends[0] > 0 and \
+            (buf[line_ends - 1] == _CARRIAGE_RETURN).all():
+        line_ends = line_ends - 1
+    return line_ends
+
+
+def _parse_field_before(buf, field_ends):
+    """
+    Parses the unsigned integer field that ends before each index by reading
+    digits right to left until a separator is reached
+    :param buf: numpy uint8 array of file content
+    :param field_ends: numpy array of indices following each field
+    :return: values, numpy array of parsed integers
+    :return: separators, numpy array of separator indices preceding each
+    field, or None if any field is not a separator delimited integer
+    """
+    values = numpy.zeros(len(field_ends), dtype=numpy.uint64)
+    lengths = numpy.zeros(len(field_ends), dtype=numpy.int64)
+    active = numpy.ones(len(field_ends), dtype=bool)
+    scale = 1
+    for k in range(1, _MAX_DIGITS + 2):
+        if not active.any():
+            break
+        # index is clipped so the first line cannot wrap around the buffer
+        chars = buf[numpy.maximum(field_ends - k, 0)]
+        active &= (chars >= 48) & (chars <= 57) & (field_ends - k >= 0)
+        values += numpy.where(active, chars - 48, 0).astype(numpy.uint64) * \
+            numpy.uint64(scale)
+        lengths += active
+        scale *= 10
+    separators = field_ends - lengths - 1
+    # every field needs at least one digit and a preceding separator
+    if len(field_ends) and (
+            (lengths == 0).any() or (lengths > _MAX_DIGITS).any() or
+            (separators < 0).any() or
+            not numpy.isin(buf[numpy.maximum(separators, 0)],
+                           _SEPARATORS).all()):
+        return values.astype(DEPTH_DTYPE), None
+    return values.astype(DEPTH_DTYPE), separators
+
+
+def _load_depth_arrays_text(buf):
+    """
+    Parses depth data with the general NumPy text reader
+    :param buf: numpy uint8 array of file content
+    :return: positions, numpy array of positions from column 2
+    :return: depths, numpy array of depth values from column 3
+    """
+    lines = buf.tobytes().decode('ascii').splitlines()
+    data = numpy.loadtxt(lines, dtype=DEPTH_DTYPE, usecols=(1, 2), ndmin=2)
+    positions = data[:, 0].astype(POSITION_DTYPE)
+    depths = numpy.ascontiguousarray(data[:, 1])
+    return positions, depths
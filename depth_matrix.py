@@ -0,0 +1,217 @@
+#! /usr/bin/env python3
+# depth_matrix.py
+
+"""
+Builds a memory-mapped samples x positions depth of coverage matrix for the
+ABO gene window (chr9:133255176-133385146) from samtools depth files, so
+cohort wide coverage and copy number calculations can read slices of the
+matrix without loading every sample into RAM.
+
+A matrix store is a directory containing:
+  depths.npy    uint32 samples x positions matrix of depth values
+  samples.txt   sample names, one per line, in matrix row order
+  window.json   chromosome, first and last position of matrix columns
+  lengths.npy   number of leading matrix columns covered by each sample's
+                depth file, so truncated and empty depth files are not read
+                as zero depth
+
+usage: depth_matrix.py [-h] [-l FILE_LIST] [-d DEPTH_DIR] [-o STORE_DIR]
+
+Build a memory-mapped cohort depth matrix from samtools depth files
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -l FILE_LIST, --file-list FILE_LIST
+                        text file listing depth file names
+  -d DEPTH_DIR, --depth-dir DEPTH_DIR
+                        directory containing depth files
+  -o STORE_DIR, --outdir STORE_DIR
+                        directory to write the matrix store to
+
+"""
+
+import argparse
+import json
+import os
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from depth_io import (DEPTH_DIR, DEPTH_DTYPE, DEPTH_FILE_LIST,
+                      create_list_of_depth_files, load_depth_arrays)
+
+# ABO gene window passed to samtools depth -r
+CHROM = 'chr9'
+WINDOW_START = 133255176
+WINDOW_END = 133385146
+
+
+class DepthMatrix:
+    """
+    Read only view of a cohort depth matrix store with sample name and
+    coordinate indexes
+    """
+
+    def __init__(self, depths, sample_list, chrom, start, lengths=None):
+        """
+        :param depths: numpy array or memmap, samples x positions depths
+        :param sample_list: list of sample names in row order
+        :param chrom: str, chromosome name
+        :param start: int, position of the first matrix column
+        :param lengths: numpy array of columns covered by each sample row,
+        defaults to all columns
+        """
+        if lengths is None:
+            lengths = numpy.full(len(sample_list), depths.shape[1])
+        self.depths = depths
+        self.lengths = lengths
+        self.sample_list = sample_list
+        self.chrom = chrom
+        self.start = start
+        self.end = start + depths.shape[1] - 1
+        self.sample_index = {
+            sample: row for row, sample in enumerate(sample_list)}
+
+    @property
+    def positions(self):
+        """
+        :return: numpy array of positions for each matrix column
+        """
+        return numpy.arange(self.start, self.end + 1, dtype=numpy.uint32)
+
+    def column(self, position):
+        """
+        Converts a chromosome position to a matrix column index
+        :param position: int, chromosome position
+        :return: int, column index
+        """
+        if not self.start <= position <= self.end + 1:
+            raise IndexError(f'{self.chrom}:{position} outside of matrix '
+                             f'window {self.chrom}:{self.start}-{self.end}')
+        return position - self.start
+
+    def sample_depths(self, sample, start=None, end=None):
+        """
+        Reads depths of one sample, optionally limited to a half open
+        position range. Positions after the end of the sample's depth file
+        are left out, as they are when reading the depth file itself.
+        :param sample: str, sample name
+        :param start: int, first position, defaults to window start
+        :param end: int, position after the last position, defaults to
+        window end
+        :return: numpy array of depth values
+        """
+        row = self.sample_index[sample]
+        columns = self._columns(start, end)
+        last = max(columns.start, min(columns.stop, int(self.lengths[row])))
+        return self.depths[row, columns.start:last]
+
+    def region_depths(self, start=None, end=None):
+        """
+        Reads depths of all samples within a half open position range
+        :param start: int, first position, defaults to window start
+        :param end: int, position after the last position, defaults to
+        window end
+        :return: numpy array or memmap, samples x positions depths
+        """
+        return self.depths[:, self._columns(start, end)]
+
+    def _columns(self, start, end):
+        first = self.column(self.start if start is None else start)
+        last = self.column(self.end + 1 if end is None else end)
+        return slice(first, last)
+
+
+def main():
+    args = get_cli_args()
+    # create list of sample file names
+    file_list = create_list_of_depth_files(args.file_list)
+    depth_matrix = build_depth_matrix(file_list, args.depth_dir, args.outdir)
+    print(f'{len(depth_matrix.sample_list)} samples written to '
+          f'{args.outdir}')
+
+
+def build_depth_matrix(file_list, basepath, store_dir, chrom=CHROM,
+                       start=WINDOW_START, end=WINDOW_END):
+    """
+    Writes depth values of each file into a memory-mapped matrix store.
+    Positions missing from a depth file are stored as zero depth, and the
+    number of columns up to its last position in the window is stored as
+    the sample's length.
+    :param file_list: list, list of depth file names
+    :param basepath: str, directory containing depth files
+    :param store_dir: str, directory to write the matrix store to
+    :param chrom: str, chromosome name
+    :param start: int, first position of window
+    :param end: int, last position of window
+    :return: DepthMatrix opened on the written store
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    # sample names are the file name prefix before the first underscore
+    sample_list = [file.split('_')[0] for file in file_list]
+    depths = open_memmap(os.path.join(store_dir, 'depths.npy'), mode='w+',
+                         dtype=DEPTH_DTYPE,
+                         shape=(len(file_list), end - start + 1))
+    lengths = numpy.zeros(len(file_list), dtype=numpy.int64)
+    for row, file in enumerate(file_list):
+        file_path = os.path.join(basepath, file)
+        positions, sample_depths = load_depth_arrays(file_path)
+        # place depths at their window columns, ignoring positions outside
+        in_window = (positions >= start) & (positions <= end)
+        columns = positions[in_window].astype(numpy.int64) - start
+        depths[row, columns] = sample_depths[in_window]
+        # empty depth files cover no columns
+        if len(columns):
+            lengths[row] = columns.max() + 1
+    depths.flush()
+    del depths
+    numpy.save(os.path.join(store_dir, 'lengths.npy'), lengths)
+    with open(os.path.join(store_dir, 'samples.txt'), 'w') as fh:
+        for sample in sample_list:
+            fh.write(f'{sample}\n')
+    with open(os.path.join(store_dir, 'window.json'), 'w') as fh:
+        json.dump({'chrom': chrom, 'start': start, 'end': end}, fh)
+    return open_depth_matrix(store_dir)
+
+
+def open_depth_matrix(store_dir):
+    """
+    Opens a matrix store for reading without loading depths into RAM
+    :param store_dir: str, directory of matrix store
+    :return: DepthMatrix
+    """
+    depths = numpy.load(os.path.join(store_dir, 'depths.npy'), mmap_mode='r')
+    with open(os.path.join(store_dir, 'samples.txt'), 'r') as fh:
+        sample_list = [line.strip() for line in fh]
+    with open(os.path.join(store_dir, 'window.json'), 'r') as fh:
+        window = json.load(fh)
+    # stores written without lengths cover all columns of each sample
+    lengths_path = os.path.join(store_dir, 'lengths.npy')
+    lengths = numpy.load(lengths_path) if os.path.exists(lengths_path) \
+        else None
+    return DepthMatrix(depths, sample_list, window['chrom'], window['start'],
+                       lengths)
+
+
+def get_cli_args():
+    """
+    Get command line options with argparse
+    :return: instance of argparse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Build a memory-mapped cohort depth matrix from samtools '
+                    'depth files')
+    parser.add_argument('-l', '--file-list', dest='file_list', type=str,
+                        default=DEPTH_FILE_LIST,
+                        help='text file listing depth file names')
+    parser.add_argument('-d', '--depth-dir', dest='depth_dir', type=str,
+                        default=DEPTH_DIR,
+                        help='directory containing depth files')
+    parser.add_argument('-o', '--outdir', dest='outdir', type=str,
+                        default='1000G_depth_matrix',
+                        help='directory to write the matrix store to')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+#! /usr/bin/env python3
+# depth_pipeline.py
+
+"""
+Reads each samtools depth file of the cohort once and writes the outputs of
+coverage_per_interval_ABO.py, copy_number_per_interval.py and
+copy_number_per_region.py from the same pass, instead of each script
+re-reading the whole cohort. Depth files may be gzip or bgzip compressed,
+and are streamed in blocks, so only the interval, baseline and gene region
+sums of a sample are held in memory. Outfiles named *.gz are written gzip
+compressed, and outfiles named *.npz, *.parquet or *.feather as float32
+binary tables. Giving an empty name skips an output.
+
+Each output keeps the options of its script: the baseline start, interval
+and bin size of the copy number per interval output, and the BED file of
+gene regions of the copy number per region output. The tables are the same
+as those written by the three scripts. Depths may instead be read from a
+depth_matrix.py store (-m) or a binary depth cache (-C), and with a manifest
+(-M) only new or changed depth files are read.
+
+The per-sample aggregation and the writing of the three outputs are shared
+with depth_engine.py and wide_depth.py.
+
+usage: depth_pipeline.py [-h] [-l FILE_LIST] [-d DEPTH_DIR] [-s START]
+                         [-i INTERVAL] [-b BIN_SIZE] [-r REGIONS]
+                         [-c COVERAGE_OUT] [-n COPY_NUMBER_OUT]
+                         [-g REGION_OUT] [-m MATRIX] [-C CACHE_DIR]
+                         [-M MANIFEST] [-j JOBS] [--metrics METRICS]
+                         [--profile PROFILE]
+
+Calculate ABO depth of coverage, copy number per interval and copy number
+per gene region reading each depth file once
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -l FILE_LIST, --file-list FILE_LIST
+                        text file listing depth file names
+  -d DEPTH_DIR, --depth-dir DEPTH_DIR
+                        directory containing depth files
+  -s START, --start START
+                        start position for copy number baseline interval
+  -i INTERVAL, --interval INTERVAL
+                        length of copy number baseline interval
+  -b BIN_SIZE, --bin-size BIN_SIZE
+                        number of bases per copy number interval
+  -r REGIONS, --regions REGIONS
+                        BED file of gene regions, including a Baseline region
+  -c COVERAGE_OUT, --coverage-out COVERAGE_OUT
+                        name of average depth per 100 bases outfile
+  -n COPY_NUMBER_OUT, --copy-number-out COPY_NUMBER_OUT
+                        name of copy number per interval outfile
+  -g REGION_OUT, --region-out REGION_OUT
+                        name of copy number per gene region outfile
+  -m MATRIX, --matrix MATRIX
+                        read depths from a depth_matrix.py store instead of
+                        the depth files
+  -C CACHE_DIR, --cache-dir CACHE_DIR
+                        directory for binary depth cache, reused while depth
+                        files are unchanged
+  -M MANIFEST, --manifest MANIFEST
+                        JSON manifest of per-sample results; only new or
+                        changed depth files are read
+  -j JOBS, --jobs JOBS  number of processes for reading depth files
+  --metrics METRICS     JSON report of wall time, bytes and lines read,
+                        samples per second and memory growth per stage
+  --profile PROFILE     cProfile output, hottest functions are added to the
+                        metrics report
+
+"""
+
+import argparse
+import os
+from functools import partial
+
+import numpy
+
+import copy_number_per_interval
+import copy_number_per_region
+import coverage_per_interval_ABO
+from depth_io import (DEPTH_DIR, DEPTH_FILE_LIST, IntervalAggregator,
+                      create_list_of_depth_files, iter_depth_array_blocks,
+                      lines_parsed, load_cached_depth_arrays, map_samples,
+                      map_samples_with_manifest, open_depth_file)
+from depth_matrix import WINDOW_START, open_depth_matrix
+from run_metrics import RunMetrics
+
+
+class DepthAggregator:
+    """
+    Accumulates consecutive blocks of positions and depths into the sums of
+    all three outputs: 100 base interval and baseline sums, copy number
+    interval sums and depth sums per gene region. Blocks may hold one
+    sample (1-D) or one column per sample (2-D).
+    """
+
+    def __init__(self, start, interval, region_index, bin_size=100,
+                 n_samples=None):
+        """
+        :param start: int, starting index of baseline interval
+        :param interval: int, length of interval
+        :param region_index: RegionIndex of gene regions
+        :param bin_size: int, number of bases per copy number interval
+        :param n_samples: int, number of sample columns of 2-D blocks, or
+        None for 1-D blocks of one sample
+        """
+        self.region_index = region_index
+        self.n_samples = n_samples
+        self.intervals = IntervalAggregator(
+            windows=[(start, start + interval)])
+        # copy number intervals share the 100 base sums unless resized
+        if bin_size == 100:
+            self.cn_intervals = self.intervals
+        else:
+            self.cn_intervals = IntervalAggregator(bin_size)
+        columns = () if n_samples is None else (n_samples,)
+        self.region_sums = numpy.zeros((len(region_index.names),) + columns,
+                                       dtype=numpy.int64)
+        self.region_counts = numpy.zeros(len(region_index.names),
+                                         dtype=numpy.int64)
+
+    def update(self, positions, depths):
+        """
+        Adds the next consecutive block of positions and depths
+        :param positions: numpy array of positions, one per row
+        :param depths: numpy array of depth values, one row per position
+        :return: None
+        """
+        self.intervals.update(depths)
+        if self.cn_intervals is not self.intervals:
+            self.cn_intervals.update(depths)
+        sums, counts = self.region_index.region_sums(
+            self.region_index.assign(positions), depths)
+        self.region_sums += sums
+        self.region_counts += counts
+
+    def sample_results(self):
+        """
+        Calculates the results of each sample from the sums seen so far
+        :return: list of (avg_depth_per_interval, depth_1000,
+        cn_depth_per_interval, copy_numbers) tuples, one per sample column,
+        or one for 1-D blocks. depth_1000 is None if the baseline holds no
+        bases, and copy_numbers None if a gene region has no depth.
+        """
+        n_samples = 1 if self.n_samples is None else self.n_samples
+        averages = self._per_sample(self.intervals.interval_averages())
+        cn_averages = self._per_sample(self.cn_intervals.interval_averages())
+        try:
+            baselines = self._per_sample(self.intervals.window_average(0))
+            baselines = [round(depth, 2) for depth in baselines]
+        except ZeroDivisionError:
+            baselines = [None] * n_samples
+        region_sums = self.region_sums.reshape(len(self.region_sums),
+                                               n_samples)
+        results = list()
+        for column in range(n_samples):
+            try:
+                copy_numbers = copy_number_per_region.copy_numbers_from_sums(
+                    region_sums[:, column], self.region_counts,
+                    self.region_index)
+            except ZeroDivisionError:
+                copy_numbers = None
+            results.append((averages[column], baselines[column],
+                            cn_averages[column], copy_numbers))
+        return results
+
+    def _per_sample(self, values):
+        if self.n_samples is None:
+            return [values]
+        # blocks without rows give empty interval lists per sample
+        return values or [list() for _ in range(self.n_samples)]
+
+
+def main():
+    args = get_cli_args()
+    metrics = RunMetrics('depth_pipeline.py', args.metrics, args.profile,
+                         line_counter=lines_parsed)
+    # convert start position to list index
+    start = abs(WINDOW_START - args.start)
+    region_index = copy_number_per_region.load_regions(args.regions)
+    with metrics.stage('read') as stage:
+        if args.matrix:
+            sample_list, results = process_depth_matrix(
+                open_depth_matrix(args.matrix), start, args.interval,
+                region_index, args.bin_size)
+        else:
+            # create list of sample file names
+            file_list = create_list_of_depth_files(args.file_list)
+            sample_list, results = process_files_from_list(
+                file_list, args.depth_dir, start, args.interval,
+                region_index, args.bin_size, args.cache_dir, args.jobs,
+                args.manifest)
+            if not (args.cache_dir or args.manifest):
+                stage['files'] = [os.path.join(args.depth_dir, file)
+                                  for file in file_list]
+        depth_dict, depth_1000_dict, cn_depth_dict, sample_cn_dict = \
+            create_result_dicts(sample_list, results)
+        stage['samples'] = len(sample_list)
+
+    with metrics.stage('write') as stage:
+        write_outputs(args.coverage_out, args.copy_number_out,
+                      args.region_out, sample_list, depth_dict,
+                      depth_1000_dict, cn_depth_dict, sample_cn_dict,
+                      region_index, args.bin_size)
+        stage['samples'] = len(sample_list)
+    metrics.finish()
+
+
+def process_files_from_list(file_list, depth_dir, start, interval,
+                            region_index, bin_size=100, cache_dir=None,
+                            jobs=1, manifest=None):
+    """
+    Reads each depth file once and calculates its 100 base interval
+    averages, baseline and copy number interval averages, and copy number
+    per gene region.
+    :param file_list: list, list of depth file names
+    :param depth_dir: str, directory containing depth files
+    :param start: int, starting index of baseline interval
+    :param interval: int, length of interval
+    :param region_index: RegionIndex of gene regions
+    :param bin_size: int, number of bases per copy number interval
+    :param cache_dir: str, optional directory for binary depth cache
+    :param jobs: int, number of processes used to read depth files
+    :param manifest: str, optional path to JSON manifest of per-sample
+    results, only depth files that are new or changed since are read
+    :return: sample_list, list of sample names
+    :return: results, list of per-sample results of
+    DepthAggregator.sample_results
+    """
+    # sample names are the file name prefix before the first underscore
+    sample_list = [file.split('_')[0] for file in file_list]
+    file_paths = [os.path.join(depth_dir, file) for file in file_list]
+    process_file = partial(process_depth_file, start=start,
+                           interval=interval, region_index=region_index,
+                           bin_size=bin_size, cache_dir=cache_dir)
+    if manifest:
+        # results depend on the baseline range, bin size and regions
+        key = f'pipeline:{start}:{interval}:{bin_size}:{region_index.key}'
+        results, _ = map_samples_with_manifest(process_file, file_paths,
+                                               manifest, key, jobs)
+    else:
+        results = map_samples(process_file, file_paths, jobs)
+    return sample_list, results
+
+
+def process_depth_file(file_path, start, interval, region_index,
+                       bin_size=100, cache_dir=None):
+    """
+    Streams one depth file, or its cached arrays, through a DepthAggregator
+    :param file_path: str, path to depth file
+    :param start: int, starting index of baseline interval
+    :param interval: int, length of interval
+    :param region_index: RegionIndex of gene regions
+    :param bin_size: int, number of bases per copy number interval
+    :param cache_dir: str, optional directory for binary depth cache
+    :return: tuple of avg_depth_per_interval, depth_1000,
+    cn_depth_per_interval and copy_numbers of DepthAggregator.sample_results
+    """
+    aggregator = DepthAggregator(start, interval, region_index, bin_size)
+    if cache_dir:
+        # extract depth data from cache, parsing file only if changed
+        aggregator.update(*load_cached_depth_arrays(file_path, cache_dir))
+    else:
+        # create file handle for depth file
+        with open_depth_file(file_path) as file_handle:
+            for positions, depths in iter_depth_array_blocks(file_handle):
+                aggregator.update(positions, depths)
+    return aggregator.sample_results()[0]
+
+
+def process_depth_matrix(depth_matrix, start, interval, region_index,
+                         bin_size=100):
+    """
+    Aggregates each sample row of a cohort depth matrix for all three
+    outputs.
+    :param depth_matrix: DepthMatrix, cohort depth matrix store
+    :param start: int, starting index of baseline interval
+    :param interval: int, length of interval
+    :param region_index: RegionIndex of gene regions
+    :param bin_size: int, number of bases per copy number interval
+    :return: sample_list, list of sample names
+    :return: results, list of per-sample results of
+    DepthAggregator.sample_results
+    """
+    sample_list = list(depth_matrix.sample_list)
+    positions = depth_matrix.positions
+    results = list()
+    for sample_name in sample_list:
+        # read one sample row of the memory-mapped matrix
+        depths = depth_matrix.sample_depths(sample_name)
+        aggregator = DepthAggregator(start, interval, region_index, bin_size)
+        aggregator.update(positions[:len(depths)], depths)
+        results.append(aggregator.sample_results()[0])
+    return sample_list, results
+
+
+def create_result_dicts(sample_list, results, source='samtools depth file'):
+    """
+    Sorts per-sample results into the dictionaries of the three outputs,
+    reporting samples without baseline or gene region depth
+    :param sample_list: list of sample names
+    :param results: list of per-sample results of
+    DepthAggregator.sample_results, in the order of sample_list
+    :param source: str, kind of input named when reporting a sample
+    :return: depth_dict, dictionary of sample keys with list of depth per 100
+    base interval values
+    :return: depth_1000_dict, dictionary of sample keys with baseline depths
+    :return: cn_depth_dict, dictionary of sample keys with list of depth per
+    copy number interval values
+    :return: sample_cn_dict, dictionary of sample keys with baseline depth
+    and copy number per region values
+    """
+    depth_dict = dict()
+    depth_1000_dict = dict()
+    cn_depth_dict = dict()
+    sample_cn_dict = dict()
+    for sample_name, (avg_depth_per_interval, depth_1000,
+                      cn_depth_per_interval, copy_numbers) in zip(
+            sample_list, results):
+        depth_dict[sample_name] = avg_depth_per_interval
+        # check for empty inputs, reported like the separate scripts
+        if depth_1000 is None or copy_numbers is None:
+            print(f'{sample_name}: division by zero. Review {source}')
+        if depth_1000 is not None:
+            depth_1000_dict[sample_name] = depth_1000
+            cn_depth_dict[sample_name] = cn_depth_per_interval
+        if copy_numbers is not None:
+            sample_cn_dict[sample_name] = copy_numbers
+    return depth_dict, depth_1000_dict, cn_depth_dict, sample_cn_dict
+
+
+def write_outputs(coverage_out, copy_number_out, region_out, sample_list,
+                  depth_dict, depth_1000_dict, cn_depth_dict, sample_cn_dict,
+                  region_index, bin_size=100):
+    """
+    Writes the outfiles of coverage_per_interval_ABO.py,
+    copy_number_per_interval.py and copy_number_per_region.py, skipping
+    outputs without a name
+    :param coverage_out: str, name of average depth per 100 bases outfile
+    :param copy_number_out: str, name of copy number per interval outfile
+    :param region_out: str, name of copy number per gene region outfile
+    :param sample_list: list of sample names
+    :param depth_dict: dictionary of depths per 100 base interval per sample
+    :param depth_1000_dict: dictionary of baseline depths per sample
+    :param cn_depth_dict: dictionary of depths per copy number interval per
+    sample
+    :param sample_cn_dict: dictionary of baseline depth and copy number per
+    region values per sample
+    :param region_index: RegionIndex of gene regions
+    :param bin_size: int, number of bases per copy number interval
+    :return: None
+    """
+    if coverage_out:
+        coverage_per_interval_ABO.print_data_2_file(
+            coverage_out, coverage_per_interval_ABO.create_file_headers(),
+            sample_list, depth_dict)
+    if copy_number_out:
+        copy_number_dict = copy_number_per_interval.create_copy_number_dict(
+            sample_list, depth_1000_dict, cn_depth_dict)
+        copy_number_per_interval.print_data_2_file(
+            copy_number_out,
+            copy_number_per_interval.create_file_headers(bin_size),
+            sample_list, copy_number_dict)
+    if region_out:
+        copy_number_per_region.print_data_2_file(
+            region_out, sample_list, sample_cn_dict,
+            region_index.region_names)
+
+
+def get_cli_args():
+    """
+    Get command line options with argparse
+    :return: instance of argparse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Calculate ABO depth of coverage, copy number per '
+                    'interval and copy number per gene region reading each '
+                    'depth file once')
+    parser.add_argument('-l', '--file-list', dest='file_list', type=str,
+                        default=DEPTH_FILE_LIST,
+                        help='text file listing depth file names')
+    parser.add_argument('-d', '--depth-dir', dest='depth_dir', type=str,
+                        default=DEPTH_DIR,
+                        help='directory containing depth files')
+    parser.add_argument('-s', '--start', dest='start', type=int,
+                        default=133279500,
+                        help='start position for copy number baseline '
+                             'interval')
+    parser.add_argument('-i', '--interval', dest='interval', type=int,
+                        default=5000,
+                        help='length of copy number baseline interval')
+    parser.add_argument('-b', '--bin-size', dest='bin_size', type=int,
+                        default=100,
+                        help='number of bases per copy number interval')
+    parser.add_argument('-r', '--regions', dest='regions', type=str,
+                        default=copy_number_per_region.DEFAULT_REGIONS,
+                        help='BED file of gene regions, including a Baseline '
+                             'region')
+    parser.add_argument('-c', '--coverage-out', dest='coverage_out',
+                        type=str,
+                        default='1000G_100bp_avg_read_depth_of_coverage.txt',
+                        help='name of average depth per 100 bases outfile')
+    parser.add_argument('-n', '--copy-number-out', dest='copy_number_out',
+                        type=str, default='1000G_100bp_avg_copy_number.txt',
+                        help='name of copy number per interval outfile')
+    parser.add_argument('-g', '--region-out', dest='region_out', type=str,
+                        default='copy_number_per_region.txt',
+                        help='name of copy number per gene region outfile')
+    parser.add_argument('-m', '--matrix', dest='matrix', type=str,
+                        default=None,
+                        help='read depths from a depth_matrix.py store '
+                             'instead of the depth files')
+    parser.add_argument('-C', '--cache-dir', dest='cache_dir', type=str,
+                        default=None,
+                        help='directory for binary depth cache, reused while '
+                             'depth files are unchanged')
+    parser.add_argument('-M', '--manifest', dest='manifest', type=str,
+                        default=None,
+                        help='JSON manifest of per-sample results; only new '
+                             'or changed depth files are read')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help='number of processes for reading depth files')
+    parser.add_argument('--metrics', dest='metrics', type=str,
+                        default=None,
+                        help='JSON report of wall time, bytes and lines read, '
+                             'samples per second and memory growth per stage')
+    parser.add_argument('--profile', dest='profile', type=str, default=None,
+                        help='cProfile output, hottest functions are added to '
+                             'the metrics report')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
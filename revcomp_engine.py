@@ -0,0 +1,434 @@
+# revcomp_engine.py
+
+"""
+Reverse complements variant sequences with a translation table instead of
+building a Biopython Seq object per allele. Complements follow the IUPAC
+ambiguity codes used by Bio.Seq.reverse_complement (U is complemented like
+T, lower case is kept, other characters are left unchanged), so results are
+identical to the Bio.Seq path. Results are memoized, since the same few
+alleles are repeated for every sample of a cohort; the caches are bounded so
+memory stays flat when streaming genome-wide files.
+
+Variant columns can also be dictionary encoded, so each distinct variant of
+a column is reverse complemented once and tables can be written as integer
+codes with an allele dictionary.
+
+Large query files can be split into line aligned byte chunks that are
+transformed line by line in worker processes and written back in input
+order, giving the same output as a serial run.
+
+reverse_complement.py and reverse_complement_R.py differ only in how lines
+of their query files are parsed. reverse_complement_file runs the read,
+stream, parallel, column-wise and allele dictionary modes of both, given
+the line parsing functions of a script.
+"""
+
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+# IUPAC DNA complements, as in Bio.Data.IUPACData.ambiguous_dna_complement
+_COMPLEMENTS = {
+    'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A', 'U': 'A',
+    'M': 'K', 'R': 'Y', 'W': 'W', 'S': 'S', 'Y': 'R', 'K': 'M',
+    'V': 'B', 'H': 'D', 'D': 'H', 'B': 'V', 'X': 'X', 'N': 'N',
+}
+COMPLEMENT_TABLE = str.maketrans(
+    ''.join(_COMPLEMENTS) + ''.join(_COMPLEMENTS).lower(),
+    ''.join(_COMPLEMENTS.values()) + ''.join(_COMPLEMENTS.values()).lower())
+# number of distinct sequences and variants kept in each cache
+CACHE_SIZE = 2 ** 16
+# bytes of input transformed per parallel chunk
+CHUNK_BYTES = 2 ** 24
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def reverse_complement_seq(seq):
+    """
+    Reverse complements one sequence
+    :param seq: str, nucleotide sequence
+    :return: str, reverse complemented sequence
+    """
+    return seq.translate(COMPLEMENT_TABLE)[::-1]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def reverse_complement_variant(variant, strip_quotes=False):
+    """
+    Reverse complements one variant field of a bcftools query file. Fields
+    holding A/B genotypes or indels are split on the slash and the first two
+    alleles are reverse complemented in place.
+    :param variant: str, variant sequence, may end with a newline
+    :param strip_quotes: bool, remove quote marks around A/B alleles
+    :return: str, reverse complemented variant
+    """
+    # remove newline character if present
+    variant = variant.strip()
+    # determine if variant is indel
+    if '/' in variant:
+        indel = variant.split('/')
+        seq1, seq2 = indel[0], indel[1]
+        if strip_quotes:
+            seq1, seq2 = seq1.strip('"'), seq2.strip('"')
+        return '/'.join((reverse_complement_seq(seq1),
+                         reverse_complement_seq(seq2)))
+    return reverse_complement_seq(variant)
+
+
+def encode_columns(rows):
+    """
+    Dictionary encodes the variant columns of a bcftools query table. Each
+    distinct variant of a column gets an integer code in order of first
+    appearance, so the few distinct genotypes of a column can be
+    transformed once instead of once per sample.
+    :param rows: iterable of lists of variant fields, one list per sample
+    :return: codes, list of lists of integer variant codes, one per sample
+    :return: alleles, list of lists of distinct variants per column, indexed
+    by code
+    """
+    codes = list()
+    alleles = list()
+    column_codes = list()
+    for row in rows:
+        row_codes = list()
+        for column, variant in enumerate(row):
+            # remove newline character of last column if present
+            variant = variant.strip()
+            if column == len(column_codes):
+                column_codes.append(dict())
+                alleles.append(list())
+            code = column_codes[column].get(variant)
+            if code is None:
+                code = len(alleles[column])
+                column_codes[column][variant] = code
+                alleles[column].append(variant)
+            row_codes.append(code)
+        codes.append(row_codes)
+    return codes, alleles
+
+
+def reverse_complement_alleles(alleles, strip_quotes=False):
+    """
+    Reverse complements the distinct variants of each column once
+    :param alleles: list of lists of distinct variants per column
+    :param strip_quotes: bool, remove quote marks around A/B alleles
+    :return: list of lists of reverse complemented variants per column
+    """
+    return [[reverse_complement_variant(variant, strip_quotes)
+             for variant in column] for column in alleles]
+
+
+def decode_columns(codes, alleles):
+    """
+    Replaces integer variant codes by their variants
+    :param codes: list of lists of integer variant codes, one per sample
+    :param alleles: list of lists of variants per column, indexed by code
+    :return: list of lists of variants, one per sample
+    """
+    return [[alleles[column][code] for column, code in enumerate(row_codes)]
+            for row_codes in codes]
+
+
+def write_allele_dictionary(outfile_handle, column_names, alleles):
+    """
+    Writes the variant of each code of each column to a tab delimited text
+    file with one column name, code and variant per line
+    :param outfile_handle: file handle for allele dictionary file
+    :param column_names: list of variant column names
+    :param alleles: list of lists of variants per column, indexed by code
+    :return: none
+    """
+    outfile_handle.write('Column\tCode\tAllele\n')
+    for column, column_alleles in enumerate(alleles):
+        # number columns missing from the header from 1
+        if column < len(column_names):
+            name = column_names[column]
+        else:
+            name = str(column + 1)
+        for code, allele in enumerate(column_alleles):
+            outfile_handle.write(f'{name}\t{code}\t{allele}\n')
+
+
+def line_aligned_chunks(file_path, chunk_bytes=CHUNK_BYTES):
+    """
+    Splits a text file into byte ranges of about chunk_bytes that start at
+    the beginning of a line and end after a newline or at the end of file
+    :param file_path: str, path to text file
+    :param chunk_bytes: int, approximate number of bytes per chunk
+    :return: list of (start, end) byte offsets of chunks in file order
+    """
+    size = os.path.getsize(file_path)
+    chunks = list()
+    with open(file_path, 'rb') as fh:
+        start = 0
+        while start < size:
+            end = start + chunk_bytes
+            if end < size:
+                # extend chunk to the end of the line holding its last byte
+                fh.seek(end - 1)
+                fh.readline()
+                end = fh.tell()
+            end = min(end, size)
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def transform_lines_parallel(file_path, outfile_handle, transform_line, jobs,
+                             chunk_bytes=CHUNK_BYTES):
+    """
+    Applies a line function to each line of a text file in worker processes
+    and writes the results in input order. A few chunks per worker are in
+    flight at a time, so memory does not grow with the file size.
+    :param file_path: str, path to text file
+    :param outfile_handle: file handle for outfile
+    :param transform_line: picklable function of one line returning the
+    text written for it
+    :param jobs: int, number of worker processes
+    :param chunk_bytes: int, approximate number of bytes per chunk
+    :return: int, number of lines read
+    """
+    transform_chunk = partial(_transform_chunk, file_path=file_path,
+                              transform_line=transform_line)
+    n_lines = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for chunk in line_aligned_chunks(file_path, chunk_bytes):
+            pending.append(executor.submit(transform_chunk, chunk))
+            if len(pending) >= 2 * jobs:
+                n_lines += _write_chunk(outfile_handle, pending.popleft())
+        while pending:
+            n_lines += _write_chunk(outfile_handle, pending.popleft())
+    return n_lines
+
+
+def _write_chunk(outfile_handle, future):
+    """
+    Writes the transformed lines of a chunk once its worker is done
+    :param outfile_handle: file handle for outfile
+    :param future: future of _transform_chunk
+    :return: int, number of lines in chunk
+    """
+    text, n_lines = future.result()
+    outfile_handle.write(text)
+    return n_lines
+
+
+def _transform_chunk(chunk, file_path, transform_line):
+    start, end = chunk
+    with open(file_path, 'rb') as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    # decode and split lines as a serial read with open() would
+    lines = io.TextIOWrapper(io.BytesIO(data))
+    transformed = [transform_line(line) for line in lines]
+    return ''.join(transformed), len(transformed)
+
+
+def reverse_complement_file(args, metrics, reverse_complement_line,
+                            get_sample_variant_dictionary,
+                            strip_quotes=False, read_variants=None):
+    """
+    Reads, reverse complements and writes the variants in the mode selected
+    on the command line, recording the metrics of each stage
+    :param args: instance of argparse arguments with infile, outfile,
+    stream, column_wise, alleles and jobs
+    :param metrics: RunMetrics of this run
+    :param reverse_complement_line: picklable function converting one line
+    of the infile to its outfile line
+    :param get_sample_variant_dictionary: function of an infile handle
+    returning header_line, sample_list and sample_variant_dict
+    :param strip_quotes: bool, remove quote marks around A/B alleles
+    :param read_variants: optional function without arguments returning
+    header_line, sample_list and sample_variant_dict, read instead of the
+    infile
+    :return: none
+    """
+    infile = args.infile
+    outfile = args.outfile
+
+    if read_variants:
+        with metrics.stage('read') as stage:
+            header_line, sample_list, sample_variant_dict = read_variants()
+            stage['samples'] = len(sample_list)
+    elif args.jobs:
+        with metrics.stage('parallel') as stage:
+            # reverse complement chunks of lines in worker processes
+            outfile_handle = get_fh(file=outfile, mode='w')
+            stage['lines_read'] = transform_lines_parallel(
+                infile, outfile_handle, reverse_complement_line, args.jobs)
+            outfile_handle.close()
+            stage['files'] = [infile]
+            stage['outfile'] = outfile
+        return
+    elif args.stream:
+        with metrics.stage('stream') as stage:
+            # reverse complement and write variants line by line
+            infile_handle = get_fh(file=infile, mode='r')
+            outfile_handle = get_fh(file=outfile, mode='w')
+            stage['lines_read'] = stream_reverse_complements(
+                infile_handle, outfile_handle, reverse_complement_line)
+            infile_handle.close()
+            outfile_handle.close()
+            stage['files'] = [infile]
+            stage['outfile'] = outfile
+        return
+    else:
+        with metrics.stage('read') as stage:
+            # iterate over lines of text file to create dictionary of
+            # variants
+            infile_handle = get_fh(file=infile, mode='r')
+            lines = _CountedLines(infile_handle)
+            header_line, sample_list, sample_variant_dict = \
+                get_sample_variant_dictionary(lines)
+            infile_handle.close()
+            stage['samples'] = len(sample_list)
+            stage['files'] = [infile]
+            stage['lines_read'] = lines.count
+    with metrics.stage('reverse_complement') as stage:
+        if args.column_wise or args.alleles:
+            # encode variants as integer codes per column and reverse
+            # complement the distinct variants of each column once
+            codes, alleles = encode_columns(
+                [sample_variant_dict[sample] for sample in sample_list])
+            rc_alleles = reverse_complement_alleles(alleles, strip_quotes)
+        if args.column_wise:
+            # replace codes by reverse complemented variants
+            reverse_complement_sample_variant_dict = dict(
+                zip(sample_list, decode_columns(codes, rc_alleles)))
+        elif not args.alleles:
+            # reverse complement variants in dictionary
+            reverse_complement_sample_variant_dict = reverse_complement(
+                sample_list, sample_variant_dict, strip_quotes)
+        stage['samples'] = len(sample_list)
+    with metrics.stage('write') as stage:
+        # create outfile for writing
+        outfile_handle = get_fh(file=outfile, mode='w')
+        if args.alleles:
+            # write variant codes and allele dictionary
+            write_codes_2_file(outfile_handle, header_line, sample_list,
+                               codes)
+            alleles_handle = get_fh(file=args.alleles, mode='w')
+            column_names = header_line.rstrip('\n').split('\t')[1:]
+            write_allele_dictionary(alleles_handle, column_names, rc_alleles)
+            alleles_handle.close()
+        else:
+            # write reverse complemented variants to file
+            write_reverse_complements_2_file(
+                outfile_handle, header_line, sample_list,
+                reverse_complement_sample_variant_dict)
+        outfile_handle.close()
+        stage['samples'] = len(sample_list)
+        stage['outfile'] = outfile
+
+
+class _CountedLines:
+    """
+    Iterates over the lines of a file handle, counting the lines read
+    """
+
+    def __init__(self, file_handle):
+        """
+        :param file_handle: text file handle
+        """
+        self.file_handle = file_handle
+        self.count = 0
+
+    def __iter__(self):
+        for line in self.file_handle:
+            self.count += 1
+            yield line
+
+
+def reverse_complement(sample_list, sample_variant_dict, strip_quotes=False):
+    """
+    reverse complements sequences in sample_variant_dict
+    :param sample_list: list of sample names
+    :param sample_variant_dict: dict of sample keys with variant seq
+    lists
+    :param strip_quotes: bool, remove quote marks around A/B alleles
+    :return: reverse_complement_sample_variant_dict
+    """
+    reverse_complement_sample_variant_dict = {}
+    for sample in sample_list:
+        variant_list = sample_variant_dict[sample]
+        rc_variant_list = []
+        for variant in variant_list:
+            # reverse complement sequence, reusing results of repeated
+            # variants
+            rc_variant_list.append(
+                reverse_complement_variant(variant, strip_quotes))
+        # add sample rc_variant_list to reverse_complement_sample_dict
+        reverse_complement_sample_variant_dict[sample] = rc_variant_list
+    return reverse_complement_sample_variant_dict
+
+
+def stream_reverse_complements(infile_handle, outfile_handle,
+                               reverse_complement_line):
+    """
+    Reads a bcftools query file by line and writes each header and sample
+    line to the outfile with reverse complemented variants as soon as it is
+    read, holding one line in memory at a time
+    :param infile_handle: tab delimited bcftools query file handle
+    :param outfile_handle: file handle for outfile
+    :param reverse_complement_line: function converting one line of the
+    infile to its outfile line
+    :return: int, number of lines read
+    """
+    n_lines = 0
+    for line in infile_handle:
+        outfile_handle.write(reverse_complement_line(line))
+        n_lines += 1
+    return n_lines
+
+
+def write_reverse_complements_2_file(outfile_handle,
+                                     header_line, sample_list,
+                                     reverse_complement_sample_variant_dict):
+    """
+    writes reverse complemented sample variants to tab delimited text file
+    :param outfile_handle: file handle for outfile
+    :param header_line: str, tab separated header line
+    :param sample_list: list of sample names
+    :param reverse_complement_sample_variant_dict: dict, sample name keys,
+    lists of variant seq values
+    :return: none
+    """
+    outfile_handle.write(f'{header_line}')
+    for sample in sample_list:
+        variant_str = "\t".join(reverse_complement_sample_variant_dict[sample])
+        sample_line = f'{sample}\t{variant_str}\n'
+        outfile_handle.write(sample_line)
+
+
+def write_codes_2_file(outfile_handle, header_line, sample_list, codes):
+    """
+    writes integer variant codes of each sample to tab delimited text file
+    :param outfile_handle: file handle for outfile
+    :param header_line: str, tab separated header line
+    :param sample_list: list of sample names
+    :param codes: list of lists of integer variant codes, one per sample
+    :return: none
+    """
+    outfile_handle.write(f'{header_line}')
+    for sample, sample_codes in zip(sample_list, codes):
+        code_str = "\t".join(str(code) for code in sample_codes)
+        outfile_handle.write(f'{sample}\t{code_str}\n')
+
+
+def get_fh(file=None, mode=None):
+    """
+    Opens a file for reading or writing and returns a handle
+    :param file: str, file name
+    :param mode: str, mode for opening file, "r" or "w"
+    :return: file handle
+    """
+    try:
+        handle = open(file, mode)
+        return handle
+    except IOError:
+        raise IOError(f'File not found: "{file}"')
+    except ValueError:
+        raise ValueError(f'Could not open file: {file} for mode "{mode}"')
@@ -7,6 +7,8 @@ complements the variant sequences, and writes them to a new tab delimited
 text file.
 
 usage: reverse_complement.py [-h] [-i INFILE] [-o OUTFILE]
+                             [-s | -c | -a ALLELES | -j JOBS]
+                             [--metrics METRICS] [--profile PROFILE]
 
 Enter infile and outfile names for reverse complementing.
 
@@ -16,11 +18,48 @@ optional arguments:
                         path to the file to open
   -o OUTFILE, --outfile OUTFILE
                         name of outfile
+  -s, --stream          reverse complement and write each sample line as it
+                        is read
+  -c, --column-wise     reverse complement each distinct variant of a column
+                        once
+  -a ALLELES, --alleles ALLELES
+                        write integer variant codes to outfile and the
+                        allele dictionary to this file
+  -j JOBS, --jobs JOBS  reverse complement line aligned chunks of the infile
+                        in this many processes
+  --metrics METRICS     JSON report of wall time, bytes and lines read,
+                        samples per second and memory growth per stage
+  --profile PROFILE     cProfile output, hottest functions are added to the
+                        metrics report
+
+Variants are reverse complemented with a translation table of IUPAC codes,
+giving the same sequences as Bio.Seq without importing Biopython.
+
+With --stream each sample line is reverse complemented and written as soon
+as it is read, in input order, so memory use does not grow with the number
+of samples or variants in the file.
+
+With --column-wise the distinct variants of each column are found first and
+reverse complemented once, so the work grows with the number of distinct
+variants rather than the number of table cells. With --alleles the table is
+written with an integer code per variant instead of its sequence, and the
+reverse complemented variant of each code of each column is written to the
+allele dictionary file as Column, Code and Allele columns.
+
+With --jobs the infile is split into chunks of whole lines that are reverse
+complemented line by line in worker processes and written in input order,
+giving the same outfile as --stream.
+
+--metrics times the read, reverse_complement and write stages, or the single
+stream or parallel stage of --stream and --jobs.
 
 """
 
 import argparse
-from Bio.Seq import Seq
+
+from revcomp_engine import (reverse_complement_file,
+                            reverse_complement_variant)
+from run_metrics import RunMetrics
 
 
 def main():
@@ -29,81 +68,33 @@ def main():
     """
     # get command line arguments
     args = get_cli_args()
-    infile = args.infile
-    outfile = args.outfile
-
-    # open text file for reading
-    infile_handle = get_fh(file=infile, mode='r')
-    # iterate over lines of text file to create dictionary of variants
-    header_line, sample_list, sample_variant_dict = \
-        get_sample_variant_dictionary(infile_handle)
-    infile_handle.close()
-    # reverse complement variants in dictionary
-    reverse_complement_sample_variant_dict = \
-        reverse_complement(sample_list, sample_variant_dict)
-    # create outfile for writing
-    outfile_handle = get_fh(file=outfile, mode='w')
-    # write reverse complemented variants to file
-    write_reverse_complements_2_file(outfile_handle, header_line, sample_list,
-                                     reverse_complement_sample_variant_dict)
-    outfile_handle.close()
-
-
-def write_reverse_complements_2_file(outfile_handle,
-                                     header_line, sample_list,
-                                     reverse_complement_sample_variant_dict):
-    """
-    writes reverse complemented sample variants to tab delimited text file
-    :param outfile_handle: file handle for outfile
-    :param header_line: str, tab separated header line
-    :param sample_list: list of sample names
-    :param reverse_complement_sample_variant_dict: dict, sample name keys,
-    lists of variant seq values
-    :return: none
-    """
-    outfile_handle.write(f'{header_line}')
-    for sample in sample_list:
-        variant_str = "\t".join(reverse_complement_sample_variant_dict[sample])
-        sample_line = f'{sample}\t{variant_str}\n'
-        outfile_handle.write(sample_line)
+    metrics = RunMetrics('reverse_complement_R.py', args.metrics,
+                         args.profile)
+    reverse_complement_file(args, metrics, reverse_complement_line,
+                            get_sample_variant_dictionary, strip_quotes=True)
+    metrics.finish()
 
 
-def reverse_complement(sample_list, sample_variant_dict):
+def reverse_complement_line(line):
     """
-    reverse complements sequences in sample_variant_dict
-    :param sample_list: list of sample names
-    :param sample_variant_dict: dict of sample keys with variant seq
-    lists
-    :return: reverse_complement_sample_variant_dict
+    Converts one line of a bcftools query file to its outfile line: sample
+    lines get their sample name and reverse complemented variants and any
+    other line is a header line with a Sample first column
+    :param line: str, line of bcftools query file
+    :return: str, line to write to outfile
     """
-    reverse_complement_sample_variant_dict = {}
-    for sample in sample_list:
-        variant_list = sample_variant_dict[sample]
-        rc_variant_list = []
-        for variant in variant_list:
-            # remove newline character if present
-            variant = variant.strip()
-            # determine if variant is indel
-            slash = "/"
-            if slash in variant:
-                indel = variant.split("/")
-                # remove quote marks
-                # reverse complement sequences
-                seq1 = str(Seq(indel[0].strip('"')).reverse_complement())
-                seq2 = str(Seq(indel[1].strip('"')).reverse_complement())
-                # rejoin indel variants
-                rc_indel = [seq1, seq2]
-                my_seq = "/".join(rc_indel)
-                # append reverse complemented variant to list
-                rc_variant_list.append(my_seq)
-            else:
-                # reverse complement sequence
-                my_seq = str(Seq(variant).reverse_complement())
-                # append reverse complemented variant to list
-                rc_variant_list.append(my_seq)
-        # add sample rc_variant_list to reverse_complement_sample_dict
-        reverse_complement_sample_variant_dict[sample] = rc_variant_list
-    return reverse_complement_sample_variant_dict
+    line = line.split("\t")
+    # identify sample lines
+    if "X" in line[0]:
+        # split on . to extract sample name, index 2
+        sample = line[0].split(".")[2]
+        variant_str = "\t".join(
+            [reverse_complement_variant(variant, strip_quotes=True)
+             for variant in line[1:]])
+        return f'{sample}\t{variant_str}\n'
+    # header line
+    line[0] = "Sample"
+    return "\t".join(line)
 
 
 def get_sample_variant_dictionary(file_handle):
@@ -139,22 +130,6 @@ def get_sample_variant_dictionary(file_handle):
     return header_line, sample_list, sample_variant_dict
 
 
-def get_fh(file=None, mode=None):
-    """
-    Opens a file for reading or writing and returns a handle
-    :param file: str, file name
-    :param mode: str, mode for opening file, "r" or "w"
-    :return: file handle
-    """
-    try:
-        handle = open(file, mode)
-        return handle
-    except IOError:
-        raise IOError(f'File not found: "{file}"')
-    except ValueError:
-        raise ValueError(f'Could not open file: {file} for mode "{mode}"')
-
-
 def get_cli_args():
     """
     Get command line options with argparse
@@ -166,6 +141,28 @@ def get_cli_args():
                         type=str, help='path to the file to open')
     parser.add_argument('-o', '--outfile', dest='outfile',
                         type=str, help='name of outfile')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('-s', '--stream', dest='stream', action='store_true',
+                      help='reverse complement and write each sample line '
+                           'as it is read')
+    mode.add_argument('-c', '--column-wise', dest='column_wise',
+                      action='store_true',
+                      help='reverse complement each distinct variant of a '
+                           'column once')
+    mode.add_argument('-a', '--alleles', dest='alleles', type=str,
+                      default=None,
+                      help='write integer variant codes to outfile and the '
+                           'allele dictionary to this file')
+    mode.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                      help='reverse complement line aligned chunks of the '
+                           'infile in this many processes')
+    parser.add_argument('--metrics', dest='metrics', type=str,
+                        default=None,
+                        help='JSON report of wall time, bytes and lines read, '
+                             'samples per second and memory growth per stage')
+    parser.add_argument('--profile', dest='profile', type=str, default=None,
+                        help='cProfile output, hottest functions are added to '
+                             'the metrics report')
     return parser.parse_args()
 
 
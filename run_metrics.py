@@ -0,0 +1,156 @@
+# run_metrics.py
+
+"""
+Records wall time, bytes and lines read, samples per second and growth of
+peak resident memory of each stage of a script run, and writes them to a
+JSON report with the peak memory of the whole run. Optionally the run is
+profiled with cProfile; the profile is dumped for pstats or snakeviz and its
+hottest functions are added to the report.
+
+The peak resident memory of a process only grows, so the peak_rss_growth_mb
+of a stage is how much the peak grew during the stage, not the peak of the
+stage itself: a stage using less memory than an earlier one reports 0. The
+peak_rss_mb of the report is the peak of the whole run. Stages that read
+files in worker processes (--jobs) are timed as a whole; their memory growth
+includes finished worker processes, and only the main process is profiled.
+Lines are counted by the parsers while they read, through a line counter
+passed to RunMetrics or a lines_read count set by the stage, so files are
+never read a second time for the report.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# number of functions listed in the report of a profiled run
+HOTTEST_FUNCTIONS = 20
+
+
+class RunMetrics:
+    """
+    Collects metrics of the stages of a run. Without a report or profile
+    path stages are not measured, so scripts can use the same calls
+    whether metrics are requested or not.
+    """
+
+    def __init__(self, script, report_path=None, profile_path=None,
+                 line_counter=None):
+        """
+        :param script: str, name of the script in the report
+        :param report_path: str, path to JSON metrics report, or None
+        :param profile_path: str, path to cProfile output, or None
+        :param line_counter: function without arguments returning the
+        number of lines parsed so far, e.g. depth_io.lines_parsed, or None
+        """
+        self.script = script
+        self.report_path = report_path
+        self.profile_path = profile_path
+        self.line_counter = line_counter
+        self.enabled = bool(report_path or profile_path)
+        self.stages = list()
+        self.start = time.perf_counter()
+        self.profiler = None
+        if profile_path:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measures one stage of the run. The caller fills in the yielded
+        dictionary: samples, the number of samples processed, files, paths
+        of files read, lines_read, the number of lines read if not counted
+        by the line counter, and outfile, the path of a file written.
+        :param name: str, name of stage
+        :return: dictionary of stage details
+        """
+        details = dict()
+        start_rss = peak_rss_mb()
+        start_lines = self.line_counter() if self.line_counter else 0
+        start = time.perf_counter()
+        yield details
+        if not self.enabled:
+            return
+        seconds = time.perf_counter() - start
+        peak_rss_growth = peak_rss_mb() - start_rss
+        record = {'stage': name, 'seconds': round(seconds, 6)}
+        samples = details.get('samples')
+        if samples is not None:
+            record['samples'] = samples
+            record['samples_per_second'] = \
+                round(samples / seconds, 3) if seconds else None
+        files = details.get('files')
+        if files is not None:
+            record['bytes_read'] = sum(os.path.getsize(path) for path in files)
+        lines = details.get('lines_read')
+        if lines is None and self.line_counter:
+            lines = self.line_counter() - start_lines
+            # stages reading no files, e.g. write stages, report no lines
+            if not lines and files is None:
+                lines = None
+        if lines is not None:
+            record['lines_read'] = lines
+        outfile = details.get('outfile')
+        if outfile and os.path.exists(outfile):
+            record['bytes_written'] = os.path.getsize(outfile)
+        record['peak_rss_growth_mb'] = round(peak_rss_growth, 1)
+        self.stages.append(record)
+
+    def finish(self):
+        """
+        Stops profiling and writes the metrics report and profile
+        :return: None
+        """
+        if not self.enabled:
+            return
+        report = {'script': self.script,
+                  'argv': sys.argv[1:],
+                  'seconds': round(time.perf_counter() - self.start, 6),
+                  'peak_rss_mb': round(peak_rss_mb(), 1),
+                  'stages': self.stages}
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            report['profile'] = self.profile_path
+            report['hottest_functions'] = hottest_functions(self.profiler)
+        if self.report_path:
+            with open(self.report_path, 'w') as fh:
+                json.dump(report, fh, indent=2)
+
+
+def hottest_functions(profiler, limit=HOTTEST_FUNCTIONS):
+    """
+    Lists the functions of a profile with the most time spent in their own
+    code
+    :param profiler: cProfile.Profile
+    :param limit: int, number of functions listed
+    :return: list of dictionaries of function, calls, seconds in the
+    function and cumulative seconds including its callees
+    """
+    stats = pstats.Stats(profiler).stats
+    functions = sorted(stats.items(), key=lambda item: item[1][2],
+                       reverse=True)
+    return [{'function': f'{file}:{line}({name})',
+             'calls': calls,
+             'seconds': round(own_time, 6),
+             'cumulative_seconds': round(cumulative_time, 6)}
+            for (file, line, name), (_, calls, own_time, cumulative_time, _)
+            in functions[:limit]]
+
+
+def peak_rss_mb():
+    """
+    :return: float, peak resident memory of this process and its finished
+    child processes in MB
+    """
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    if sys.platform == 'darwin':
+        return peak / 2 ** 20
+    return peak / 2 ** 10
@@ -0,0 +1,30 @@
+# conftest.py
+
+"""
+Makes the scripts in the repository root importable by the tests, and
+provides helpers writing small samtools depth files.
+"""
+
+import os
+import sys
+
+import pytest
+
+# the scripts are run from the repository root, not installed
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def write_depth_file(tmp_path):
+    """
+    :return: function writing depth values to a samtools depth file of
+    consecutive positions, returning its path
+    """
+    def write(name, depths, start=133255176, chrom='chr9'):
+        path = tmp_path / name
+        with open(path, 'w') as fh:
+            for offset, depth in enumerate(depths):
+                fh.write(f'{chrom}\t{start + offset}\t{depth}\n')
+        return str(path)
+    return write
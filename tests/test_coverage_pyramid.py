@@ -0,0 +1,37 @@
+import numpy
+import pytest
+
+from coverage_pyramid import build_pyramid
+from depth_matrix import DepthMatrix
+
+
+@pytest.fixture
+def pyramid(tmp_path):
+    """
+    Pyramid of three samples of depth 40, the second truncated after 25 of
+    its 50 positions and the third empty
+    """
+    depths = numpy.full((3, 50), 40, dtype=numpy.uint32)
+    depths[0, ::2] = 20
+    depths[1:, 25:] = 0
+    depths[2] = 0
+    matrix = DepthMatrix(depths, ['HG1', 'HG2', 'HG3'], 'chr9', 100,
+                         lengths=numpy.array([50, 25, 0]))
+    return build_pyramid(matrix, str(tmp_path / 'pyramid'), [1, 10, 20])
+
+
+def test_uncovered_positions_are_nan(pyramid):
+    means = pyramid.level(20, 'mean')
+    assert means[0].tolist() == [30, 30, 30]
+    # the second bin of the truncated sample covers 5 of its 20 positions
+    assert means[1, :2].tolist() == [40, 40]
+    assert numpy.isnan(means[1, 2])
+    assert numpy.isnan(means[2]).all()
+    assert numpy.isnan(pyramid.level(1, 'min')[1, 25:]).all()
+
+
+def test_cohort_leaves_out_uncovered_samples(pyramid):
+    assert pyramid.level(20, 'mean', cohort=True).tolist() == [35, 35, 30]
+    assert pyramid.level(20, 'min', cohort=True).tolist() == [20, 20, 20]
+    assert pyramid.level(20, 'max', cohort=True).tolist() == [40, 40, 40]
+    assert pyramid.level(10, 'min', cohort=True)[-1] == 20
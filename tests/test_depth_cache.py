@@ -0,0 +1,51 @@
+import os
+
+import numpy
+
+from depth_io import lines_parsed, load_cached_depth_arrays
+
+
+def test_unchanged_file_is_memory_mapped_from_cache(write_depth_file,
+                                                    tmp_path):
+    path = write_depth_file('HG1.txt', [3, 4, 5])
+    cache_dir = str(tmp_path / 'cache')
+    positions, depths = load_cached_depth_arrays(path, cache_dir)
+    assert not isinstance(depths, numpy.memmap)
+    start = lines_parsed()
+    cached_positions, cached_depths = load_cached_depth_arrays(path,
+                                                               cache_dir)
+    # the second load parses no lines and maps the cached array
+    assert lines_parsed() == start
+    assert isinstance(cached_depths, numpy.memmap)
+    assert cached_positions.tolist() == positions.tolist()
+    assert cached_depths.tolist() == [3, 4, 5]
+
+
+def test_rewritten_file_rebuilds_cache(write_depth_file, tmp_path):
+    path = write_depth_file('HG1.txt', [3, 4, 5])
+    cache_dir = str(tmp_path / 'cache')
+    load_cached_depth_arrays(path, cache_dir)
+    # same size, later modification time
+    write_depth_file('HG1.txt', [6, 7, 8])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    positions, depths = load_cached_depth_arrays(path, cache_dir)
+    assert depths.tolist() == [6, 7, 8]
+    # same modification time, different size
+    mtime_ns = os.stat(path).st_mtime_ns
+    write_depth_file('HG1.txt', [6, 7, 8, 9])
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    positions, depths = load_cached_depth_arrays(path, cache_dir)
+    assert depths.tolist() == [6, 7, 8, 9]
+    assert positions.tolist()[-1] == 133255179
+
+
+def test_corrupt_cache_entry_is_rebuilt(write_depth_file, tmp_path):
+    path = write_depth_file('HG1.txt', [3, 4, 5])
+    cache_dir = tmp_path / 'cache'
+    load_cached_depth_arrays(path, str(cache_dir))
+    (cache_dir / 'HG1.txt.json').write_text('{not json')
+    positions, depths = load_cached_depth_arrays(path, str(cache_dir))
+    assert depths.tolist() == [3, 4, 5]
+    assert isinstance(load_cached_depth_arrays(path, str(cache_dir))[1],
+                      numpy.memmap)
@@ -0,0 +1,49 @@
+import json
+import os
+import stat
+
+import pytest
+
+from depth_driver import run_depth_jobs
+
+# fails the first run of each sample, then writes a one line depth file
+FAKE_SAMTOOLS = '''#!/bin/sh
+for last; do :; done
+marker="$last.failed"
+if [ ! -e "$marker" ]; then
+    touch "$marker"
+    echo "[E::hts_open] fail" >&2
+    exit 3
+fi
+printf 'chr9\\t133255176\\t7\\n' > "$last"
+'''
+
+
+@pytest.fixture
+def fake_samtools(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    samtools = bin_dir / 'samtools'
+    samtools.write_text(FAKE_SAMTOOLS)
+    samtools.chmod(samtools.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+
+
+@pytest.mark.parametrize('retries, status', [(1, 'done'), (0, 'failed')])
+def test_log_of_retried_job(tmp_path, fake_samtools, retries, status):
+    cram = tmp_path / 'HG1.cram'
+    cram.write_text('')
+    depth = tmp_path / 'HG1.txt'
+    log = tmp_path / 'log.jsonl'
+    run_depth_jobs([('HG1', str(cram), str(depth))], 'chr9:1-2',
+                   retries=retries, log_file=str(log))
+    result = json.loads(log.read_text())
+    assert result['status'] == status
+    assert result['failed_attempts'] == [
+        {'attempt': 1, 'returncode': 3, 'stderr': '[E::hts_open] fail'}]
+    if status == 'done':
+        assert 'returncode' not in result and 'stderr' not in result
+        assert depth.read_text() == 'chr9\t133255176\t7\n'
+    else:
+        assert result['returncode'] == 3
+        assert not depth.exists()
@@ -0,0 +1,76 @@
+import numpy
+import pytest
+
+from depth_engine import compute_depth, open_alignment_file
+from depth_matrix import CHROM, WINDOW_START
+
+pysam = pytest.importorskip('pysam')
+
+# flags of synthetic reads: forward, reverse, paired, supplementary and
+# each flag excluded by samtools depth
+SYNTHETIC_FLAGS = (0, 0x10, 0x1 | 0x2 | 0x40, 0x800, 0x4, 0x100, 0x200,
+                   0x400)
+START = WINDOW_START
+END = WINDOW_START + 4999
+
+
+@pytest.fixture(scope='module')
+def synthetic_bam(tmp_path_factory):
+    """
+    Indexed BAM file of random reads around START-END, with insertions,
+    deletions, reference skips, soft clips, excluded flags and random
+    mapping qualities, some overlapping the ends of the region
+    """
+    rng = numpy.random.default_rng(0)
+    bam_path = str(tmp_path_factory.mktemp('bam') / 'synthetic.bam')
+    header = {'HD': {'VN': '1.6', 'SO': 'coordinate'},
+              'SQ': [{'SN': CHROM, 'LN': END + 10000}]}
+    reads = list()
+    for i in range(2000):
+        # soft clip, then aligned blocks joined by an indel or skip
+        cigar = [(4, int(rng.integers(0, 10)))]
+        for block in range(int(rng.integers(1, 4))):
+            if block:
+                cigar.append((int(rng.choice([1, 2, 3])),
+                              int(rng.integers(1, 50))))
+            cigar.append((0, int(rng.integers(10, 100))))
+        cigar.append((4, int(rng.integers(0, 10))))
+        cigar = [(op, n) for op, n in cigar if n]
+        read = pysam.AlignedSegment()
+        read.query_name = f'read{i}'
+        read.reference_id = 0
+        read.reference_start = int(rng.integers(START - 300, END + 100))
+        read.cigartuples = cigar
+        query_length = sum(n for op, n in cigar if op in (0, 1, 4))
+        read.query_sequence = ''.join(rng.choice(list('ACGT'), query_length))
+        read.query_qualities = pysam.qualitystring_to_array(
+            'I' * query_length)
+        read.flag = int(rng.choice(SYNTHETIC_FLAGS))
+        read.mapping_quality = int(rng.integers(0, 61))
+        reads.append(read)
+    reads.sort(key=lambda read: read.reference_start)
+    with pysam.AlignmentFile(bam_path, 'wb', header=header) as bam:
+        for read in reads:
+            bam.write(read)
+    pysam.index(bam_path)
+    return bam_path
+
+
+@pytest.mark.parametrize('min_mapq', [0, 20])
+def test_depth_matches_samtools_depth(synthetic_bam, min_mapq):
+    with open_alignment_file(synthetic_bam) as alignment_file:
+        positions, depths = compute_depth(alignment_file, start=START,
+                                          end=END, min_mapq=min_mapq)
+    output = pysam.depth('-a', '-Q', str(min_mapq), '-r',
+                         f'{CHROM}:{START}-{END}', synthetic_bam)
+    samtools_depths = dict()
+    for line in output.splitlines():
+        chrom, position, depth = line.split('\t')
+        samtools_depths[int(position)] = int(depth)
+    assert positions.tolist() == list(range(START, END + 1))
+    differing = [position for position, depth in
+                 zip(positions.tolist(), depths.tolist())
+                 if samtools_depths.get(position) != depth]
+    assert differing == []
+    # the reads cover the region, so zero depth alone cannot pass
+    assert depths.mean() > 10
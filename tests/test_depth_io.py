@@ -0,0 +1,110 @@
+import gzip
+import io
+
+import numpy
+import pytest
+
+from depth_io import (iter_depth_array_blocks, iter_depth_blocks,
+                      iter_wide_depth_blocks, lines_parsed, load_depth_array,
+                      load_depth_arrays, map_samples)
+
+
+def split_depth_arrays(text):
+    """
+    Parses depth file text line by line, as the scripts did before the
+    vectorized parser
+    """
+    positions = list()
+    depths = list()
+    for line in text.splitlines():
+        fields = line.split()
+        positions.append(int(fields[1]))
+        depths.append(int(fields[2]))
+    return positions, depths
+
+
+def random_depth_text(rng):
+    """
+    Depth file text with random field lengths, line endings, separators
+    and final newline
+    """
+    n_lines = int(rng.integers(0, 40))
+    positions = rng.integers(0, 10 ** rng.integers(1, 10), n_lines)
+    depths = rng.integers(0, 10 ** rng.integers(1, 10), n_lines)
+    line_end = rng.choice(['\n', '\r\n'])
+    separator = rng.choice(['\t', '\t', ' '])
+    lines = [f'chr{rng.integers(1, 23)}{separator}{position}\t{depth}'
+             for position, depth in zip(positions, depths)]
+    text = line_end.join(lines)
+    if lines and rng.random() < 0.7:
+        text += line_end
+        if rng.random() < 0.2:
+            # a last line with the other line ending
+            text += 'chr9\t1\t2\n' if line_end == '\r\n' else \
+                'chr9\t1\t2\r\n'
+    return text
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_parser_matches_split(seed):
+    text = random_depth_text(numpy.random.default_rng(seed))
+    positions, depths = split_depth_arrays(text)
+    parsed_positions, parsed_depths = load_depth_arrays(io.StringIO(text))
+    assert parsed_positions.tolist() == positions
+    assert parsed_depths.tolist() == depths
+    assert load_depth_array(io.BytesIO(text.encode())).tolist() == depths
+    # blocks split lines at arbitrary bytes
+    blocks = list(iter_depth_array_blocks(io.BytesIO(text.encode()), 7))
+    assert [p for block, _ in blocks for p in block.tolist()] == positions
+    assert [d for _, block in blocks for d in block.tolist()] == depths
+    blocks = iter_depth_blocks(io.BytesIO(text.encode()), 5)
+    assert [d for block in blocks for d in block.tolist()] == depths
+
+
+def test_gzip_file_matches_plain_file(tmp_path):
+    text = random_depth_text(numpy.random.default_rng(1))
+    plain = tmp_path / 'HG1.txt'
+    plain.write_text(text)
+    gzipped = tmp_path / 'HG1.txt.gz'
+    with gzip.open(gzipped, 'wt') as fh:
+        fh.write(text)
+    for expected, parsed in zip(load_depth_arrays(str(plain)),
+                                load_depth_arrays(str(gzipped))):
+        assert parsed.tolist() == expected.tolist()
+
+
+def test_wide_blocks_match_split():
+    rng = numpy.random.default_rng(2)
+    rows = rng.integers(0, 1000, (50, 4))
+    text = '#CHROM\tPOS\tA.cram\tB.cram\tC.cram\r\n' + ''.join(
+        f'chr9\t{row[0]}\t{row[1]}\t{row[2]}\t{row[3]}\r\n' for row in rows)
+    blocks = list(iter_wide_depth_blocks(io.BytesIO(text.encode()), 64))
+    positions = numpy.concatenate([block[0] for block in blocks])
+    depths = numpy.vstack([block[1] for block in blocks])
+    assert positions.tolist() == rows[:, 0].tolist()
+    assert depths.tolist() == rows[:, 1:].tolist()
+
+
+def test_irregular_line_falls_back_to_text_parser():
+    text = 'chr9\t10\t3\nchr9\t11\t4\textra\n'
+    positions, depths = load_depth_arrays(io.StringIO(text))
+    assert positions.tolist() == [10, 11]
+    assert depths.tolist() == [3, 4]
+
+
+def test_lines_parsed_counts_blocks_and_wide_headers():
+    text = 'chr9\t1\t2\r\nchr9\t2\t3\r\nchr9\t3\t4'
+    start = lines_parsed()
+    list(iter_depth_array_blocks(io.StringIO(text), 7))
+    assert lines_parsed() - start == 3
+    start = lines_parsed()
+    list(iter_wide_depth_blocks(io.StringIO(f'#CHROM\tPOS\tA\n{text}'), 5))
+    assert lines_parsed() - start == 4
+
+
+def test_lines_parsed_counts_worker_processes(write_depth_file):
+    paths = [write_depth_file(f'HG{i}.txt', range(10 * i)) for i in (1, 2, 3)]
+    start = lines_parsed()
+    lengths = map_samples(load_depth_array, paths, jobs=2)
+    assert [len(depths) for depths in lengths] == [10, 20, 30]
+    assert lines_parsed() - start == 60
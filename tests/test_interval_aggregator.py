@@ -0,0 +1,96 @@
+import io
+
+import numpy
+import pytest
+
+from depth_io import IntervalAggregator, aggregate_depth_file, \
+    average_per_interval
+
+
+def split_interval_averages(depth_list, size=100):
+    """
+    Averages depth per interval as the scripts did before IntervalAggregator,
+    splitting the full depth list into size element lists
+    """
+    depth_intervals_list = list()
+    for i in range(0, len(depth_list), size):
+        depth_intervals_list.append(depth_list[i:i + size])
+    return [round(sum(interval) / len(interval))
+            for interval in depth_intervals_list]
+
+
+def split_window_average(depth_list, start, end):
+    """
+    Averages a baseline slice of the full depth list as the scripts did
+    """
+    window = depth_list[start:end]
+    return sum(window) / len(window)
+
+
+def random_blocks(rng, depths):
+    """
+    Splits depths into consecutive blocks of random sizes, including empty
+    blocks
+    """
+    cuts = numpy.sort(rng.integers(0, len(depths) + 1, rng.integers(0, 8)))
+    return numpy.split(depths, cuts)
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_blocks_match_split_averages(seed):
+    rng = numpy.random.default_rng(seed)
+    n_bases = int(rng.integers(1, 1000))
+    depths = rng.integers(0, 60, n_bases).astype(numpy.uint32)
+    windows = [(int(start), int(start + rng.integers(1, 300)))
+               for start in rng.integers(0, n_bases, 3)]
+    aggregator = IntervalAggregator(100, windows)
+    for block in random_blocks(rng, depths):
+        aggregator.update(block)
+    depth_list = depths.tolist()
+    assert aggregator.interval_averages() == \
+        split_interval_averages(depth_list)
+    assert average_per_interval(depths) == split_interval_averages(depth_list)
+    for i, (start, end) in enumerate(windows):
+        assert aggregator.window_average(i) == \
+            pytest.approx(split_window_average(depth_list, start, end))
+
+
+def test_wide_blocks_match_each_sample_column():
+    rng = numpy.random.default_rng(7)
+    depths = rng.integers(0, 60, (450, 3)).astype(numpy.uint32)
+    aggregator = IntervalAggregator(100, [(120, 380)])
+    for block in random_blocks(rng, depths):
+        aggregator.update(block)
+    columns = depths.T.tolist()
+    assert aggregator.interval_averages() == \
+        [split_interval_averages(column) for column in columns]
+    assert aggregator.window_average() == \
+        pytest.approx([split_window_average(column, 120, 380)
+                       for column in columns])
+
+
+def test_half_averages_round_to_even_like_round():
+    depths = [0] * 50 + [1] * 50 + [1] * 50 + [2] * 50 + [5, 6]
+    aggregator = IntervalAggregator(100)
+    aggregator.update(numpy.array(depths, dtype=numpy.uint32))
+    assert aggregator.interval_averages() == [0, 2, 6]
+    assert aggregator.interval_averages() == split_interval_averages(depths)
+
+
+def test_depth_file_matches_split_averages():
+    rng = numpy.random.default_rng(3)
+    depths = rng.integers(0, 60, 2345)
+    text = ''.join(f'chr9\t{133255176 + i}\t{depth}\n'
+                   for i, depth in enumerate(depths))
+    aggregator = aggregate_depth_file(io.StringIO(text), 100, [(100, 1100)])
+    assert aggregator.interval_averages() == \
+        split_interval_averages(depths.tolist())
+    assert aggregator.window_average() == \
+        pytest.approx(split_window_average(depths.tolist(), 100, 1100))
+
+
+def test_window_without_bases_raises():
+    aggregator = IntervalAggregator(100, [(500, 600)])
+    aggregator.update(numpy.arange(100, dtype=numpy.uint32))
+    with pytest.raises(ZeroDivisionError):
+        aggregator.window_average()
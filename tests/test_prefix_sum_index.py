@@ -0,0 +1,68 @@
+import numpy
+import pytest
+
+from depth_io import PrefixSumIndex, average_per_interval, \
+    load_cached_prefix_index
+
+
+def split_interval_averages(depth_list, size=100, step=None):
+    """
+    Averages depth per interval as the scripts did before the index,
+    slicing the full depth list
+    """
+    return [round(sum(depth_list[i:i + size]) /
+                  len(depth_list[i:i + size]))
+            for i in range(0, len(depth_list), step or size)]
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_windows_match_list_slices(seed):
+    rng = numpy.random.default_rng(seed)
+    depths = rng.integers(0, 60, int(rng.integers(1, 700)))
+    depth_list = depths.tolist()
+    index = PrefixSumIndex.from_depths(depths.astype(numpy.uint32))
+    assert len(index) == len(depth_list)
+    # windows may start before, end after or be empty like list slices
+    for start, end in rng.integers(-100, len(depth_list) + 100, (20, 2)):
+        window = depth_list[start:end]
+        assert index.window_sum(start, end) == sum(window)
+        if window:
+            assert index.window_average(start, end) == \
+                pytest.approx(sum(window) / len(window))
+        else:
+            with pytest.raises(ZeroDivisionError):
+                index.window_average(start, end)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_interval_averages_match_split_averages(seed):
+    rng = numpy.random.default_rng(seed)
+    depths = rng.integers(0, 60, int(rng.integers(1, 1500)))
+    depth_list = depths.tolist()
+    index = PrefixSumIndex.from_depths(depths)
+    for size in (1, 100, 250):
+        assert index.interval_averages(size) == \
+            split_interval_averages(depth_list, size)
+        assert index.interval_averages(size) == \
+            average_per_interval(depths, size)
+    assert index.interval_averages(100, 25) == \
+        split_interval_averages(depth_list, 100, 25)
+
+
+def test_window_averages_of_many_windows():
+    depths = numpy.arange(10)
+    index = PrefixSumIndex.from_depths(depths)
+    averages = index.window_averages(numpy.array([0, 2, 8, 5]),
+                                     numpy.array([10, 4, 20, 5]))
+    assert averages[:3].tolist() == [4.5, 2.5, 8.5]
+    assert numpy.isnan(averages[3])
+
+
+def test_cached_index_matches_built_index(write_depth_file, tmp_path):
+    depths = list(range(0, 300, 7))
+    path = write_depth_file('HG1.txt', depths)
+    cache_dir = str(tmp_path / 'cache')
+    built = PrefixSumIndex.from_depths(numpy.array(depths))
+    for _ in range(2):
+        cached = load_cached_prefix_index(path, cache_dir)
+        assert cached.prefix_sums.tolist() == built.prefix_sums.tolist()
@@ -0,0 +1,91 @@
+import io
+import random
+
+import pytest
+
+from revcomp_engine import (decode_columns, encode_columns,
+                            reverse_complement_alleles,
+                            reverse_complement_seq,
+                            reverse_complement_variant,
+                            transform_lines_parallel)
+
+Seq = pytest.importorskip('Bio.Seq').Seq
+
+# IUPAC codes in both cases, U, and symbols of missing or symbolic alleles
+ALPHABET = 'ACGTUMRWSYKVHDBXNacgtumrwsykvhdbxn.*-<>'
+
+
+def bio_reverse_complement_variant(variant, strip_quotes=False):
+    """
+    Reverse complements a variant with Bio.Seq as the scripts did before
+    revcomp_engine
+    """
+    variant = variant.strip()
+    if '/' in variant:
+        indel = variant.split('/')
+        seq1, seq2 = indel[0], indel[1]
+        if strip_quotes:
+            seq1, seq2 = seq1.strip('"'), seq2.strip('"')
+        return '/'.join((str(Seq(seq1).reverse_complement()),
+                         str(Seq(seq2).reverse_complement())))
+    return str(Seq(variant).reverse_complement())
+
+
+def random_seq(rng, max_length=8):
+    return ''.join(rng.choice(ALPHABET)
+                   for _ in range(rng.randrange(max_length + 1)))
+
+
+def test_every_character_matches_bio_seq():
+    for char in ALPHABET:
+        assert reverse_complement_seq(char) == \
+            str(Seq(char).reverse_complement())
+    assert reverse_complement_seq(ALPHABET) == \
+        str(Seq(ALPHABET).reverse_complement())
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_variants_match_bio_seq(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        variant = random_seq(rng)
+        if rng.random() < 0.6:
+            separator = '/' if rng.random() < 0.8 else '//'
+            variant = f'{variant}{separator}{random_seq(rng)}'
+        if rng.random() < 0.3:
+            variant += '\n'
+        assert reverse_complement_variant(variant) == \
+            bio_reverse_complement_variant(variant)
+        quoted = '/'.join(f'"{allele}"' for allele in variant.split('/'))
+        assert reverse_complement_variant(quoted, strip_quotes=True) == \
+            bio_reverse_complement_variant(quoted, strip_quotes=True)
+
+
+def test_column_codes_match_bio_seq():
+    rows = [['A/G', 'AT/A\n'], ['G/G', 'AT/A\n'], ['A/G', 'n/N\n']]
+    codes, alleles = encode_columns(rows)
+    assert codes == [[0, 0], [1, 0], [0, 1]]
+    decoded = decode_columns(codes, reverse_complement_alleles(alleles))
+    assert decoded == [[bio_reverse_complement_variant(variant)
+                        for variant in row] for row in rows]
+
+
+def _reverse_complement_line(line):
+    return '\t'.join(reverse_complement_variant(variant)
+                     for variant in line.split('\t')) + '\n'
+
+
+def test_parallel_chunks_match_serial_lines(tmp_path):
+    rng = random.Random(0)
+    path = tmp_path / 'query.txt'
+    path.write_text(''.join(
+        '\t'.join(f'{random_seq(rng)}/{random_seq(rng)}' for _ in range(4))
+        + '\n' for _ in range(500)))
+    outfile = io.StringIO()
+    n_lines = transform_lines_parallel(str(path), outfile,
+                                       _reverse_complement_line, 2,
+                                       chunk_bytes=512)
+    with open(path) as fh:
+        expected = ''.join(_reverse_complement_line(line) for line in fh)
+    assert n_lines == 500
+    assert outfile.getvalue() == expected
@@ -0,0 +1,34 @@
+import json
+
+from run_metrics import RunMetrics
+
+
+def test_stage_reports_counted_lines_without_reading_files(tmp_path):
+    depth_file = tmp_path / 'HG1.txt'
+    depth_file.write_text('chr9\t1\t2\n' * 5)
+    report = tmp_path / 'metrics.json'
+    counted = [0]
+    metrics = RunMetrics('test', str(report),
+                         line_counter=lambda: counted[0])
+    with metrics.stage('read') as stage:
+        # the counter, not the file content, gives the lines read
+        counted[0] += 3
+        stage['files'] = [str(depth_file)]
+        stage['samples'] = 1
+    with metrics.stage('write') as stage:
+        stage['samples'] = 1
+    metrics.finish()
+    read, write = json.loads(report.read_text())['stages']
+    assert read['lines_read'] == 3
+    assert read['bytes_read'] == depth_file.stat().st_size
+    assert 'lines_read' not in write
+    assert read['peak_rss_growth_mb'] >= 0
+
+
+def test_stage_lines_read_overrides_counter(tmp_path):
+    report = tmp_path / 'metrics.json'
+    metrics = RunMetrics('test', str(report), line_counter=lambda: 0)
+    with metrics.stage('stream') as stage:
+        stage['lines_read'] = 7
+    metrics.finish()
+    assert json.loads(report.read_text())['stages'][0]['lines_read'] == 7
@@ -0,0 +1,19 @@
+import pandas
+import pytest
+
+from transpose_table import read_typed_table, write_typed_transpose
+
+
+@pytest.mark.parametrize('lines', [
+    ['Sample\tchr9:1\tchr9:2', 'HG1\t10\t0', 'HG2\t7\t31'],
+    ['Sample\ta\tb\tc', 'HG1\t1\t0.5\t', 'HG2\t2\t1.5\t3'],
+])
+def test_float64_fast_path_matches_default(tmp_path, lines):
+    infile = tmp_path / 'table.txt'
+    infile.write_text('\n'.join(lines) + '\n')
+    pandas.read_csv(infile, sep='\t').T.to_csv(
+        tmp_path / 'default.txt', header=False, sep='\t')
+    write_typed_transpose(read_typed_table(str(infile), 'float64'),
+                          str(tmp_path / 'fast.txt'))
+    assert (tmp_path / 'fast.txt').read_text() == \
+        (tmp_path / 'default.txt').read_text()
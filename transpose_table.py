@@ -5,7 +5,32 @@
 Transposes a tab delimited text file with pandas and writes the new
 file to the working directory.
 
-usage: transpose_table.py [-h] [-i INFILE] [-o OUTFILE]
+With --max-memory the file is transposed out of core: blocks of rows are
+read and transposed one at a time, each transposed block is written to a
+temporary file, and the blocks are stitched together line by line. Column
+types are determined in a first pass over the file, so the output is
+identical to the in-memory transpose.
+
+With --fast a numeric table is read with typed value columns (float32 by
+default) instead of inferring a dtype per column, using the multithreaded
+pyarrow parser when pyarrow is installed. With -d float64 values are
+written as in the default output: columns of whole numbers without missing
+values as integers (2), which pandas reads as integer columns, and other
+columns as floats (2.0, 0.1). Unlike the default output, whole number
+columns written with a decimal point in the input (2.0) are written as
+integers too. Other float dtypes are written with the significant digits of
+the dtype and without a trailing .0 (2, 0.1), and integer dtypes as
+integers. --fast transposes in memory and cannot be combined with
+--max-memory.
+
+--samples and --columns select rows by their first column value and
+columns by their header name before reading: unselected columns are never
+parsed and unselected rows are skipped by the parser. Selected rows and
+columns keep their order in the input file.
+
+usage: transpose_table.py [-h] [-i INFILE] [-o OUTFILE] [-m MAX_MEMORY]
+                          [-t TMP_DIR] [-f] [-d DTYPE] [-S SAMPLES]
+                          [-C COLUMNS]
 
 Opens tab delimited text file as pandas data frame, transposes dataframe,
 and writes new text file to the working directory
@@ -16,27 +41,266 @@ optional arguments:
                         path to input file
   -o OUTFILE, --outfile OUTFILE
                         name of output file
+  -m MAX_MEMORY, --max-memory MAX_MEMORY
+                        transpose in row blocks using about this many MB of
+                        memory
+  -t TMP_DIR, --tmp-dir TMP_DIR
+                        directory for temporary block files
+  -f, --fast            read value columns with a fixed numeric dtype
+  -d DTYPE, --dtype DTYPE
+                        numeric dtype of value columns with --fast, float64
+                        keeps the number format of the default output
+  -S SAMPLES, --samples SAMPLES
+                        file of first column values (one per line) or comma
+                        separated list of rows to keep
+  -C COLUMNS, --columns COLUMNS
+                        file of column names (one per line) or comma
+                        separated list of columns to keep
 
 """
 
 import argparse
+import os
+import tempfile
+from contextlib import ExitStack
+
+import numpy
 import pandas
 
+# estimated bytes of memory per parsed table cell, including object overhead
+BYTES_PER_CELL = 64
+# maximum number of block files stitched at once
+MAX_OPEN_FILES = 256
+
+try:
+    import pyarrow  # noqa: F401
+    # multithreaded parser for the typed fast path
+    FAST_ENGINE = 'pyarrow'
+except ImportError:
+    FAST_ENGINE = 'c'
+
 
 def main():
     # get command line arguments
     args = get_cli_args()
     infile = args.infile
     outfile = args.outfile
+    # restrict reading to selected rows and columns
+    read_options = select_rows_and_columns(
+        infile, read_names(args.samples), read_names(args.columns))
 
+    if args.fast:
+        # read value columns with a fixed dtype
+        df = read_typed_table(infile, args.dtype, read_options)
+        write_typed_transpose(df, outfile)
+        return
+    if args.max_memory:
+        # transpose in memory bounded row blocks
+        transpose_chunked(infile, outfile, args.max_memory * 2 ** 20,
+                          args.tmp_dir, read_options)
+        return
     # read tab delimited file as pandas dataframe
-    df = pandas.read_csv(infile, sep='\t')
+    df = pandas.read_csv(infile, sep='\t', **read_options)
     # transpose dataframe
     df_t = df.T
     # write transposed dataframe to new file
     df_t.to_csv(outfile, header=False, sep='\t')
 
 
+def read_names(names):
+    """
+    Reads a selection of row or column names
+    :param names: str, path to file with one name per line, or comma
+    separated names, or None
+    :return: list of names, or None if nothing is selected
+    """
+    if not names:
+        return None
+    if os.path.isfile(names):
+        with open(names, 'r') as fh:
+            return [line.strip() for line in fh if line.strip()]
+    return [name.strip() for name in names.split(',') if name.strip()]
+
+
+def select_rows_and_columns(infile, samples=None, columns=None):
+    """
+    Builds pandas.read_csv options that skip unselected rows and columns
+    while parsing. Rows are selected by the value of their first column,
+    found with a scan of the first field of each line.
+    :param infile: str, path to input file
+    :param samples: list of first column values of rows to keep, or None
+    :param columns: list of column names to keep, or None
+    :return: read_options, dictionary of read_csv keyword arguments
+    """
+    read_options = dict()
+    with open(infile, 'r') as fh:
+        header = fh.readline().rstrip('\r\n').split('\t')
+        if samples is not None:
+            samples = set(samples)
+            # line 0 is the header, data lines start at 1
+            read_options['skiprows'] = {
+                line_number for line_number, line in enumerate(fh, 1)
+                if line.split('\t', 1)[0].rstrip('\r\n') not in samples}
+    if columns is not None:
+        missing = set(columns) - set(header)
+        if missing:
+            raise ValueError(f'columns not in {infile}: '
+                             f'{", ".join(sorted(missing))}')
+        # always keep the first column holding the row names
+        columns = set(columns)
+        read_options['usecols'] = [header[0]] + [
+            name for name in header[1:] if name in columns]
+    return read_options
+
+
+def read_typed_table(infile, dtype='float32', read_options=None):
+    """
+    Reads a table of row names followed by numeric value columns without
+    per column type inference
+    :param infile: str, path to input file
+    :param dtype: str, numpy dtype of value columns
+    :param read_options: dictionary of extra read_csv keyword arguments
+    :return: pandas DataFrame of values indexed by the first column
+    """
+    read_options = dict(read_options or {})
+    with open(infile, 'r') as fh:
+        header = fh.readline().rstrip('\r\n').split('\t')
+    names = read_options.get('usecols', header)
+    dtypes = {name: dtype for name in names[1:]}
+    dtypes[header[0]] = str
+    engine = FAST_ENGINE
+    if 'skiprows' in read_options:
+        # the pyarrow parser cannot skip a set of rows
+        engine = 'c'
+    return pandas.read_csv(infile, sep='\t', dtype=dtypes, engine=engine,
+                           index_col=0, **read_options)
+
+
+def write_typed_transpose(df, outfile):
+    """
+    Writes the transpose of a typed table in the layout of the default
+    transpose, with the row names as first line. float64 columns of whole
+    numbers without missing values are written as integers, and other
+    float64 columns as in the default output, with a trailing .0 on whole
+    numbers. Other floats are written with the significant digits of their
+    dtype and without a trailing .0. Missing values are written empty.
+    :param df: pandas DataFrame of values indexed by row names
+    :param outfile: str, name of output file
+    :return: None
+    """
+    values = df.to_numpy()
+    if values.dtype == numpy.float64:
+        # shortest round trip repr, as written by pandas to_csv
+        value_format = '%r'
+    elif values.dtype.kind == 'f':
+        value_format = f'%.{numpy.finfo(values.dtype).precision + 1}g'
+    else:
+        value_format = '%d'
+    with open(outfile, 'w', newline='') as fh:
+        header_line = [str(df.index.name)] + df.index.astype(str).tolist()
+        fh.write('\t'.join(header_line) + os.linesep)
+        # each column of the table becomes one line
+        for name, column in zip(df.columns, values.T):
+            column_format = value_format
+            if value_format == '%r' and numpy.isfinite(column).all() and \
+                    (column == numpy.round(column)).all():
+                # pandas reads such columns as integers in the default path
+                column_format = '%d'
+            column = [column_format % value if value == value else ''
+                      for value in column.tolist()]
+            fh.write('\t'.join([str(name)] + column) + os.linesep)
+
+
+def transpose_chunked(infile, outfile, max_memory, tmp_dir=None,
+                      read_options=None):
+    """
+    Transposes a tab delimited text file in blocks of rows, holding one
+    block in memory at a time
+    :param infile: str, path to input file
+    :param outfile: str, name of output file
+    :param max_memory: int, approximate bytes of memory per row block
+    :param tmp_dir: str, optional directory for temporary block files
+    :param read_options: dictionary of extra read_csv keyword arguments
+    :return: None
+    """
+    read_options = read_options or dict()
+    with open(infile, 'r') as fh:
+        n_columns = fh.readline().count('\t') + 1
+    n_columns = len(read_options.get('usecols', range(n_columns)))
+    chunk_rows = max(1, max_memory // (n_columns * BYTES_PER_CELL))
+    dtypes = infer_column_dtypes(infile, chunk_rows, read_options)
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as block_dir:
+        block_paths = list()
+        reader = pandas.read_csv(infile, sep='\t', dtype=dtypes,
+                                 chunksize=chunk_rows, **read_options)
+        for block_number, df in enumerate(reader):
+            # write transposed block, row names are dropped when stitching
+            block_path = os.path.join(block_dir, f'{block_number}.txt')
+            df.T.to_csv(block_path, header=False, sep='\t',
+                        lineterminator='\n')
+            block_paths.append(block_path)
+        stitch_blocks(block_paths, outfile)
+
+
+def infer_column_dtypes(infile, chunk_rows, read_options=None):
+    """
+    Determines the dtype pandas gives each column when reading the whole
+    file, from the dtypes of the columns in each block of rows
+    :param infile: str, path to input file
+    :param chunk_rows: int, number of rows read per block
+    :param read_options: dictionary of extra read_csv keyword arguments
+    :return: dtypes, dictionary of column names and dtypes
+    """
+    kinds = dict()
+    for df in pandas.read_csv(infile, sep='\t', chunksize=chunk_rows,
+                              **(read_options or {})):
+        for column, dtype in df.dtypes.items():
+            kinds.setdefault(column, set()).add(dtype.kind)
+    dtypes = dict()
+    for column, column_kinds in kinds.items():
+        if column_kinds == {'b'}:
+            dtypes[column] = bool
+        elif column_kinds == {'i'}:
+            dtypes[column] = 'int64'
+        elif column_kinds <= {'i', 'f'}:
+            dtypes[column] = 'float64'
+        else:
+            # mixed columns are read as the original strings
+            dtypes[column] = str
+    return dtypes
+
+
+def stitch_blocks(block_paths, outfile):
+    """
+    Joins the lines of transposed blocks side by side into the output file,
+    merging groups of blocks first if there are too many to open at once
+    :param block_paths: list of paths to transposed block files in order
+    :param outfile: str, name of output file
+    :return: None
+    """
+    while len(block_paths) > MAX_OPEN_FILES:
+        merged_paths = list()
+        for first in range(0, len(block_paths), MAX_OPEN_FILES):
+            merged_path = f'{block_paths[first]}.merged'
+            _join_lines(block_paths[first:first + MAX_OPEN_FILES],
+                        merged_path, '\n')
+            merged_paths.append(merged_path)
+        block_paths = merged_paths
+    _join_lines(block_paths, outfile, os.linesep)
+
+
+def _join_lines(paths, out_path, line_end):
+    with ExitStack() as stack, open(out_path, 'w', newline='') as out:
+        handles = [stack.enter_context(open(path, 'r', newline='\n'))
+                   for path in paths]
+        for lines in zip(*handles):
+            # keep the row name of the first block only
+            values = [line.rstrip('\n').split('\t', 1)[1]
+                      for line in lines[1:]]
+            out.write('\t'.join([lines[0].rstrip('\n')] + values) +
+                      line_end)
+
+
 def get_cli_args():
     """
     Get command line options with argparse
@@ -50,7 +314,33 @@ def get_cli_args():
                         help='path to input file')
     parser.add_argument('-o', '--outfile', dest='outfile', type=str,
                         help='name of output file')
-    return parser.parse_args()
+    parser.add_argument('-m', '--max-memory', dest='max_memory', type=int,
+                        default=None,
+                        help='transpose in row blocks using about this many '
+                             'MB of memory')
+    parser.add_argument('-t', '--tmp-dir', dest='tmp_dir', type=str,
+                        default=None,
+                        help='directory for temporary block files')
+    parser.add_argument('-f', '--fast', dest='fast', action='store_true',
+                        help='read value columns with a fixed numeric dtype')
+    parser.add_argument('-d', '--dtype', dest='dtype', type=str,
+                        default='float32',
+                        help='numeric dtype of value columns with --fast, '
+                             'float64 keeps the number format of the default '
+                             'output')
+    parser.add_argument('-S', '--samples', dest='samples', type=str,
+                        default=None,
+                        help='file of first column values (one per line) or '
+                             'comma separated list of rows to keep')
+    parser.add_argument('-C', '--columns', dest='columns', type=str,
+                        default=None,
+                        help='file of column names (one per line) or comma '
+                             'separated list of columns to keep')
+    args = parser.parse_args()
+    if args.fast and args.max_memory:
+        parser.error('-f/--fast transposes in memory and cannot be combined '
+                     'with -m/--max-memory')
+    return args
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+# wide_depth.py
+
+"""
+Reads a multi-sample samtools depth file, one row per position and one depth
+column per sample, and calculates average depth per 100 bases, copy number
+per 100 base interval and copy number per gene region for every sample in a
+single streaming pass. The depth file may be gzip or bgzip compressed, and
+outfiles named *.gz are written gzip compressed, and outfiles named *.npz,
+*.parquet or *.feather as float32 binary tables.
+
+samtools depth -a -H -r chr9:133255176-133385146 [*.cram] -o [wide.txt]
+
+usage: wide_depth.py [-h] -w WIDE_FILE [-S SAMPLES] [-s START] [-i INTERVAL]
+                     [-r REGIONS] [-c COVERAGE_OUT] [-n COPY_NUMBER_OUT]
+                     [-g REGION_OUT]
+
+Calculate ABO depth of coverage and copy number from a multi-sample depth
+file
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -w WIDE_FILE, --wide-file WIDE_FILE
+                        multi-sample samtools depth file
+  -S SAMPLES, --samples SAMPLES
+                        text file of sample names in column order, defaults
+                        to the file names in the depth file header
+  -s START, --start START
+                        start position for copy number baseline interval
+  -i INTERVAL, --interval INTERVAL
+                        length of copy number baseline interval
+  -r REGIONS, --regions REGIONS
+                        BED file of gene regions, including a Baseline region
+  -c COVERAGE_OUT, --coverage-out COVERAGE_OUT
+                        name of average depth per 100 bases outfile
+  -n COPY_NUMBER_OUT, --copy-number-out COPY_NUMBER_OUT
+                        name of copy number per 100 bases outfile
+  -g REGION_OUT, --region-out REGION_OUT
+                        name of copy number per gene region outfile
+
+"""
+
+import argparse
+import os
+
+import copy_number_per_region
+from depth_io import (iter_wide_depth_blocks, open_depth_file,
+                      read_wide_depth_header)
+from depth_matrix import WINDOW_START
+from depth_pipeline import DepthAggregator, create_result_dicts, write_outputs
+
+
+def main():
+    args = get_cli_args()
+    # convert start position to list index
+    start = abs(WINDOW_START - args.start)
+    region_index = copy_number_per_region.load_regions(args.regions)
+    sample_list = get_sample_list(args.wide_file, args.samples)
+    sample_list, depth_dict, depth_1000_dict, cn_depth_dict, \
+        sample_cn_dict = process_wide_file(
+            args.wide_file, sample_list, start, args.interval, region_index)
+    write_outputs(args.coverage_out, args.copy_number_out, args.region_out,
+                  sample_list, depth_dict, depth_1000_dict, cn_depth_dict,
+                  sample_cn_dict, region_index)
+
+
+def get_sample_list(wide_file, samples_file=None):
+    """
+    Determines sample names of the depth columns of a wide depth file
+    :param wide_file: str, path to multi-sample depth file
+    :param samples_file: str, optional text file of sample names
+    :return: sample_list, list of sample names in column order
+    """
+    if samples_file:
+        with open(samples_file, 'r') as fh:
+            return [line.strip() for line in fh if line.strip()]
+    column_names = read_wide_depth_header(wide_file)
+    if column_names is None:
+        raise ValueError(f'{wide_file} has no header line, give sample '
+                         f'names with --samples')
+    # sample names are the file name prefix before the first dot
+    return [os.path.basename(name).split('.')[0] for name in column_names]
+
+
+def process_wide_file(wide_file, sample_list, start, interval, region_index):
+    """
+    Streams a wide depth file once, accumulating 100 base interval, baseline
+    and gene region sums for all sample columns together.
+    :param wide_file: str, path to multi-sample depth file
+    :param sample_list: list of sample names in column order
+    :param start: int, starting index of baseline interval
+    :param interval: int, length of interval
+    :param region_index: RegionIndex of gene regions
+    :return: sample_list, list of sample names
+    :return: depth_dict, dictionary of sample keys with list of depth per 100
+    base interval values
+    :return: depth_1000_dict, dictionary of sample keys with baseline depths
+    :return: cn_depth_dict, dictionary of sample keys with list of depth per
+    100 base interval values of samples with a baseline depth
+    :return: sample_cn_dict, dictionary of sample keys with baseline depth
+    and copy number per region values
+    """
+    aggregator = DepthAggregator(start, interval, region_index,
+                                 n_samples=len(sample_list))
+    with open_depth_file(wide_file) as fh:
+        for positions, depths in iter_wide_depth_blocks(fh):
+            if depths.shape[1] != len(sample_list):
+                raise ValueError(f'{wide_file} has {depths.shape[1]} depth '
+                                 f'columns for {len(sample_list)} samples')
+            aggregator.update(positions, depths)
+    return (sample_list,) + create_result_dicts(
+        sample_list, aggregator.sample_results(), 'depth column')
+
+
+def get_cli_args():
+    """
+    Get command line options with argparse
+    :return: instance of argparse arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Calculate ABO depth of coverage and copy number from a '
+                    'multi-sample depth file')
+    parser.add_argument('-w', '--wide-file', dest='wide_file', type=str,
+                        required=True,
+                        help='multi-sample samtools depth file')
+    parser.add_argument('-S', '--samples', dest='samples', type=str,
+                        default=None,
+                        help='text file of sample names in column order, '
+                             'defaults to the file names in the depth file '
+                             'header')
+    parser.add_argument('-s', '--start', dest='start', type=int,
+                        default=133279500,
+                        help='start position for copy number baseline '
+                             'interval')
+    parser.add_argument('-i', '--interval', dest='interval', type=int,
+                        default=5000,
+                        help='length of copy number baseline interval')
+    parser.add_argument('-r', '--regions', dest='regions', type=str,
+                        default=copy_number_per_region.DEFAULT_REGIONS,
+                        help='BED file of gene regions, including a Baseline '
+                             'region')
+    parser.add_argument('-c', '--coverage-out', dest='coverage_out',
+                        type=str,
+                        default='1000G_100bp_avg_read_depth_of_coverage.txt',
+                        help='name of average depth per 100 bases outfile')
+    parser.add_argument('-n', '--copy-number-out', dest='copy_number_out',
+                        type=str, default='1000G_100bp_avg_copy_number.txt',
+                        help='name of copy number per 100 bases outfile')
+    parser.add_argument('-g', '--region-out', dest='region_out', type=str,
+                        default='copy_number_per_region.txt',
+                        help='name of copy number per gene region outfile')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()